@@ -0,0 +1,111 @@
+#!/usr/bin/python
+#
+#   Copyright 2014 Martijn Grendelman <m@rtijn.net>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Compare reading the metadata of the image files in a directory with
+exifreader against GExiv2, on a warm page cache and, when run as root, on a
+cold one. Files that exifreader can't handle are counted, not timed.
+
+Usage: bench/exif_scan.py [--cold] DIRECTORY
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import argparse
+
+my_dir = os.path.dirname(os.path.realpath(os.path.abspath(__file__)))
+sys.path.append(os.path.join(my_dir, '..', 'taggert'))
+
+from gi.repository import GExiv2
+from gi.repository import GObject
+
+import exifreader
+
+def read_gexiv2(fname):
+    """
+    Read the same metadata as exifreader.read_exif with GExiv2, like
+    imagescan.read_metadata did before exifreader
+    """
+    metadata = GExiv2.Metadata(fname)
+    camera = metadata.get_camera_model() or ''
+    dtobj = metadata.get_date_time()
+    rot = int(metadata.get_orientation())
+    if 'Exif.GPSInfo.GPSLatitude' in metadata.get_tags():
+        lon, lat, ele = [round(x, 5) for x in metadata.get_gps_info()]
+    else:
+        lat = lon = ele = ''
+    return (camera, dtobj, rot, lat, lon, ele)
+
+def drop_caches():
+    """
+    Drop the page cache, which needs root
+    """
+    os.system('sync')
+    with open('/proc/sys/vm/drop_caches', 'w') as f:
+        f.write('3\n')
+
+def run(reader, files, cold):
+    """
+    Read all files, return the elapsed time and a dict of results
+    """
+    if cold:
+        drop_caches()
+    results = {}
+    t0 = time.time()
+    for fname in files:
+        try:
+            results[fname] = reader(fname)
+        except (exifreader.ExifError, GObject.GError, IOError):
+            results[fname] = None
+    return time.time() - t0, results
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark reading image metadata')
+    parser.add_argument('directory', help='directory with image files')
+    parser.add_argument('--cold', action='store_true', help='also run on a cold page cache (needs root)')
+    args = parser.parse_args()
+
+    files = sorted(os.path.join(args.directory, f) for f in os.listdir(args.directory))
+    files = [f for f in files if os.path.isfile(f)]
+    # Files that exifreader can't handle go to GExiv2 in Taggert anyway
+    _t, fast = run(exifreader.read_exif, files, False)
+    files = [f for f in files if fast[f] is not None]
+    print('%d files, %d read by exifreader' % (len(fast), len(files)))
+    if not files:
+        return
+
+    modes = [('warm', False)]
+    if args.cold:
+        modes.insert(0, ('cold', True))
+    for mode, cold in modes:
+        for name, reader in (('GExiv2', read_gexiv2), ('exifreader', exifreader.read_exif)):
+            if not cold:
+                # Fill the page cache
+                run(reader, files, False)
+            t, _results = run(reader, files, cold)
+            print('%s %-10s %8.2f s %8.0f files/s' % (mode, name, t, len(files) / t))
+
+    _t, slow = run(read_gexiv2, files, False)
+    mismatches = [f for f in files if fast[f] != slow[f]]
+    for f in mismatches[:10]:
+        print('mismatch %s: exifreader %r, GExiv2 %r' % (f, fast[f], slow[f]))
+    print('%d mismatches' % len(mismatches))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/python
+#
+#   Copyright 2014 Martijn Grendelman <m@rtijn.net>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Compare decoding GPX timestamps with gpxtime.decode_times against the general
+iso8601.parse_date parser, on a column of timestamps one second apart.
+
+Usage: bench/timestamps.py [-n COUNT] [--fraction]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import argparse
+from datetime import datetime, timedelta
+
+my_dir = os.path.dirname(os.path.realpath(os.path.abspath(__file__)))
+sys.path.append(os.path.join(my_dir, '..', 'taggert'))
+
+import gpxtime
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark GPX timestamp decoding')
+    parser.add_argument('-n', '--count', type=int, default=1000000, help='number of timestamps')
+    parser.add_argument('--fraction', action='store_true', help='add milliseconds to the timestamps')
+    args = parser.parse_args()
+
+    fmt = '%Y-%m-%dT%H:%M:%S.123Z' if args.fraction else '%Y-%m-%dT%H:%M:%SZ'
+    start = datetime(2014, 3, 29, 12, 0, 0)
+    strings = [(start + timedelta(seconds=i)).strftime(fmt) for i in xrange(args.count)]
+
+    t0 = time.time()
+    slow = [gpxtime.decode_time(s) for s in strings]
+    t1 = time.time()
+    fast = gpxtime.decode_times(strings)
+    t2 = time.time()
+
+    assert all(abs(a - b) < 1e-6 for a, b in zip(slow, fast))
+    print('%d timestamps' % args.count)
+    print('iso8601.parse_date:   %8.2f s %10.0f/s' % (t1 - t0, args.count / (t1 - t0)))
+    print('gpxtime.decode_times: %8.2f s %10.0f/s' % (t2 - t1, args.count / (t2 - t1)))
+
+if __name__ == '__main__':
+    main()
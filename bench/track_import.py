@@ -0,0 +1,94 @@
+#!/usr/bin/python
+#
+#   Copyright 2014 Martijn Grendelman <m@rtijn.net>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Measure the time and peak memory (RSS) needed for importing many tracks,
+like a year of daily commutes: one GPX file per day, each holding a single
+track with one point per second. Every track count is measured in a fresh
+process, so the peak RSS figures do not influence each other.
+
+Usage: bench/track_import.py [-p POINTS] [NUMTRACKS ...]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import resource
+import subprocess
+from datetime import datetime, timedelta
+
+my_dir = os.path.dirname(os.path.realpath(os.path.abspath(__file__)))
+app_dir = os.path.join(my_dir, '..', 'taggert')
+data_dir = os.path.join(app_dir, 'data')
+sys.path.append(app_dir)
+
+def write_gpx(filename, start, points):
+    """
+    Write a GPX file with a single track of the given number of points
+    """
+    with open(filename, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<gpx xmlns="http://www.topografix.com/GPX/1/1" version="1.1" creator="bench">\n'
+                '<trk><name>%s</name><trkseg>\n' % start.strftime('%Y-%m-%d'))
+        for i in xrange(points):
+            f.write('<trkpt lat="%.6f" lon="%.6f"><ele>%.1f</ele><time>%s</time></trkpt>\n' % (
+                52.0 + i * 1e-5, 5.0 + i * 1e-5, 10 + (i % 50) * 0.5,
+                (start + timedelta(seconds=i)).strftime('%Y-%m-%dT%H:%M:%SZ')))
+        f.write('</trkseg></trk>\n</gpx>\n')
+
+def measure(directory):
+    """
+    Import all GPX files in a directory and print the number of tracks, the
+    elapsed time and the peak RSS of this process
+    """
+    import gpxfile
+    gpx = gpxfile.GPXfile(data_dir)
+    start = time.time()
+    for fname in sorted(os.listdir(directory)):
+        gpx.import_gpx(os.path.join(directory, fname), 'Europe/Amsterdam')
+    elapsed = time.time() - start
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    print('%6d tracks %10d points %8.2f s %8.1f MB' % (
+        len(gpx.tracks), sum(len(t) for t in gpx.tracks.values()), elapsed, rss))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark importing many GPX tracks')
+    parser.add_argument('-p', '--points', type=int, default=1800, help='points per track')
+    parser.add_argument('--measure', help=argparse.SUPPRESS)
+    parser.add_argument('numtracks', type=int, nargs='*', default=[40, 400, 4000])
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure)
+        return
+
+    for n in args.numtracks:
+        directory = tempfile.mkdtemp(prefix='taggert-bench-')
+        try:
+            day = datetime(2014, 1, 1, 7, 30)
+            for i in xrange(n):
+                write_gpx(os.path.join(directory, '%05d.gpx' % i), day + timedelta(days=i), args.points)
+            subprocess.check_call([sys.executable, __file__, '--measure', directory])
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
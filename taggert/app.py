@@ -17,6 +17,8 @@ from __future__ import print_function
 import os
 import fractions
 import time
+import multiprocessing
+from datetime import datetime, timedelta
 from math import modf
 
 import pytz
@@ -42,6 +44,16 @@ import constants
 import tdata
 import tfunctions
 import version
+import viewport
+import imagescan
+import imagecatalog
+import imagewatch
+import imagemodel
+import density
+try:
+    import tilerender
+except ImportError:     # pycairo is optional
+    tilerender = None
 
 GtkClutter.init([])
 
@@ -56,6 +68,12 @@ class App(object):
     latlon_buffer = ('', '', '')
     clicked_lat = 0.0
     clicked_lon = 0.0
+    clicked_point = None          # (Track, index) of the track point last right-clicked
+    marker_point = None           # (Track, index) of the track point the marker was put on
+    snap_distance = 10            # pixels within which the mouse snaps to track points
+    motion_position = None        # (x, y) of the mouse over the map, to look up
+    motion_timeout = None
+    motion_delay = 50             # milliseconds between track point lookups for the mouse
     default_map_id = 'osm-mapnik'
     bookmarks = {}
     bm_file = None
@@ -67,6 +85,29 @@ class App(object):
     gpx = None
     highlighted_tracks = []
     imagemarker_opacity = 128
+    track_nodes_budget = 250000   # total number of nodes in all tracklayers
+    track_nodes_minimum = 2       # nodes per track, even if that exceeds the budget
+    track_nodes_limits = {}       # the limit, zoom level and area each track was last drawn with
+    imagemarkers = {}             # filename -> (treeiter, lat, lon) of all located images
+    imagemarker_actors = {}       # filename -> ImageMarker of the images in the viewport
+    viewport = None
+    track_tiles = None            # the map source chain of the tracks overlay in tiles mode
+    track_tiles_version = None
+    heatmap = None                # the map source chain of the heatmap overlay
+    heatmap_track_grid = None     # the DensityGrid of the track points for the heatmap
+    heatmap_version = 0
+    heatmap_pending = False       # True while a heatmap update waits for the idle callback
+    progress_cancel_callback = None
+    import_cancelled = False
+    saving = False                # True while save_all is writing images
+    save_cancelled = False
+    save_workers = multiprocessing.cpu_count()  # processes that write images
+    image_scan = None             # the generator of a running image directory scan
+    image_watcher = None          # the DirectoryWatcher of the image directory
+    imagestore = None             # the ImageListModel of the images list
+    image_rows = {}               # filename -> treeiter of the images in the images list
+    pending_image_changes = ([], [])  # watcher updates that wait for a running scan
+    scan_batch_time = 0.05        # seconds an image scan may block the GUI at a time
 
     def __init__(self, data_dir, args):
         """
@@ -75,7 +116,9 @@ class App(object):
         self.data_dir = data_dir
         self.args = args
         self.data = tdata.TData()
-        self.gpx = gpxfile.GPXfile(self.data_dir)
+        self.viewport = viewport.Viewport()
+        self.gpx = gpxfile.GPXfile(self.data_dir,
+            os.path.join(os.path.expanduser('~'), '.taggert', 'trackcache'))
 
     def main(self):
         """
@@ -123,6 +166,8 @@ class App(object):
                 raise
             pass
         self.bm_file = gpxfile.Bookmarksfile(bookmarks_filename)
+        self.catalog = imagecatalog.ImageCatalog(os.path.join(
+            os.path.dirname(bookmarks_filename), 'catalog.sqlite'))
 
         # Home location
         self.home_location = self.settings.get_unpacked('home-location')
@@ -142,6 +187,9 @@ class App(object):
         self.settings.bind('track-timezone', self.data, 'tracktimezone')
         self.settings.bind('always-this-timezone', self.data, 'alwaysthistimezone')
         self.settings.bind('map-source-id', self.data, 'mapsourceid')
+        self.settings.bind('gpx-validation', self.data, 'gpxvalidation')
+        self.settings.bind('track-rendering', self.data, 'trackrendering')
+        self.settings.bind('write-mode', self.data, 'writemode')
 
         # TSettings bindings for widgets' properties
         self.settings.bind('pane-position', self.builder.get_object("paned1"), 'position')
@@ -149,6 +197,7 @@ class App(object):
         self.settings.bind('show-elevation-column', self.builder.get_object("checkmenuitem3"), 'active')
         self.settings.bind('show-map-coords', self.builder.get_object("checkmenuitem9"), 'active')
         self.settings.bind('show-image-markers', self.builder.get_object("menuitem35"), 'active')
+        self.settings.bind('show-heatmap', self.builder.get_object("checkmenuitem11"), 'active')
         self.settings.bind('image-markers-draggable', self.builder.get_object("checkmenuitem10"), 'active')
 
         if not os.path.isdir(self.data.imagedir):
@@ -181,6 +230,17 @@ class App(object):
         self.builder.get_object("adjustment3").set_value(self.data.trackwidth)
         self.builder.get_object("adjustment4").set_value(self.data.imagemarkersize)
 
+        # A progress bar with a cancel button in the statusbar, hidden
+        # until a long running operation starts
+        self.progressbar = Gtk.ProgressBar()
+        self.progressbar.set_show_text(True)
+        self.progressbar.set_no_show_all(True)
+        self.progressbutton = Gtk.Button(stock=Gtk.STOCK_CANCEL)
+        self.progressbutton.set_no_show_all(True)
+        self.progressbutton.connect("clicked", self.cancel_progress)
+        self.statusbar.pack_end(self.progressbutton, False, False, 0)
+        self.statusbar.pack_end(self.progressbar, False, False, 0)
+
     def setup_gui_signals(self):
         """
         Set up all event handlers for the Gtk.Builder GUI
@@ -220,9 +280,14 @@ class App(object):
             "menuitem31_activate": self.map_zoom_out,
             "menuitem33_activate": self.add_bookmark_dialog,
             "menuitem35_toggled": self.toggle_imagemarkers,
+            "checkmenuitem11_toggled": self.toggle_heatmap,
             "combobox1_changed": self.combobox_changed,
             "combobox2_changed": self.combobox2_changed,
-            "checkmenuitem1_toggled": self.populate_store1,
+            "checkmenuitem1_toggled": self.toggle_untagged_filter,
+            "checkmenuitem12_toggled": self.toggle_modified_filter,
+            "menuitem38_activate": self.images_show_only_camera,
+            "menuitem39_activate": self.images_show_only_day,
+            "menuitem40_activate": self.images_show_all_cameras_and_days,
             "checkmenuitem2_toggled": self.toggle_tracks,
             "checkmenuitem3_toggled": self.toggle_elevation,
             "checkmenuitem9_toggled": self.toggle_overlay,
@@ -256,8 +321,9 @@ class App(object):
         handlers = {
             "markersize": self.redraw_marker,
             "imagemarkersize": self.update_imagemarker_appearance,
-            "trackwidth": lambda *ignore: self.with_all_tracks_do(self.update_track_appearance),
+            "trackwidth": self.update_tracks_appearance,
             'mapsourceid': self.update_map,
+            'trackrendering': self.update_track_tiles,
         }
         self.data.connect_signals(handlers)
 
@@ -307,9 +373,14 @@ class App(object):
         widget.connect("button-release-event", self.handle_map_event)
         self.osm.connect("layer-relocated", self.handle_map_event)
         widget.connect("button-press-event", self.handle_map_mouseclick)
+        widget.add_events(Gdk.EventMask.POINTER_MOTION_MASK)
+        widget.connect("motion-notify-event", self.handle_map_motion)
 
-        # This signal doesn't seem to occur (at all):
-        self.osm.connect("notify::zoom", self.on_map_zoom_changed)
+        # The view's zoom property is called zoom-level, there is no "zoom"
+        self.osm.connect("notify::zoom-level", self.on_map_zoom_changed)
+        # Also catches moves that are not made with the mouse
+        self.osm.connect("notify::latitude", self.update_viewport)
+        self.osm.connect("notify::longitude", self.update_viewport)
 
         self.go_home()
 
@@ -329,8 +400,9 @@ class App(object):
         """
         Initialize the treeview displaying the list of images
         """
-        self.builder.get_object("liststore1").set_sort_column_id(constants.images.columns.filename,
-                                                                 Gtk.SortType.ASCENDING)
+        self.imagestore = imagemodel.ImageListModel()
+        if self.builder.get_object("checkmenuitem1").get_active():
+            self.imagestore.set_filter('untagged', imagemodel.is_untagged)
         renderer = Gtk.CellRendererText()
         renderer.set_property('cell-background', 'yellow')
         col0 = Gtk.TreeViewColumn("Filename", renderer,
@@ -360,6 +432,7 @@ class App(object):
         col5.set_sort_column_id(constants.images.columns.camera)
 
         tree = self.builder.get_object("treeview1")
+        tree.set_model(self.imagestore)
         tree.append_column(col0)
         tree.append_column(col1)
         tree.append_column(col5)
@@ -396,82 +469,295 @@ class App(object):
     def populate_store1(self, widget=None):
         """
         Populate a liststore with images, reading them from a filesystem
-        directory, reading EXIF information and adding a 'modified' flag
-        """
-        show_untagged_only = self.builder.get_object("checkmenuitem1").get_active()
-        self.filelist_locked = True
-        shown = 0
-        notshown = 0
-
+        directory and its subdirectories down to the 'scan-depth' setting,
+        reading EXIF information and adding a 'modified' flag.
+        The metadata is read in the background by scan_images, a scan that
+        is still running for a previous directory is cancelled. Afterwards,
+        a DirectoryWatcher keeps the list up to date.
+        """
+        self.cancel_scan()
+        if self.image_watcher:
+            self.image_watcher.stop()
+            self.image_watcher = None
+        self.pending_image_changes = ([], [])
+        # A new model is cheaper than removing all rows one by one
+        self.imagestore = imagemodel.ImageListModel(self.imagestore.sort_column,
+            self.imagestore.sort_order, self.imagestore.filters)
+        self.builder.get_object("treeview1").set_model(self.imagestore)
+        self.image_rows.clear()
+        # Clear all image markers
+        self.imagelayer.remove_all()
+        self.imagemarkers.clear()
+        self.imagemarker_actors.clear()
+        if not self.data.imagedir:
+            self.update_heatmap()
+            return
+        depth = self.settings.get_int('scan-depth')
+        exclude = self.settings.get_strv('scan-exclude')
+        dirs = []
+        files = imagecatalog.list_files(self.data.imagedir, depth, exclude, dirs)
+        self.image_watcher = imagewatch.DirectoryWatcher(self.data.imagedir,
+            dirs, depth, exclude, self.images_changed)
+        self.start_progress("Reading %d files" % len(files), self.cancel_scan)
+        images, unknown = self.catalog.lookup(self.data.imagedir, files)
+        scan = self.image_scan = self.scan_images(images, unknown)
+        GLib.idle_add(self.continue_scan, scan)
+
+    def scan_images(self, images, unknown, update=False):
+        """
+        Add images to the images list, given the result of a catalog lookup:
+        images with a valid entry in the catalog are added from there, the
+        metadata of the unknown files is read in a pool of worker processes
+        and stored in the catalog. This is a generator that adds the images
+        that are ready, for at most scan_batch_time seconds, on every
+        iteration, so the GUI stays responsive while the list fills.
+        With 'update', the files are ones the DirectoryWatcher reported.
+        """
+        store = self.imagestore
+        total = len(images) + len(unknown)
+        pool = None
         try:
-            store = self.builder.get_object("liststore1")
-            store.clear()
-            if self.data.imagedir:
-                # Clear all image markers
-                self.imagelayer.remove_all()
-                for fl in os.listdir(self.data.imagedir):
-                    fname = os.path.join(self.data.imagedir, fl)
-                    if not os.path.isdir(fname):
-                        #if os.path.splitext(fname)[1].lower() == ".jpg":
-                        data = None
-                        modf = False
-                        try:
-                            metadata = GExiv2.Metadata(fname)
-                            # Get the camera make/model
-                            try:
-                                camera = metadata.get_camera_model() or ''
-                            except AttributeError:
-                                camera = ''
-                            # Get EXIF DateTime
-                            dtobj = metadata.get_date_time()
-                            if dtobj != None:
-                                dt = dtobj.strftime("%Y-%m-%d %H:%M:%S")
-                            else:
-                                dt = ''
-                            # Get image orientation
-                            rot = metadata.get_orientation()
-
-                            # Get GPS info
+            if unknown:
+                pool = multiprocessing.Pool(multiprocessing.cpu_count())
+                results = pool.imap(imagescan.read_metadata,
+                    [os.path.join(self.data.imagedir, f[0]) for f in unknown], 16)
+            shown = 0
+            notshown = 0
+            n = 0
+            while n < total:
+                deadline = time.time() + self.scan_batch_time
+                self.filelist_locked = True
+                try:
+                    while n < total and time.time() < deadline:
+                        if n < len(images):
+                            image = images[n]
+                        else:
                             try:
-                                data = self.modified[fl]
-                                imglat = data['latitude']
-                                imglon = data['longitude']
-                                imgele = data['elevation']
-                                modf = True
-                            except KeyError:
-                                if 'Exif.GPSInfo.GPSLatitude' in metadata.get_tags():
-                                    imglon, imglat, imgele = [round(x,5) for x in metadata.get_gps_info()]
-                                else:
-                                    imglon = ''
-                                    imglat = ''
-                                    imgele = ''
-
-                            if (not show_untagged_only) or imglat == '' or imglon == '' or data:
-                                treeiter = store.append([fl, dt, rot, str(imglat), str(imglon),
-                                    modf, camera, dtobj, str(imgele)])
-                                shown += 1
-                                if imglat and imglon:
-                                    self.add_imagemarker_at(treeiter, fl, imglat, imglon)
-                                #if camera not in self.cameras:
-                                #    self.cameras[camera] = []
-                                #self.cameras[camera].append(treeiter)
-                            else:
-                                notshown += 1
-
-                        except GObject.GError:
-                            # Unsupported file format
-                            pass
-                        except IOError:
+                                image = results.next(0.01)
+                            except multiprocessing.TimeoutError:
+                                break
+                            f = unknown[n - len(images)]
+                            self.catalog.store(self.data.imagedir, f, image)
+                            if image is not None:
+                                # Use the name relative to the image directory
+                                image = (f[0],) + image[1:]
+                        n += 1
+                        if image is None:
                             # Unsupported file format
-                            pass
+                            continue
+                        if self.add_image(store, image):
+                            shown += 1
+                        else:
+                            notshown += 1
+                finally:
+                    self.filelist_locked = False
+                self.catalog.commit()
+                self.update_progress(float(n) / total,
+                    "Reading files (%d/%d)" % (n, total))
+                yield
         finally:
-            self.filelist_locked = False
+            if pool:
+                pool.terminate()
+                pool.join()
 
+        self.image_scan = None
+        self.stop_progress()
         self.raise_layers()
-        msg = "%s: %d images" % (self.data.imagedir, shown)
-        if notshown > 0:
-            msg = "%s, %d already tagged images not shown" % (msg, notshown)
+        self.update_heatmap()
+        if update:
+            msg = "%s: %d new or changed images" % (self.data.imagedir, shown + notshown)
+        else:
+            msg = "%s: %d images" % (self.data.imagedir, shown)
+            if notshown > 0:
+                msg = "%s, %d images hidden by filters" % (msg, notshown)
         self.statusbar.push(0, msg)
+        if self.pending_image_changes != ([], []):
+            self.images_changed([], [])
+
+    def add_image(self, store, image):
+        """
+        Add an image to the images list, given the result of
+        imagescan.read_metadata, and put a marker on the map for it if it
+        passes the filters of the list. Changes that are not saved yet
+        override the geotag in the file. If the image is in the list
+        already, its row is updated. Return False if the image is hidden by
+        the filters.
+        """
+        fl, camera, dtobj, rot, imglat, imglon, imgele = image
+        modf = False
+        data = self.modified.get(fl)
+        if data:
+            imglat = data['latitude']
+            imglon = data['longitude']
+            imgele = data['elevation']
+            modf = True
+        treeiter = self.image_rows.get(fl)
+        if treeiter is None:
+            treeiter = store.append(fl, dtobj, rot, imglat, imglon, imgele, camera, modf)
+            self.image_rows[fl] = treeiter
+        else:
+            store.update(treeiter, dtobj, rot, imglat, imglon, imgele, camera, modf)
+            self.remove_imagemarker(fl)
+        if not store.is_shown(treeiter):
+            return False
+        if imglat and imglon:
+            self.add_imagemarker_at(treeiter, fl, imglat, imglon)
+        return True
+
+    def remove_image(self, store, fl):
+        """
+        Remove an image from the images list, with its marker and unsaved
+        changes
+        """
+        treeiter = self.image_rows.pop(fl, None)
+        if treeiter is not None:
+            self.remove_imagemarker(fl)
+            self.modified.pop(fl, None)
+            store.remove(treeiter)
+
+    def set_image_filters(self, **filters):
+        """
+        Show only the images that pass the given filters from imagemodel,
+        keyed by name, in the images list and on the map. A filter that is
+        None is removed. Filters are applied to the images in memory, so no
+        files are read.
+        """
+        store = self.imagestore
+        for name, func in filters.iteritems():
+            store.set_filter(name, func)
+        tree = self.builder.get_object("treeview1")
+        treeselect = tree.get_selection()
+        _model, pathlist = treeselect.get_selected_rows()
+        selected = [store.get_iter(p) for p in pathlist]
+        # Refiltering is much faster without a view to tell about every row
+        tree.set_model(None)
+        store.refilter()
+        tree.set_model(store)
+        self.filelist_locked = True
+        try:
+            for treeiter in selected:
+                if store.is_shown(treeiter):
+                    treeselect.select_iter(treeiter)
+        finally:
+            self.filelist_locked = False
+        for fl, treeiter in self.image_rows.iteritems():
+            if not store.is_shown(treeiter):
+                if fl in self.imagemarkers:
+                    self.remove_imagemarker(fl)
+            elif fl not in self.imagemarkers:
+                location = store.get_location(treeiter)
+                if location:
+                    self.add_imagemarker_at(treeiter, fl, *location)
+        self.raise_layers()
+        self.update_heatmap()
+        self.statusbar.push(0, "%s: %d of %d images shown" % (
+            self.data.imagedir, len(store), len(self.image_rows)))
+
+    def toggle_untagged_filter(self, widget):
+        """
+        Show only untagged images, or all images
+        """
+        self.set_image_filters(untagged=imagemodel.is_untagged if widget.get_active() else None)
+
+    def toggle_modified_filter(self, widget):
+        """
+        Show only images with unsaved changes, or all images
+        """
+        self.set_image_filters(modified=imagemodel.is_modified if widget.get_active() else None)
+
+    def images_show_only_camera(self, widget=None):
+        """
+        Show only the images from the camera of the selected image
+        """
+        treeselect = self.builder.get_object("treeview1").get_selection()
+        model, pathlist = treeselect.get_selected_rows()
+        if not pathlist:
+            return
+        camera = model.get_value(model.get_iter(pathlist[0]), constants.images.columns.camera)
+        self.set_image_filters(camera=imagemodel.from_camera(camera))
+
+    def images_show_only_day(self, widget=None):
+        """
+        Show only the images taken on the day of the selected image
+        """
+        treeselect = self.builder.get_object("treeview1").get_selection()
+        model, pathlist = treeselect.get_selected_rows()
+        if not pathlist:
+            return
+        dtobj = model.get_value(model.get_iter(pathlist[0]), constants.images.columns.dtobject)
+        if not dtobj:
+            self.show_infobar("The selected image has no EXIF DateTime.")
+            return
+        start = datetime(dtobj.year, dtobj.month, dtobj.day)
+        self.set_image_filters(date=imagemodel.taken_between(start,
+            start + timedelta(days=1)))
+
+    def images_show_all_cameras_and_days(self, widget=None):
+        """
+        Remove the camera and day filters
+        """
+        self.set_image_filters(camera=None, date=None)
+
+    def images_changed(self, changed, removed):
+        """
+        Callback for the DirectoryWatcher, updates only the rows and markers
+        of the files that appeared, changed or disappeared. Changed files
+        that have a valid catalog entry and are listed already, like the
+        ones Taggert just saved, are left alone. The others are read by an
+        image scan. While a scan is running or images are being saved, the
+        changes wait.
+        """
+        # Newer reports of a file replace older ones
+        pending_changed, pending_removed = self.pending_image_changes
+        names = set(f[0] for f in changed) | set(removed)
+        changed = [f for f in pending_changed if f[0] not in names] + changed
+        removed = [n for n in pending_removed if n not in names] + removed
+        if self.image_scan or self.saving:
+            self.pending_image_changes = (changed, removed)
+            return
+        self.pending_image_changes = ([], [])
+        store = self.imagestore
+        for name in removed:
+            if name.endswith(os.sep):
+                # A directory
+                for fl in [fl for fl in self.image_rows if fl.startswith(name)]:
+                    self.remove_image(store, fl)
+            else:
+                self.remove_image(store, name)
+        images, unknown = self.catalog.lookup_names(self.data.imagedir, changed)
+        images = [image for image in images if image[0] not in self.image_rows]
+        if images or unknown:
+            self.start_progress("Reading %d files" % (len(images) + len(unknown)),
+                self.cancel_scan)
+            scan = self.image_scan = self.scan_images(images, unknown, True)
+            GLib.idle_add(self.continue_scan, scan)
+        elif removed:
+            self.update_heatmap()
+
+    def continue_scan(self, scan):
+        """
+        Idle callback that runs the next iteration of an image scan, until it
+        is done or another scan has replaced it
+        """
+        if scan is not self.image_scan:
+            return False
+        try:
+            next(scan)
+            return True
+        except StopIteration:
+            return False
+
+    def cancel_scan(self):
+        """
+        Stop a running image scan, keeping the images that were read so far
+        """
+        if self.image_scan:
+            scan = self.image_scan
+            self.image_scan = None
+            # Terminates the worker processes
+            scan.close()
+            self.stop_progress()
+            self.statusbar.push(0, "%s: reading images cancelled" % self.data.imagedir)
 
     def init_map_sources(self):
         """
@@ -655,6 +941,9 @@ class App(object):
         Displays a MessageDialog, offering to save any unsaved changes and
         handle the result
         """
+        if self.saving:
+            # Wait for save_all to finish
+            return False
         if self.modified:
             dialog = self.builder.get_object('messagedialog1')
             result = dialog.run()
@@ -662,7 +951,7 @@ class App(object):
             if result == Gtk.ResponseType.CANCEL:
                 return False
             elif result == Gtk.ResponseType.YES:  # Save all
-                self.save_all()
+                return self.save_all()
         return True
 
     def select_dir(self, widget):
@@ -717,13 +1006,13 @@ class App(object):
         """
         Handler for several map events that indicate that the center of the
         map has moved, changes the coordinates displayed in the map overlay
-        and updates the zoom widget
+        and updates the zoom widget and the tracks
         """
         lat = self.osm.get_center_latitude()
         lon = self.osm.get_center_longitude()
         text = tfunctions.latlon_to_text(lat,lon)
         self.clabel.set_text (text)
-        self.update_adjustment1()
+        self.on_map_zoom_changed()
 
     def handle_map_mouseclick(self, _widget, event):
         """
@@ -734,6 +1023,53 @@ class App(object):
             menu = self.builder.get_object("menu6")
             menu.popup(None, None, None, None, event.button, event.time)
             self.clicked_lat, self.clicked_lon = self.osm.y_to_latitude(event.y), self.osm.x_to_longitude(event.x)
+            # Snap to a nearby track point
+            self.clicked_point = self.find_track_point(self.clicked_lat, self.clicked_lon)
+            if self.clicked_point:
+                tobj, i = self.clicked_point
+                self.clicked_lat, self.clicked_lon = tobj.lats[i], tobj.lons[i]
+
+    def handle_map_motion(self, _widget, event):
+        """
+        Handler for mouse motion over the map, schedules a lookup of the
+        track point under the mouse, at most once every motion_delay
+        milliseconds
+        """
+        if not self.gpx.tracks:
+            return
+        self.motion_position = (event.x, event.y)
+        if self.motion_timeout is None:
+            self.motion_timeout = GLib.timeout_add(self.motion_delay, self.update_motion_point)
+
+    def update_motion_point(self):
+        """
+        Timeout callback that shows the time and elevation of the track
+        point under the mouse in the map overlay
+        """
+        self.motion_timeout = None
+        x, y = self.motion_position
+        point = self.find_track_point(self.osm.y_to_latitude(y), self.osm.x_to_longitude(x))
+        if point:
+            tobj, i = point
+            text = tfunctions.trackpoint_to_text(tobj.lats[i], tobj.lons[i],
+                tobj.get_localtime(i), tobj.eles[i] if tobj.elemask[i] else None)
+        else:
+            text = tfunctions.latlon_to_text(self.osm.get_center_latitude(),
+                                             self.osm.get_center_longitude())
+        self.clabel.set_text(text)
+        return False
+
+    def find_track_point(self, lat, lon):
+        """
+        Return a tuple of the Track object and the index of the track point
+        nearest to a location on the map, or None if there is no track point
+        within snap_distance pixels
+        """
+        if not self.gpx.tracks:
+            return None
+        mpp = self.osm.get_map_source().get_meters_per_pixel(
+            self.osm.get_zoom_level(), lat, lon)
+        return self.gpx.find_nearest_point(lat, lon, self.snap_distance * mpp)
 
     def add_marker_at(self, lat, lon, _zoom=None):
         """
@@ -749,24 +1085,55 @@ class App(object):
 
     def add_imagemarker_at(self, treeiter, filename, lat, lon):
         """
-        Place an ImageMarker on the map at the specified coordinates
+        Register the location of an image and place an ImageMarker on the map
+        at the specified coordinates, if they are within the viewport
+        """
+        lat, lon = float(lat), float(lon)
+        self.imagemarkers[filename] = (treeiter, lat, lon)
+        if self.viewport.contains_point(lat, lon):
+            self.create_imagemarker(treeiter, filename, lat, lon)
+
+    def create_imagemarker(self, treeiter, filename, lat, lon):
+        """
+        Create an ImageMarker and add it to the image layer
         """
         eventmap = {
             "button-press": self.imagemarker_clicked,
             "drag-finish": self.imagemarker_dragged,
         }
-        point = imagemarker.ImageMarker(treeiter, filename, float(lat), float(lon), eventmap)
+        point = imagemarker.ImageMarker(treeiter, filename, lat, lon, eventmap)
         point.set_color(tfunctions.clutter_color(self.imagemarker_color, self.imagemarker_opacity))
         point.set_size(self.data.imagemarkersize)
         point.set_draggable(self.builder.get_object("checkmenuitem10").get_active())
         self.imagelayer.add_marker(point)
+        self.imagemarker_actors[filename] = point
+
+    def update_imagemarkers(self):
+        """
+        Destroy the ImageMarkers that have left the viewport and create the
+        ones that have entered it
+        """
+        for filename, point in self.imagemarker_actors.items():
+            if not self.viewport.contains_point(point.get_latitude(), point.get_longitude()):
+                del self.imagemarker_actors[filename]
+                point.destroy()
+        for filename, (treeiter, lat, lon) in self.imagemarkers.iteritems():
+            if filename not in self.imagemarker_actors and \
+                    self.viewport.contains_point(lat, lon):
+                self.create_imagemarker(treeiter, filename, lat, lon)
 
     def map_add_marker(self, _widget):
         """
         Reset the marker on the map to the location that was last
-        right-clicked
+        right-clicked, remembering the track point it was snapped to
         """
         self.add_marker_at(self.clicked_lat, self.clicked_lon)
+        self.marker_point = self.clicked_point
+        if self.marker_point:
+            tobj, i = self.marker_point
+            self.show_infobar("Marker placed on track point %s" % tfunctions.trackpoint_to_text(
+                tobj.lats[i], tobj.lons[i], tobj.get_localtime(i),
+                tobj.eles[i] if tobj.elemask[i] else None))
 
     def redraw_marker(self, _data=None, _prop=None):
         """
@@ -791,14 +1158,14 @@ class App(object):
         Zoom in on the map view and update the zoom widget
         """
         self.osm.zoom_in()
-        self.update_adjustment1()
+        self.on_map_zoom_changed()
 
     def map_zoom_out(self, widget=None, event=None):
         """
         Zoom out from the map view and update the zoom widget
         """
         self.osm.zoom_out()
-        self.update_adjustment1()
+        self.on_map_zoom_changed()
 
     def adjust_zoom(self, adj, _map=None):
         """
@@ -809,14 +1176,28 @@ class App(object):
         cur_zoom = self.osm.get_zoom_level()
         if zoom != cur_zoom:
             self.osm.set_zoom_level(zoom)
-            self.update_adjustment1()
+            self.on_map_zoom_changed()
 
-    def on_map_zoom_changed(self):
+    def on_map_zoom_changed(self, _map=None, _prop=None):
         """
         Handler for the "notify::zoom" signal from the map view, updates the
-        zoom widget.
+        zoom widget and the viewport.
         """
         self.update_adjustment1()
+        self.update_viewport()
+
+    def update_viewport(self, _map=None, _prop=None):
+        """
+        Update the viewport for the visible area and zoom level of the map
+        view. If it has moved, redraw the tracks simplified for the zoom level
+        and within the viewport, and the image markers within the viewport.
+        """
+        bbox = self.osm.get_bounding_box()
+        if self.viewport.update(bbox.bottom, bbox.left, bbox.top, bbox.right,
+                                self.osm.get_zoom_level()):
+            self.with_all_tracks_do(self.redraw_track, self.track_nodes_limit())
+            self.update_imagemarkers()
+            self.raise_layers()
 
     def add_bookmark_dialog(self, widget):
         """
@@ -927,16 +1308,45 @@ class App(object):
 
     def tag_selected_from_marker(self, widget):
         """
-        Add a geotag using the marker's location to all selected images
+        Add a geotag using the marker's location to all selected images. If
+        the marker is on a track point, the elevation of that point is used,
+        and for a single image, its time is compared to that of the point.
         """
         try:
             m = self.markerlayer.get_markers()[0]
             lat, lon = (m.get_latitude(), m.get_longitude())
             ele = 0.0
+            point_time = None
+            # Unless the marker was dragged away from it
+            if self.marker_point:
+                tobj, i = self.marker_point
+                if (tobj.lats[i], tobj.lons[i]) == (lat, lon):
+                    point_time = tobj.get_localtime(i)
+                    if tobj.elemask[i]:
+                        ele = tobj.eles[i]
             self.tag_selected(lat,lon,ele)
+            if point_time:
+                self.show_clock_offset(point_time)
         except IndexError:
             pass
 
+    def show_clock_offset(self, point_time):
+        """
+        If a single image is selected, show how far the camera clock was off
+        from the time of the track point it was tagged with, which is the
+        offset to correct for when tagging the other images from tracks
+        """
+        model, pathlist = self.builder.get_object("treeview1").get_selection().get_selected_rows()
+        if len(pathlist) != 1:
+            return
+        dtobj = model[model.get_iter(pathlist[0])][constants.images.columns.dtobject]
+        if not dtobj:
+            return
+        offset = (dtobj - point_time).total_seconds()
+        self.show_infobar("Tagged 1 image from the track point at %s, the camera clock was %s %s" % (
+            point_time.strftime('%Y-%m-%d %H:%M:%S'), tfunctions.format_duration(abs(offset)),
+            'ahead' if offset >= 0 else 'behind'))
+
     def tag_selected_from_track(self, widget):
         """
         If any tracks are available, add a geotag using coordinates from the
@@ -949,27 +1359,26 @@ class App(object):
         treeselect = self.builder.get_object("treeview1").get_selection()
         model,pathlist = treeselect.get_selected_rows()
         if pathlist:
-            try:
-                i=0
-                for p in pathlist:
-                    tree_iter = model.get_iter(p)
-                    filename = model[tree_iter][constants.images.columns.filename]
-                    dt = model[tree_iter][constants.images.columns.dtobject]
-                    if dt:
-                        lat, lon, ele = self.gpx.find_coordinates(dt)
-                        if lat and lon:
-                            #print("%s %.5f %.5f" % (filename, lat, lon))
-                            # Modify the coordinates
-                            model[tree_iter][constants.images.columns.latitude] = "%.5f" % lat
-                            model[tree_iter][constants.images.columns.longitude] = "%.5f" % lon
-                            model[tree_iter][constants.images.columns.elevation] = "%.2f" % ele
-                            model[tree_iter][constants.images.columns.modified] = True
-                            self.move_imagemarker(tree_iter, filename, lat, lon)
-                            self.modified[filename] = {'latitude': "%.5f" % lat, 'longitude': "%.5f" % lon, 'elevation': "%.2f" % ele}
-                            i += 1
-                self.show_infobar ("Tagged %d image%s" % (i, '' if i == 1 else 's'))
-            except IndexError:
-                pass
+            iters = [model.get_iter(p) for p in pathlist]
+            dts = [model[tree_iter][constants.images.columns.dtobject] or None for tree_iter in iters]
+            lats, lons, eles, nomatch = self.gpx.find_coordinates_batch(dts)
+            i=0
+            for k, tree_iter in enumerate(iters):
+                if nomatch[k]:
+                    continue
+                filename = model[tree_iter][constants.images.columns.filename]
+                lat, lon, ele = lats[k], lons[k], eles[k]
+                # Modify the coordinates
+                model.set(tree_iter, {
+                    constants.images.columns.latitude: "%.5f" % lat,
+                    constants.images.columns.longitude: "%.5f" % lon,
+                    constants.images.columns.elevation: "%.2f" % ele,
+                    constants.images.columns.modified: True})
+                self.move_imagemarker(tree_iter, filename, lat, lon)
+                self.modified[filename] = {'latitude': "%.5f" % lat, 'longitude': "%.5f" % lon, 'elevation': "%.2f" % ele}
+                i += 1
+            self.update_heatmap()
+            self.show_infobar ("Tagged %d image%s" % (i, '' if i == 1 else 's'))
 
     def tag_selected(self, lat, lon, ele):
         """
@@ -981,23 +1390,27 @@ class App(object):
         model,pathlist = treeselect.get_selected_rows()
         if pathlist:
             i=0
-            for p in pathlist:
-                tree_iter = model.get_iter(p)
+            # Paths change as rows move, iterators don't
+            for tree_iter in [model.get_iter(p) for p in pathlist]:
                 filename = model[tree_iter][constants.images.columns.filename]
                 if arg_ele == None:
                     ele = float(model[tree_iter][constants.images.columns.elevation])
                 try:
-                    model[tree_iter][constants.images.columns.latitude] = "%.5f" % float(lat)
-                    model[tree_iter][constants.images.columns.longitude] = "%.5f" % float(lon)
-                    model[tree_iter][constants.images.columns.elevation] = "%.2f" % float(ele)
+                    values = {
+                        constants.images.columns.latitude: "%.5f" % float(lat),
+                        constants.images.columns.longitude: "%.5f" % float(lon),
+                        constants.images.columns.elevation: "%.2f" % float(ele)}
                 except ValueError:  # could not convert to float
-                    model[tree_iter][constants.images.columns.latitude] = ''
-                    model[tree_iter][constants.images.columns.longitude] = ''
-                    model[tree_iter][constants.images.columns.elevation] = ''
-                model[tree_iter][constants.images.columns.modified] = True
+                    values = {
+                        constants.images.columns.latitude: '',
+                        constants.images.columns.longitude: '',
+                        constants.images.columns.elevation: ''}
+                values[constants.images.columns.modified] = True
+                model.set(tree_iter, values)
                 self.move_imagemarker(tree_iter, filename, lat, lon)
                 self.modified[filename] = {'latitude': "%.5f" % lat, 'longitude': "%.5f" % lon, 'elevation': "%.2f" % ele}
                 i += 1
+            self.update_heatmap()
             self.show_infobar ("Tagged %d image%s" % (i, '' if i == 1 else 's'))
 
     def delete_tag_from_selected(self, widget):
@@ -1012,58 +1425,141 @@ class App(object):
         model,pathlist = treeselect.get_selected_rows()
         i=0
         if pathlist:
-            for p in pathlist:
-                tree_iter = model.get_iter(p)
+            # Paths change as rows move, iterators don't
+            for tree_iter in [model.get_iter(p) for p in pathlist]:
                 lat = model.get_value(tree_iter, constants.images.columns.latitude)
                 lon = model.get_value(tree_iter, constants.images.columns.longitude)
                 if lat or lon:
                     filename = model[tree_iter][constants.images.columns.filename]
-                    model[tree_iter][constants.images.columns.latitude] = ''
-                    model[tree_iter][constants.images.columns.longitude] = ''
-                    model[tree_iter][constants.images.columns.elevation] = ''
-                    model[tree_iter][constants.images.columns.modified] = True
+                    model.set(tree_iter, {
+                        constants.images.columns.latitude: '',
+                        constants.images.columns.longitude: '',
+                        constants.images.columns.elevation: '',
+                        constants.images.columns.modified: True})
                     self.remove_imagemarker(filename)
                     self.modified[filename] = {'latitude': '', 'longitude': '', 'elevation': ''}
                     i += 1
+        self.update_heatmap()
         self.show_infobar ("Deleted tags from %d image%s" % (i, '' if i == 1 else 's'))
 
     def save_all(self, widget=None):
         """
-        Save all modified images, repopulate the images list with only untagged
-        images if so desired
+        Save all modified images, including those hidden by filters. The
+        files are written by write_images in worker processes, while the GUI
+        stays responsive, and every image is marked as saved as soon as it
+        is written. Return True if all images were saved.
         """
-        model = self.builder.get_object('treeview1').get_model()
-        self.savecounter = 0
-        model.foreach(self.treestore_save_modified, None)
-
-        # If we only want to see untagged images, repopulate the treeview
-        if self.builder.get_object("checkmenuitem1").get_active():
-            self.populate_store1()
-        self.show_infobar("%d image%s saved" % (self.savecounter, '' if self.savecounter == 1 else 's'))
-
-    def treestore_save_modified(self, model, path, tree_iter, userdata):
-        """
-        For all modified images, read the metadata from the file, update it
-        with our changes and write it back to the file
-        """
-        fl = model.get_value(tree_iter, constants.images.columns.filename)
-        if model.get_value(tree_iter, constants.images.columns.modified):
-            fname = os.path.join(self.data.imagedir, fl)
-            metadata = GExiv2.Metadata(fname)
+        if self.saving:
+            return False
+        jobs = []
+        for fl, data in self.modified.items():
             try:
-                lat = float(model.get_value(tree_iter, constants.images.columns.latitude))
-                lon = float(model.get_value(tree_iter, constants.images.columns.longitude))
-                ele = float(model.get_value(tree_iter, constants.images.columns.elevation))
-                metadata.set_gps_info(lon, lat, ele)
+                location = tuple(float(data[k]) for k in ('latitude', 'longitude', 'elevation'))
             # If the tag is empty, the conversion to float will fail with a ValueError
             except ValueError:
-                metadata.delete_gps_info()
+                location = None
+            jobs.append((fl, location, dict(data)))
+        saved = 0
+        errors = []
+        self.saving = True
+        self.save_cancelled = False
+        self.start_progress("Saving %d images" % len(jobs), self.cancel_save)
+        try:
+            for n, (fl, location, data, error) in enumerate(self.write_images(jobs)):
+                if error:
+                    errors.append((fl, error))
+                else:
+                    self.image_saved(fl, location, data)
+                    saved += 1
+                self.update_progress(float(n + 1) / len(jobs),
+                    "Saving images (%d/%d)" % (n + 1, len(jobs)))
+        finally:
+            self.saving = False
+            self.catalog.commit()
+            self.stop_progress()
+
+        msg = "%d image%s saved" % (saved, '' if saved == 1 else 's')
+        if self.save_cancelled:
+            msg = "%s, cancelled" % msg
+        self.show_infobar(msg)
+        if errors:
+            errmsg = "\n".join("%s: %s" % e for e in errors[:20])
+            if len(errors) > 20:
+                errmsg += "\n(and %d more)" % (len(errors) - 20)
+            dialog = Gtk.MessageDialog(self.window, 0, Gtk.MessageType.ERROR,
+                Gtk.ButtonsType.OK, "%d image%s could not be saved" % (
+                    len(errors), '' if len(errors) == 1 else 's'))
+            dialog.format_secondary_text(errmsg)
+            dialog.run()
+            dialog.destroy()
+        if self.pending_image_changes != ([], []):
+            self.images_changed([], [])
+        return saved == len(jobs)
+
+    def write_images(self, jobs):
+        """
+        Write the geotags of images in a pool of worker processes, given a
+        list of (filename, location, data) tuples, and yield a tuple of the
+        file name, location, data and an error message or None for each
+        image as soon as it is written. The 'write-mode' setting decides
+        whether images or their XMP sidecars are written. At most
+        2 * save_workers writes are queued at a time. Keep the GUI
+        responsive while waiting. After the progress bar's cancel button is
+        clicked, the writes that were started are finished, but no new ones
+        are started.
+        """
+        if not jobs:
+            return
+        mode = self.data.writemode
+        pool = multiprocessing.Pool(min(self.save_workers, len(jobs)))
+        try:
+            todo = list(reversed(jobs))
+            running = []
+            while running or (todo and not self.save_cancelled):
+                while todo and len(running) < 2 * self.save_workers and not self.save_cancelled:
+                    fl, location, data = todo.pop()
+                    result = pool.apply_async(imagescan.write_location,
+                        ((os.path.join(self.data.imagedir, fl), location, mode),))
+                    running.append((result, fl, location, data))
+                done = [job for job in running if job[0].ready()]
+                if not done:
+                    running[0][0].wait(0.05)
+                    self.update_gtk()
+                    continue
+                for job in done:
+                    running.remove(job)
+                    result, fl, location, data = job
+                    yield (fl, location, data, result.get())
+        finally:
+            # Never terminate the workers, that could leave a file half written
+            pool.close()
+            pool.join()
 
-            metadata.save_file()
-            model[tree_iter][5] = False  # saved => not modified
-            del self.modified[fl]
-            self.savecounter += 1
-            self.update_gtk()
+    def cancel_save(self):
+        """
+        Stop saving images after the writes that were started
+        """
+        self.save_cancelled = True
+
+    def image_saved(self, fl, location, data):
+        """
+        Update the catalog after the geotag of an image was written, and
+        mark the image as saved, unless it was changed again in the meantime
+        """
+        if location:
+            location = tuple(round(x, 5) for x in location)
+        else:
+            location = (None, None, None)
+        self.catalog.update_location(self.data.imagedir, fl, *location)
+        treeiter = self.image_rows.get(fl)
+        if treeiter is None or self.modified.get(fl) != data:
+            return
+        del self.modified[fl]
+        self.imagestore[treeiter][constants.images.columns.modified] = False
+        # Saved images may not pass the filters anymore, like the untagged
+        # filter, which shows tagged images only until they are saved
+        if not self.imagestore.is_shown(treeiter):
+            self.remove_imagemarker(fl)
 
     def show_infobar(self, text, timeout=5):
         """
@@ -1125,13 +1621,19 @@ class App(object):
         else:
             self.cbox.hide()
 
-    def process_gpx(self, filename, tz):
+    def process_gpx(self, filename, tz, decoded=None):
         """
         Import a GPX file draw all the tracks in it on the map, using a
         different Polygon for each track, and add the track to the liststore
-        for the tracks list
-        """
-        idx, msg = self.gpx.import_gpx(filename, tz)
+        for the tracks list. If the file was decoded already, in a worker
+        process, the result of the decoding is passed as 'decoded'.
+        """
+        if decoded is None:
+            self.gpx.validation = self.data.gpxvalidation
+            decoded = self.gpx.decode_gpx(filename, tz)
+        idx, msg = decoded
+        if idx is not False:
+            idx, msg = self.gpx.parse_tracks(idx)
         if idx is False:
             errmsg = ("Importing file '%s' failed with the following error:\n\n%s\n\n" +
                 "Please check if your file is a valid GPX 1.1 file. " +
@@ -1146,22 +1648,23 @@ class App(object):
         store = self.builder.get_object("liststore2")
         i = 0
         for tid, tobj in self.gpx.get_tracks(idx).iteritems():
-            trk = tobj.trk
             # Create a tracklayer for each track
             tracklayer = polygon.Polygon(width=self.data.get_property("trackwidth"))
             tracklayer.set_stroke_color(tfunctions.clutter_color(self.track_default_color))
             t0, tx = tobj.get_timestamps()
-            p = 0
+            p = len(tobj)
 
-            for point in tobj.get_points():
-                p += 1
-                tracklayer.append_point(float(point.get('lat')), float(point.get('lon')))
+            self.draw_track(tracklayer, tid, self.track_nodes_limit())
 
+            stats = tobj.get_stats()
             store.append([
                 tobj.get_name(),
                 t0.strftime("%Y-%m-%d %H:%M:%S"),
                 tx.strftime("%Y-%m-%d %H:%M:%S"),
-                p, tid, tracklayer, tobj.get_distance()
+                p, tid, tracklayer, stats.distance,
+                int(stats.duration), int(stats.moving_time),
+                stats.avg_speed() * 3.6, stats.max_speed * 3.6,
+                int(stats.ascent), int(stats.descent)
             ])
             self.osm.add_layer(tracklayer)
             if not self.show_tracks:
@@ -1174,6 +1677,88 @@ class App(object):
         self.data.set_property('lasttrackfolder', os.path.dirname(filename))
         return i
 
+    def track_nodes_limit(self):
+        """
+        Return the maximum number of nodes to draw for a single track, so
+        that all tracks together stay within the nodes budget. The budget
+        only runs out below two nodes, a line, with over 125000 tracks.
+        """
+        return max(self.track_nodes_budget // max(len(self.gpx.tracks), 1),
+                   self.track_nodes_minimum)
+
+    def draw_track(self, tracklayer, tid, limit):
+        """
+        Draw a track on a tracklayer, simplified for the current zoom level
+        of the map view and with at most 'limit' nodes. Parts of the track
+        outside the viewport are left out. Tracks that are drawn in tiles
+        are not drawn on their tracklayer.
+        """
+        if not self.track_drawn_as_path(tracklayer):
+            self.track_nodes_limits[tid] = None
+            return
+        zoom = self.osm.get_zoom_level()
+        box = self.viewport.box
+        self.track_nodes_limits[tid] = (limit, zoom, box)
+        for lat, lon in self.gpx.tracks[tid].get_points(limit, zoom, box):
+            tracklayer.append_point(lat, lon)
+
+    def redraw_track(self, model, path, tree_iter, limit):
+        """
+        Redraw a tracklayer with at most 'limit' nodes, if it was drawn with
+        a different limit, for a different zoom level or for a different
+        viewport, or if it has moved into or out of the tiles
+        """
+        tid = model.get_value(tree_iter, constants.tracks.columns.tid)
+        tracklayer = model.get_value(tree_iter, constants.tracks.columns.layer)
+        drawn = None
+        if self.track_drawn_as_path(tracklayer):
+            drawn = (limit, self.osm.get_zoom_level(), self.viewport.box)
+        if self.track_nodes_limits.get(tid) != drawn:
+            tracklayer.remove_all()
+            self.draw_track(tracklayer, tid, limit)
+
+    def tiles_mode(self):
+        """
+        Return True if tracks are drawn in map tiles instead of as paths
+        """
+        return self.data.trackrendering == 'tiles' and tilerender is not None
+
+    def track_drawn_as_path(self, tracklayer):
+        """
+        Return True if a track should be drawn on its tracklayer. In tiles
+        mode, only the highlighted tracks are, on top of the tiles.
+        """
+        return not self.tiles_mode() or tracklayer in self.highlighted_tracks
+
+    def update_track_tiles(self, _data=None, _prop=None):
+        """
+        In tiles mode, show all loaded tracks in an overlay of map tiles,
+        replacing the overlay if the tracks or their appearance have changed.
+        Tiles are cached on disk by a version that identifies the set of
+        tracks, so they survive restarts, and only the tiles of the current
+        version are kept. Then redraw the tracklayers that
+        have moved into or out of the tiles.
+        """
+        if self.data.trackrendering == 'tiles' and tilerender is None:
+            self.show_infobar("Drawing tracks in tiles needs pycairo, drawing paths instead")
+        version = None
+        if self.tiles_mode() and self.show_tracks and self.gpx.tracks:
+            color = tfunctions.color_tuple(self.track_default_color)
+            version = tilerender.tracks_version(self.gpx.tracks, color, self.data.trackwidth)
+        if version != self.track_tiles_version:
+            if self.track_tiles:
+                self.osm.remove_overlay_source(self.track_tiles)
+                self.track_tiles = None
+            if version:
+                cache_dir = os.path.join(os.path.expanduser('~'), '.taggert', 'tilecache')
+                tilerender.prune_track_tiles(cache_dir, version)
+                self.track_tiles = tilerender.tile_source_chain(
+                    tilerender.track_tile_source(self.gpx.tracks, version, color, self.data.trackwidth),
+                    cache_dir)
+                self.osm.add_overlay_source(self.track_tiles, 255)
+            self.track_tiles_version = version
+        self.with_all_tracks_do(self.redraw_track, self.track_nodes_limit())
+
     def init_treeview2(self):
         """
         Initialize the tracks list
@@ -1201,6 +1786,28 @@ class App(object):
         tree.append_column(col3)
         tree.append_column(col4)
 
+        # Track statistics, formatted by a cell data function
+        for title, column, fmt in (
+                ("Duration", constants.tracks.columns.duration, tfunctions.format_duration),
+                ("Moving", constants.tracks.columns.moving, tfunctions.format_duration),
+                ("Avg km/h", constants.tracks.columns.avgspeed, "%.1f"),
+                ("Max km/h", constants.tracks.columns.maxspeed, "%.1f"),
+                ("Ascent", constants.tracks.columns.ascent, "%d"),
+                ("Descent", constants.tracks.columns.descent, "%d")):
+            col = Gtk.TreeViewColumn(title, renderer)
+            col.set_cell_data_func(renderer, self.render_track_stat, (column, fmt))
+            col.set_sort_column_id(column)
+            tree.append_column(col)
+
+    def render_track_stat(self, column, cell, model, tree_iter, userdata):
+        """
+        Set the text of a cell in the tracks list from a numeric column,
+        using either a format string or a function
+        """
+        col, fmt = userdata
+        value = model.get_value(tree_iter, col)
+        cell.set_property('text', fmt(value) if callable(fmt) else fmt % value)
+
     def open_gpx(self, widget=None):
         """
         Display a FileChooserDialog for selecting one or more GPX files to
@@ -1228,21 +1835,68 @@ class App(object):
             self.builder.get_object('notebook1').set_current_page(1)
             self.update_gtk()
             start = time.time()
-            for filename in filenames:
+            n = 0
+            for filename, tracks, msg in self.decode_gpx_files(filenames, self.data.tracktimezone):
+                n += 1
+                self.update_progress(float(n) / len(filenames),
+                    "%s (%d/%d)" % (os.path.basename(filename), n, len(filenames)))
                 # self.process_gpx returns the number of tracks or False in case of errors
-                i0 = self.process_gpx(filename, self.data.tracktimezone)
+                i0 = self.process_gpx(filename, self.data.tracktimezone, (tracks, msg))
                 if i0 == False:
                     continue
                 else:
                     i += i0
+            self.stop_progress()
+            # Tracks drawn early on may have been given more nodes than
+            # the budget allows now that all files are loaded
+            self.update_track_tiles()
+            self.update_heatmap(True)
             end = time.time()
             if (len(filenames) == 1):
                 msg = os.path.basename(filename)
             else:
                 msg = "%d files" % len(filenames)
+            if self.import_cancelled:
+                msg = "%s, cancelled after %d" % (msg, n)
             self.show_infobar ("%d %stracks added from '%s' in %.2f seconds" % (i, 'hidden ' if not self.show_tracks else '', msg, end - start))
         chooser.destroy()
 
+    def decode_gpx_files(self, filenames, tz):
+        """
+        Decode GPX files in a pool of worker processes, one file per worker,
+        and yield a tuple of the file name, the decoded tracks and an error
+        message for each file as soon as it is done. A single file is
+        decoded in a worker as well, because the workers also simplify,
+        index and measure the tracks. Keep the GUI responsive while waiting,
+        and stop when the progress bar's cancel button is clicked.
+        """
+        self.import_cancelled = False
+        self.start_progress("Loading %d files" % len(filenames), self.cancel_import)
+        self.gpx.validation = self.data.gpxvalidation
+        pool = multiprocessing.Pool(min(multiprocessing.cpu_count(), len(filenames)))
+        try:
+            jobs = [(self.data_dir, self.gpx.cache_dir, self.gpx.validation, f, tz) for f in filenames]
+            results = pool.imap_unordered(gpxfile.decode_gpx_worker, jobs)
+            for k in xrange(len(filenames)):
+                while not self.import_cancelled:
+                    try:
+                        result = results.next(0.05)
+                        break
+                    except multiprocessing.TimeoutError:
+                        self.update_gtk()
+                if self.import_cancelled:
+                    break
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def cancel_import(self):
+        """
+        Stop importing GPX files
+        """
+        self.import_cancelled = True
+
     def set_timezone_dialog(self, widget=None):
         """
         Display a dialog window for choosing a timezone and optionally setting
@@ -1261,6 +1915,7 @@ class App(object):
         self.show_tracks = checked
         model = self.builder.get_object("liststore2")
         model.foreach(self.show_tracklayer, checked)
+        self.update_track_tiles()
 
     def toggle_imagemarkers(self, widget=None):
         """
@@ -1273,6 +1928,55 @@ class App(object):
         else:
             self.imagelayer.hide()
 
+    def toggle_heatmap(self, widget=None):
+        """
+        Handler for the 'toggled' signal from a checkmenuitem, shows or hides
+        the heatmap on the map accordingly
+        """
+        self.update_heatmap()
+
+    def update_heatmap(self, tracks_changed=False):
+        """
+        Schedule an update of the heatmap, so a series of changes, like
+        tagging many images, causes a single update
+        """
+        if tracks_changed:
+            self.heatmap_track_grid = None
+        if not self.heatmap_pending:
+            self.heatmap_pending = True
+            GLib.idle_add(self.rebuild_heatmap)
+
+    def rebuild_heatmap(self):
+        """
+        Idle callback that, if the heatmap is enabled, replaces it by a
+        heatmap of the current track points and image locations. The track
+        points are binned per track by the workers that decode the GPX
+        files, and their cells are only merged here, for each zoom level when
+        it is first drawn, until the tracks change. The image locations are binned into a grid
+        over it.
+        """
+        self.heatmap_pending = False
+        if self.heatmap:
+            self.osm.remove_overlay_source(self.heatmap)
+            self.heatmap = None
+        if not self.builder.get_object("checkmenuitem11").get_active():
+            return False
+        if tilerender is None:
+            self.show_infobar("Drawing the heatmap needs pycairo")
+            return False
+        if self.heatmap_track_grid is None:
+            self.heatmap_track_grid = density.DensityGrid(density.MergedLevels(
+                tobj.get_density() for tobj in self.gpx.tracks.itervalues()))
+        locations = self.imagemarkers.values()
+        counts = density.bin_points([l[1] for l in locations], [l[2] for l in locations])
+        self.heatmap_version += 1
+        self.heatmap = tilerender.tile_source_chain(tilerender.heatmap_tile_source(
+            density.DensityGrid(density.aggregate(counts), self.heatmap_track_grid),
+            self.heatmap_version),
+            cache_size=200)
+        self.osm.add_overlay_source(self.heatmap, 255)
+        return False
+
     def show_tracklayer(self, model, path, tree_iter, show):
         """
         Look up a tracklayer in the specified model and show or hide it as
@@ -1326,11 +2030,13 @@ class App(object):
         if pathlist:
             for p in pathlist:
                 tree_iter = model.get_iter(p)
-                tracklayer = model.get_value(tree_iter, constants.tracks.columns.layer)
-                if box:
-                    box.compose(tracklayer.get_bounding_box())
-                else:
-                    box = tracklayer.get_bounding_box()
+                # The tracklayer only holds the part of the track in the viewport
+                tid = model.get_value(tree_iter, constants.tracks.columns.tid)
+                minlat, minlon, maxlat, maxlon = self.gpx.tracks[tid].get_chunks().bbox
+                if not box:
+                    box = Champlain.BoundingBox.new()
+                box.extend(minlat, minlon)
+                box.extend(maxlat, maxlon)
                 i += 1
             self.osm.ensure_visible(box, False)
             self.show_infobar ("Showing %d tracks" % i)
@@ -1349,7 +2055,10 @@ class App(object):
                 tracklayer.destroy()
                 tid = model.get_value(tree_iter, constants.tracks.columns.tid)
                 self.gpx.remove_track(tid)
+                self.track_nodes_limits.pop(tid, None)
                 model.remove(tree_iter)
+            self.update_track_tiles()
+            self.update_heatmap(True)
             self.show_infobar("%d tracks removed" % len(pathlist))
 
     def treeselect2_changed(self, treeselect):
@@ -1374,6 +2083,9 @@ class App(object):
                     #tracklayer.get_parent().set_child_above_sibling(tracklayer, None)
                     tracklayer.raise_top()
                     self.highlighted_tracks.append(tracklayer)
+            if self.tiles_mode():
+                # Only the tracks that were or are highlighted are redrawn
+                self.with_all_tracks_do(self.redraw_track, self.track_nodes_limit())
         self.raise_layers()
 
     def treeview2_select_all(self, widget=None):
@@ -1532,6 +2244,7 @@ class App(object):
             # update GUI appearance
             self.markerlayer.get_markers()[0].set_color(tfunctions.clutter_color(self.marker_color))
             self.treeselect2_changed(self.builder.get_object("treeview2").get_selection())
+            self.update_track_tiles()
         else:
             # Reset preferences window
             self.builder.get_object("colorbutton1").set_color(self.marker_color)
@@ -1546,7 +2259,7 @@ class App(object):
         """
         Iterate over all tracks and call the specified function on each of them
         """
-        model = self.builder.get_object("liststore1")
+        model = self.imagestore
         model.foreach(callback, userdata)
 
     def with_all_tracks_do (self, callback, userdata=None):
@@ -1556,6 +2269,14 @@ class App(object):
         model = self.builder.get_object("liststore2")
         model.foreach(callback, userdata)
 
+    def update_tracks_appearance(self, _data=None, _prop=None):
+        """
+        Update the appearance of all tracks, on their tracklayers and in the
+        tiles
+        """
+        self.with_all_tracks_do(self.update_track_appearance)
+        self.update_track_tiles()
+
     def update_track_appearance(self, model, path, tree_iter, userdata):
         """
         Update the color and stroke width of a track on the map according to
@@ -1656,6 +2377,43 @@ class App(object):
             self.window_size = size
             self.settings.set_value('window-size', GLib.Variant('(ii)', size))
 
+    def start_progress(self, text, cancel_callback=None):
+        """
+        Show the progress bar with the specified text, and a cancel button
+        that calls the specified function if one is given
+        """
+        self.progress_cancel_callback = cancel_callback
+        self.progressbar.set_fraction(0.0)
+        self.progressbar.set_text(text)
+        self.progressbar.show()
+        self.progressbutton.set_sensitive(True)
+        if cancel_callback:
+            self.progressbutton.show()
+
+    def update_progress(self, fraction, text=None):
+        """
+        Update the progress bar's fraction and optionally its text
+        """
+        self.progressbar.set_fraction(fraction)
+        if text is not None:
+            self.progressbar.set_text(text)
+
+    def stop_progress(self):
+        """
+        Hide the progress bar and the cancel button
+        """
+        self.progress_cancel_callback = None
+        self.progressbar.hide()
+        self.progressbutton.hide()
+
+    def cancel_progress(self, widget=None):
+        """
+        Handler for the 'clicked' signal from the progress cancel button
+        """
+        self.progressbutton.set_sensitive(False)
+        if self.progress_cancel_callback:
+            self.progress_cancel_callback()
+
     def raise_layers(self):
         """
         Move markerlayer and then imagelayer to the top
@@ -1706,22 +2464,19 @@ class App(object):
 
     def remove_imagemarker(self, filename):
         """
-        Find an ImageMarker by filename and remove (destroy) it
+        Forget the location of an image and remove (destroy) its ImageMarker
         """
-        for m in self.imagelayer.get_markers():
-            if m.filename == filename:
-                m.destroy()
-                break
+        self.imagemarkers.pop(filename, None)
+        m = self.imagemarker_actors.pop(filename, None)
+        if m:
+            m.destroy()
 
     def get_imagemarker_by_filename(self, filename):
         """
         Find an ImageMarker by filename and return it. Return None if no marker
-        could be found
+        could be found, or the image is outside the viewport
         """
-        for m in self.imagelayer.get_markers():
-            if m.filename == filename:
-                return m
-        return None
+        return self.imagemarker_actors.get(filename)
 
     def toggle_imagemarker_draggable(self, widget=None):
         self.update_imagemarker_appearance()
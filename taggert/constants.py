@@ -34,6 +34,12 @@ class TracksColumns(object):
     tid       = 4
     layer     = 5
     distance  = 6
+    duration  = 7
+    moving    = 8
+    avgspeed  = 9
+    maxspeed  = 10
+    ascent    = 11
+    descent   = 12
 
 class tracks(object):
     columns = TracksColumns()
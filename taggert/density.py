@@ -0,0 +1,217 @@
+#   Copyright 2014 Martijn Grendelman <m@rtijn.net>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""density module, defines the DensityGrid class"""
+
+from array import array
+from bisect import bisect_left
+from itertools import imap, izip
+
+from lod import project, TILE_SIZE
+
+CELL_BITS = 6                           # a tile is 2 ** CELL_BITS cells wide
+CELL_SIZE = TILE_SIZE >> CELL_BITS      # size of a cell in pixels
+MAX_LEVEL = 16                          # zoom level of the finest grid
+
+# The bits of every byte value, spread out over the even bits of 16 bits
+SPREAD = [sum(((b >> i) & 1) << (2 * i) for i in xrange(8)) for b in xrange(256)]
+# The x and y of a cell within its tile, for the lowest bits of its key
+LOCAL = [(sum(((k >> (2 * i)) & 1) << i for i in xrange(CELL_BITS)),
+          sum(((k >> (2 * i + 1)) & 1) << i for i in xrange(CELL_BITS)))
+         for k in xrange(1 << (2 * CELL_BITS))]
+
+def interleave(x, y):
+    """
+    Return the Morton code of x and y: their bits interleaved, with the
+    bits of x in the even positions
+    """
+    code = 0
+    shift = 0
+    while x or y:
+        code |= (SPREAD[x & 255] | (SPREAD[y & 255] << 1)) << shift
+        x >>= 8
+        y >>= 8
+        shift += 16
+    return code
+
+def bin_points(lats, lons, counts=None):
+    """
+    Count points per cell of the finest grid, adding to a dict of counts
+    keyed by cell if given. Return the dict.
+    """
+    if counts is None:
+        counts = {}
+    n = 1 << (MAX_LEVEL + CELL_BITS)
+    for lat, lon in izip(lats, lons):
+        x, y = project(lat, lon)
+        key = interleave(max(min(int(x * n), n - 1), 0),
+                         max(min(int(y * n), n - 1), 0))
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+def aggregate(counts):
+    """
+    Return the levels of a grid for a dict of counts made by bin_points():
+    a dict of a sorted array of the keys of the cells that hold any points
+    and an array of their counts for every zoom level, the coarser levels
+    aggregated from the finest
+    """
+    ordered = sorted(counts)
+    levels = {MAX_LEVEL: (array('d', ordered), array('l', imap(counts.__getitem__, ordered)))}
+    for level in xrange(MAX_LEVEL - 1, -1, -1):
+        finer_keys, finer_counts = levels[level + 1]
+        keys = array('d')
+        counts = array('l')
+        for k in xrange(len(finer_keys)):
+            key = int(finer_keys[k]) >> 2
+            # Sorted, so cells that merge are next to each other
+            if keys and keys[-1] == key:
+                counts[-1] += finer_counts[k]
+            else:
+                keys.append(key)
+                counts.append(finer_counts[k])
+        levels[level] = (keys, counts)
+    return levels
+
+def merge_level(grids, level):
+    """
+    Return the sorted keys and the counts of a level of the sum of a number
+    of grids made by aggregate(). Cells are mostly covered by a single
+    grid, so the grids are merged as dicts and only the cells in more than
+    one of them are added up one by one.
+    """
+    total = {}
+    for levels in grids:
+        keys, counts = levels[level]
+        cells = dict(izip(keys, counts))
+        for key in cells.viewkeys() & total.viewkeys():
+            cells[key] += total[key]
+        total.update(cells)
+    ordered = sorted(total)
+    return array('d', ordered), array('l', imap(total.__getitem__, ordered))
+
+class MergedLevels(dict):
+    """
+    The levels of the sum of a number of grids made by aggregate(), such as
+    those of the tracks. Each level is merged when it is first used, so
+    only the zoom levels that are looked at are merged.
+    """
+
+    def __init__(self, grids):
+        """
+        Initialize the levels from an iterable of grids made by aggregate()
+        """
+        dict.__init__(self)
+        self.grids = list(grids)
+
+    def __missing__(self, level):
+        """
+        Merge a level of the grids
+        """
+        self[level] = merge_level(self.grids, level)
+        return self[level]
+
+class DensityGrid(object):
+    """
+    The number of points in every CELL_SIZE by CELL_SIZE pixel cell of the
+    map, for every zoom level up to MAX_LEVEL. Cells are keyed by the Morton
+    code of their position, so the key of the cell containing a cell at the
+    next zoom level is its key shifted right by two bits, and the cells of
+    a tile have consecutive keys. Every level is a sorted array of the keys
+    of the cells that hold any points and an array of their counts, so the
+    cells of a tile are found by two binary searches. Keys have up to 44
+    bits, so they are stored as doubles, which hold them exactly, because
+    a C long may have only 32.
+
+    A grid can be laid over a base grid, whose counts are added to its own,
+    so the points of the images can be binned again without the track
+    points, which don't change as often.
+    """
+
+    base = None
+
+    def __init__(self, levels, base=None):
+        """
+        Initialize the grid from the levels made by aggregate(), or from
+        MergedLevels.
+        If a base DensityGrid is given, its counts are added to those of
+        the grid.
+        """
+        self.base = base
+        self.levels = levels
+        self.max_counts = {}
+
+    def count(self, level, key):
+        """
+        Return the number of points in a cell of a level of the grid itself,
+        without the base grid
+        """
+        keys, counts = self.levels[level]
+        k = bisect_left(keys, key)
+        if k < len(keys) and keys[k] == key:
+            return counts[k]
+        return 0
+
+    def max_count(self, zoom):
+        """
+        Return the highest number of points in a cell at a zoom level,
+        finding it once
+        """
+        level = min(zoom, MAX_LEVEL)
+        if level not in self.max_counts:
+            keys, counts = self.levels[level]
+            if self.base is None:
+                highest = max(counts) if counts else 0
+            else:
+                # Only the cells of the grid can be higher than the base's
+                highest = self.base.max_count(level)
+                for k in xrange(len(keys)):
+                    highest = max(highest, counts[k] + self.base.count(level, keys[k]))
+            self.max_counts[level] = highest
+        return self.max_counts[level]
+
+    def cells(self, zoom, x, y):
+        """
+        Return a list of (x, y, size, count) tuples of the cells within a
+        tile, with their position and size in pixels. Beyond MAX_LEVEL the
+        cells of the finest grid are enlarged. The cells of the base grid are
+        included.
+        """
+        level = min(zoom, MAX_LEVEL)
+        shift = zoom - level
+        tx = x >> shift
+        ty = y >> shift
+        keys, counts = self.levels[level]
+        base = interleave(tx, ty) << (2 * CELL_BITS)
+        lo = bisect_left(keys, base)
+        hi = bisect_left(keys, base + len(LOCAL), lo)
+        size = CELL_SIZE << shift
+        # Position of the tile within the tile of the grid
+        ox = (x - (tx << shift)) * TILE_SIZE
+        oy = (y - (ty << shift)) * TILE_SIZE
+        result = []
+        for k in xrange(lo, hi):
+            cx, cy = LOCAL[int(keys[k]) & (len(LOCAL) - 1)]
+            px = cx * size - ox
+            py = cy * size - oy
+            if -size < px < TILE_SIZE and -size < py < TILE_SIZE:
+                result.append((px, py, size, counts[k]))
+        if self.base is not None and result:
+            merged = dict(((px, py), count) for px, py, _size, count in self.base.cells(zoom, x, y))
+            for px, py, _size, count in result:
+                merged[(px, py)] = merged.get((px, py), 0) + count
+            result = [(px, py, size, count) for (px, py), count in merged.iteritems()]
+        elif self.base is not None:
+            result = self.base.cells(zoom, x, y)
+        return result
@@ -0,0 +1,171 @@
+#   Copyright 2014 Martijn Grendelman <m@rtijn.net>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""exifreader module, reads the EXIF tags Taggert lists from JPEG and TIFF files"""
+
+from datetime import datetime
+import mmap
+import struct
+
+# Tags in IFD0
+MODEL = 0x0110
+ORIENTATION = 0x0112
+DATETIME = 0x0132
+EXIF_IFD = 0x8769
+GPS_IFD = 0x8825
+# Tags in the Exif IFD
+DATETIME_ORIGINAL = 0x9003
+# Tags in the GPS IFD
+GPS_LATITUDE_REF = 1
+GPS_LATITUDE = 2
+GPS_LONGITUDE_REF = 3
+GPS_LONGITUDE = 4
+GPS_ALTITUDE_REF = 5
+GPS_ALTITUDE = 6
+
+# Size in bytes of the field types that are used
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+
+class ExifError(Exception):
+    """Raised for files the reader can't handle, like non-JPEG/TIFF files"""
+
+def read_exif(fname):
+    """
+    Read the camera model, the DateTimeOriginal or DateTime as a DateTime,
+    the orientation and the GPS latitude, longitude and altitude from the
+    EXIF data of a JPEG or TIFF-based file, without reading anything else.
+    The GPS values are empty strings if the file has no GPSLatitude tag.
+    Raise ExifError if the file can't be handled.
+    """
+    with open(fname, 'rb') as f:
+        head = f.read(4)
+        if head[:2] == '\xff\xd8':
+            return parse_tiff(jpeg_exif(f))
+        elif head in ('II*\x00', 'MM\x00*'):
+            # IFDs can be anywhere in a TIFF file, let the OS page in what's read
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                return parse_tiff(mm)
+            finally:
+                mm.close()
+    raise ExifError('Not a JPEG or TIFF file')
+
+def jpeg_exif(f):
+    """
+    Return the TIFF structure in the Exif APP1 segment of a JPEG file,
+    reading only the segment headers before it
+    """
+    f.seek(2)
+    while True:
+        header = f.read(4)
+        if len(header) < 4 or header[0] != '\xff':
+            raise ExifError('Invalid JPEG segment')
+        marker = ord(header[1])
+        if marker in (0xd9, 0xda):
+            # End of image or start of scan: no Exif segment
+            raise ExifError('No Exif segment')
+        length = struct.unpack('>H', header[2:])[0] - 2
+        if marker == 0xe1:
+            data = f.read(length)
+            if data[:6] == 'Exif\x00\x00':
+                return data[6:]
+        else:
+            f.seek(length, 1)
+
+def parse_tiff(buf):
+    """
+    Return the tags Taggert needs from a TIFF structure, see read_exif
+    """
+    try:
+        if buf[:2] == 'II':
+            endian = '<'
+        elif buf[:2] == 'MM':
+            endian = '>'
+        else:
+            raise ExifError('Invalid TIFF header')
+        magic, offset = struct.unpack_from(endian + 'HI', buf, 2)
+        if magic != 42:
+            raise ExifError('Invalid TIFF header')
+        ifd0 = read_ifd(buf, offset, endian)
+
+        camera = ifd0.get(MODEL, '')
+        rot = ifd0.get(ORIENTATION, (0,))[0]
+        dt = None
+        if EXIF_IFD in ifd0:
+            dt = read_ifd(buf, ifd0[EXIF_IFD][0], endian).get(DATETIME_ORIGINAL)
+        dt = parse_datetime(dt or ifd0.get(DATETIME))
+
+        lat = lon = ele = ''
+        if GPS_IFD in ifd0:
+            gps = read_ifd(buf, ifd0[GPS_IFD][0], endian)
+            if GPS_LATITUDE in gps:
+                lat = round(dms(gps[GPS_LATITUDE], gps.get(GPS_LATITUDE_REF), 'S'), 5)
+                lon = round(dms(gps.get(GPS_LONGITUDE), gps.get(GPS_LONGITUDE_REF), 'W'), 5)
+                ele = 0.0
+                if GPS_ALTITUDE in gps:
+                    ele = gps[GPS_ALTITUDE][0]
+                    if gps.get(GPS_ALTITUDE_REF, (0,))[0] == 1:
+                        ele = -ele
+                ele = round(ele, 5)
+    except (struct.error, IndexError, TypeError, ValueError):
+        raise ExifError('Invalid EXIF data')
+    return (camera, dt, rot, lat, lon, ele)
+
+def read_ifd(buf, offset, endian):
+    """
+    Return a dict of the values of the tags in an IFD, keyed by tag. ASCII
+    values are strings, all others are tuples of numbers, with rationals
+    converted to floats.
+    """
+    count = struct.unpack_from(endian + 'H', buf, offset)[0]
+    tags = {}
+    for pos in xrange(offset + 2, offset + 2 + count * 12, 12):
+        tag, ftype, n, value = struct.unpack_from(endian + 'HHII', buf, pos)
+        size = TYPE_SIZES.get(ftype)
+        if size is None:
+            continue
+        start = pos + 8 if size * n <= 4 else value
+        if ftype == 2:
+            tags[tag] = buf[start:start + n].split('\x00', 1)[0].strip()
+        elif ftype in (5, 10):
+            fmt = 'I' if ftype == 5 else 'i'
+            nums = struct.unpack_from(endian + fmt * (2 * n), buf, start)
+            tags[tag] = tuple(float(nums[i]) / nums[i+1] if nums[i+1] else 0.0
+                              for i in xrange(0, 2 * n, 2))
+        else:
+            fmt = {1: 'B', 3: 'H', 4: 'I', 7: 'B', 9: 'i'}[ftype]
+            tags[tag] = struct.unpack_from(endian + fmt * n, buf, start)
+    return tags
+
+def dms(value, ref, negative):
+    """
+    Return a decimal coordinate from a tuple of degrees, minutes and seconds
+    and a reference, which makes it negative if it starts with 'negative'
+    """
+    if not value:
+        return 0.0
+    decimal = sum(v / 60 ** i for i, v in enumerate(value[:3]))
+    if ref and ref[:1] == negative:
+        decimal = -decimal
+    return decimal
+
+def parse_datetime(value):
+    """
+    Return a DateTime for an EXIF date and time, or None if it's missing or
+    invalid
+    """
+    try:
+        return datetime.strptime(value, '%Y:%m:%d %H:%M:%S')
+    except (TypeError, ValueError):
+        return None
@@ -1,7 +1,7 @@
 #!/usr/bin/python
 
 # gpxfile.py - Used to import GPX XML files into applications
-# GPX files are maintained as a list of lxml.etree ElementTrees
+# Tracks are decoded from lxml.etree Elements into arrays of numbers
 # Copyright (C) 2014 Martijn Grendelman
 #
 #   Licensed under the Apache License, Version 2.0 (the "License");
@@ -18,38 +18,84 @@
 
 from pprint import pprint
 from lxml import etree
-from iso8601 import parse_date as parse_xml_date
 from datetime import datetime, timedelta
 from pytz import timezone   # apt-get install python-tz
-from math import radians, sin, cos, atan2, sqrt
+from array import array
+import copy_reg
+import itertools
 import os.path
-import copy
 import version
+from trackcache import TrackCache, file_hash
+from gpxtime import NAN, decode_times, from_epoch, transition_table, localize_times
+from timeindex import TimeIndex
+from spatialindex import PointGrid, SpatialIndex
+from geodesy import TrackStats
+from lod import TrackPyramid
+from density import aggregate, bin_points
+from viewport import TrackChunks
 
 nsuri = 'http://www.topografix.com/GPX/1/1'
 ns = '{' + nsuri + '}'
 minimal_xml = """<gpx xmlns="%s" version="1.1" creator="Taggert v%s">
 </gpx>
 """ % (nsuri, version.VERSION)
+# Increase when the way tracks are decoded, or the way the data cached along
+# with them is calculated, changes, to invalidate the cache
+PARSER_VERSION = 2
+# Validation modes for GPX files
+VALIDATION_STRICT = 'strict'          # validate against the GPX 1.1 schema
+VALIDATION_STRUCTURAL = 'structural'  # only check what Taggert reads
+VALIDATION_OFF = 'off'                # skip unusable track points
+# How strict the modes are: tracks decoded in a mode are the same in all
+# less strict modes, and may be served from the cache for them
+VALIDATION_LEVELS = {VALIDATION_OFF: 0, VALIDATION_STRUCTURAL: 1, VALIDATION_STRICT: 2}
+
+def pickle_array(a):
+    """
+    Reduce an array to its typecode and its contents as a string, for
+    pickling. Python 2 pickles arrays as lists of numbers, which is slow
+    for the arrays of tracks passed from the worker processes that decode
+    them to the parent.
+    """
+    return (array, (a.typecode, a.tostring()))
+
+copy_reg.pickle(array, pickle_array)
+
+class GPXError(Exception):
+    """Raised when a GPX file fails the structural check"""
 
 class Track(object):
     """
-    An object representing a track. It holds a reference to a <trk> element
-    and some metadata.
+    An object representing a track. The <trk> element is decoded once into
+    parallel arrays of timestamps (UTC epoch seconds), latitudes, longitudes
+    and elevations, with a mask for points that lack an <ele> element and a
+    list of indices where each <trkseg> starts.
     """
     tid = None
-    trk = None
+    name = None
     tz = timezone('UTC')     # a pytz timezone object
+    tztable = None           # UTC offsets of tz during the track
     starttime = None
     endtime = None
-    distance = None
+    stats = None             # a TrackStats object, calculated on demand
+    pyramid = None           # a TrackPyramid object, calculated on demand
+    chunks = None            # a TrackChunks object, calculated on demand
+    grid = None              # a PointGrid object, calculated on demand
+    density = None           # the levels of a DensityGrid, calculated on demand
 
     def __init__(self, tid, trk=None, tz=None):
         """
-        Initialize the track object and optionally set the 'trk' element and
-        timezone object
+        Initialize the track object and optionally decode the 'trk' element
+        and set the timezone object
         """
         self.tid =  tid
+        self.times = array('d')     # UTC epoch seconds, NaN if missing
+        self.lats = array('d')
+        self.lons = array('d')
+        self.eles = array('d')
+        self.elemask = array('b')   # 1 if the point has an elevation
+        self.segments = array('l')  # index of the first point of each segment
+        self.timestrings = []       # <time> values not decoded yet
         if trk is not None:
             self.set_track(trk)
         if tz is not None:
@@ -57,20 +103,73 @@ class Track(object):
 
     def set_track(self, trk):
         """
-        Setter for the trk attribute
+        Decode all track points from a <trk> element into the arrays
+        """
+        self.name = trk.findtext(ns + 'name')
+        for trkseg in trk.iterfind(ns + 'trkseg'):
+            self.segments.append(len(self))
+            for trkpt in trkseg.iterfind(ns + 'trkpt'):
+                self.append_point(trkpt.get('lat'), trkpt.get('lon'),
+                    trkpt.findtext(ns + 'ele'), trkpt.findtext(ns + 'time'))
+        self.finish()
+
+    def append_point(self, lat, lon, ele=None, time=None):
+        """
+        Append a single track point, given as strings from the GPX file.
+        Timestamps are collected and only decoded by finish().
         """
-        self.trk = trk
+        self.lats.append(float(lat))
+        self.lons.append(float(lon))
+        try:
+            self.eles.append(float(ele))
+            self.elemask.append(1)
+        except (ValueError, TypeError):
+            self.eles.append(0.0)
+            self.elemask.append(0)
+        self.timestrings.append(time)
+
+    def finish(self):
+        """
+        Decode the collected timestamps in bulk, after the last point has
+        been appended
+        """
+        self.times.extend(decode_times(self.timestrings))
+        self.timestrings = []
+        self.starttime = self.endtime = self.tztable = None
+        self.stats = self.pyramid = self.chunks = self.grid = self.density = None
+
+    def __len__(self):
+        """
+        Return the number of track points
+        """
+        return len(self.lats)
+
+    def get_tztable(self):
+        """
+        Return the transition table of the track's timezone, covering the
+        time span of the track. Calculate it if necessary.
+        """
+        if self.tztable is None:
+            valid = [t for t in self.times if t == t]
+            self.tztable = transition_table(self.tz, min(valid), max(valid))
+        return self.tztable
+
+    def get_localtimes(self):
+        """
+        Return an array of the track's timestamps in seconds since the epoch,
+        converted to the local time of the track's timezone
+        """
+        return localize_times(self.times, self.get_tztable())
 
     def parse_timestamps(self):
         """
-        Update data from <time> elements found within the track
+        Update the start and end time from the first and last timestamp
+        found within the track, each converted with its own UTC offset
         """
-        alltimes = self.trk.findall(ns + 'trkseg/' + ns + 'trkpt/' + ns + 'time')
-        starttime = parse_xml_date(alltimes[0].text).replace(tzinfo=None)
-        endtime = parse_xml_date(alltimes[-1].text).replace(tzinfo=None)
-        delta = self.tz.utcoffset(starttime, False)
-        self.starttime = starttime + delta
-        self.endtime = endtime + delta
+        valid = [t for t in self.times if t == t]
+        starttime, endtime = localize_times((valid[0], valid[-1]), self.get_tztable())
+        self.starttime = datetime.utcfromtimestamp(starttime)
+        self.endtime = datetime.utcfromtimestamp(endtime)
 
     def get_timestamps(self):
         """
@@ -88,50 +187,139 @@ class Track(object):
             self.parse_timestamps()
         return self.starttime
 
+    def get_localtime(self, i):
+        """
+        Return the time of a track point as a DateTime in the track's
+        timezone, or None if the point has no timestamp
+        """
+        t = self.times[i]
+        if t != t:
+            return None
+        return datetime.utcfromtimestamp(localize_times((t,), self.get_tztable())[0])
+
     def get_name(self):
         """
         Return the contents of the <name> element if present, or a generated track name
         """
-        return self.trk.findtext(ns + 'name') or \
+        return self.name or \
             self.get_starttime().strftime('%Y-%m-%d %H:%M:%S')
 
-    def get_points(self):
+    def get_pyramid(self):
+        """
+        Return the simplified versions of the track for all zoom levels,
+        calculating them once
+        """
+        if self.pyramid is None:
+            self.pyramid = TrackPyramid(self)
+        return self.pyramid
+
+    def get_chunks(self):
+        """
+        Return the bounding boxes of the track and its chunks, calculating
+        them once
+        """
+        if self.chunks is None:
+            self.chunks = TrackChunks(self)
+        return self.chunks
+
+    def get_grid(self):
         """
-        Return al track points from the track
+        Return the grid of the track points for finding the one nearest to
+        a location, calculating it once
         """
-        return self.trk.findall(ns + 'trkseg/' + ns + 'trkpt')
+        if self.grid is None:
+            self.grid = PointGrid(self)
+        return self.grid
 
-    def trkpt_distance(self, lat1, lon1, lat2, lon2):
+    def get_density(self):
         """
-        Calculate and return the distance in meters between two track points
+        Return the number of track points in the cells of the heatmap grid
+        for all zoom levels, as made by density.aggregate(), calculating
+        them once
         """
-        radius = 6371000 # meter
-        lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+        if self.density is None:
+            self.density = aggregate(bin_points(self.lats, self.lons))
+        return self.density
 
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        a = sin(dlat/2) * sin(dlat/2) + cos(lat1) \
-            * cos(lat2) * sin(dlon/2) * sin(dlon/2)
-        c = 2 * atan2(sqrt(a), sqrt(1-a))
-        d = radius * c
-        return d
+    def get_indices(self, maxpoints=None, zoom=None):
+        """
+        Return a sorted sequence of the indices of the track points to draw.
+        If zoom is given, return the points of the track simplified for that
+        zoom level, or for the highest lower zoom level with no more than
+        maxpoints points. Otherwise, if maxpoints is given and the track is
+        longer, return every n-th point instead, always including the first
+        and last point of every segment.
+        """
+        if zoom is not None:
+            pyramid = self.get_pyramid()
+            zoom = int(zoom)
+            indices = pyramid.level(zoom)
+            while maxpoints is not None and len(indices) > maxpoints and zoom > 0:
+                zoom -= 1
+                indices = pyramid.level(zoom)
+            if maxpoints is None or len(indices) <= maxpoints:
+                return indices
+        if maxpoints is None or len(self) <= maxpoints:
+            return range(len(self))
+        step = -(-len(self) // max(maxpoints, 1))
+        indices = []
+        for start, end in self.get_segments():
+            indices.extend(xrange(start, end, step))
+            if indices and indices[-1] != end - 1:
+                indices.append(end - 1)
+        return indices
+
+    def get_points(self, maxpoints=None, zoom=None, box=None):
+        """
+        Return a list of (lat, lon) tuples for the track points selected by
+        get_indices. If box is given, as a (minlat, minlon, maxlat, maxlon)
+        tuple, leave out the parts of the track outside of it.
+        """
+        if maxpoints is None and zoom is None and box is None:
+            return zip(self.lats, self.lons)
+        indices = self.get_indices(maxpoints, zoom)
+        if box is not None:
+            indices = self.get_chunks().cull(indices, box)
+        return [(self.lats[i], self.lons[i]) for i in indices]
+
+    def get_segments(self):
+        """
+        Return a list of (start, end) index pairs, one for each track segment
+        """
+        bounds = list(self.segments) + [len(self)]
+        return zip(bounds[:-1], bounds[1:])
+
+    def to_element(self):
+        """
+        Compose a <trk> element from the decoded track points
+        """
+        trk = etree.Element(ns + 'trk')
+        if self.name:
+            etree.SubElement(trk, ns + 'name').text = self.name
+        for start, end in self.get_segments():
+            trkseg = etree.SubElement(trk, ns + 'trkseg')
+            for i in xrange(start, end):
+                trkpt = etree.SubElement(trkseg, ns + 'trkpt',
+                    lat=repr(self.lats[i]), lon=repr(self.lons[i]))
+                if self.elemask[i]:
+                    etree.SubElement(trkpt, ns + 'ele').text = repr(self.eles[i])
+                if self.times[i] == self.times[i]:
+                    etree.SubElement(trkpt, ns + 'time').text = from_epoch(self.times[i])
+        return trk
+
+    def get_stats(self):
+        """
+        Return the statistics of the track, calculating them once
+        """
+        if self.stats is None:
+            self.stats = TrackStats(self)
+        return self.stats
 
     def get_distance(self):
         """
-        Calculate the total distance of the track by iterating over all track points
-        """
-        if self.distance is None:
-            distance = 0
-            oldlat = None
-            for trkpt in self.trk.findall(ns + 'trkseg/' + ns + 'trkpt'):
-                lat = float(trkpt.get('lat'))
-                lon = float(trkpt.get('lon'))
-                if oldlat != None:
-                    distance += self.trkpt_distance(oldlat, oldlon, lat, lon)
-                oldlat = lat
-                oldlon = lon
-            self.distance = distance
-        return self.distance
+        Return the total distance of the track in meters
+        """
+        return self.get_stats().distance
 
 class GPXfile(object):
     """
@@ -142,65 +330,183 @@ class GPXfile(object):
     delta = None  # a timedelta object
     tz = None     # a pytz timezone object
     data_dir = '.'
-    tree = etree.ElementTree(etree.fromstring(minimal_xml))
     schemafile = None
-    schema = None
-    xmlparser = None
+    schema = None    # an XMLSchema, compiled on first use
+    validation = VALIDATION_STRICT
+    validated = None # SHA-1 digests of files that passed strict validation
+    validated_file = None
+    cache = None  # a TrackCache
+    cache_dir = None
     ns = '{http://www.topografix.com/GPX/1/1}'
     tracks = {}
+    index = None  # a TimeIndex, built on demand
+    spatial = None  # a SpatialIndex, built on demand from the tracks' grids
+    tids = itertools.count(1)
 
-    def __init__(self, data_dir):
+    def __init__(self, data_dir, cache_dir=None, validation=None):
         """
-        Initialize the object and create an XML parser using the GPX schema
+        Initialize the object. If a cache directory is given, decoded tracks
+        and the digests of validated files are remembered there.
         """
         self.data_dir = data_dir
         self.schemafile = os.path.join(self.data_dir, 'gpx.xsd')
-        self.schema = etree.XMLSchema(file=self.schemafile)
-        self.xmlparser = etree.XMLParser(schema=self.schema)
+        self.cache_dir = cache_dir
+        self.validated = set()
+        if validation is not None:
+            self.validation = validation
+        if cache_dir is not None:
+            with open(self.schemafile, 'rb') as f:
+                version = '%d\n%s' % (PARSER_VERSION, f.read())
+            self.cache = TrackCache(cache_dir, version)
+            self.validated_file = os.path.join(cache_dir,
+                'validated-%s' % self.cache.version_key.encode('hex'))
+            try:
+                with open(self.validated_file) as f:
+                    self.validated.update(line.strip().decode('hex') for line in f)
+            except (IOError, TypeError):
+                pass
+
+    def get_schema(self):
+        """
+        Return the GPX schema, compiling it if necessary
+        """
+        if self.schema is None:
+            self.schema = etree.XMLSchema(file=self.schemafile)
+        return self.schema
+
+    def remember_validated(self, digest):
+        """
+        Remember the digest of a file that passed strict validation
+        """
+        self.validated.add(digest)
+        if self.validated_file is not None:
+            try:
+                with open(self.validated_file, 'a') as f:
+                    f.write(digest.encode('hex') + '\n')
+            except IOError:
+                pass
 
     def import_gpx(self, filename, tz):
         """
-        Read a GPX file from disk and parse it
+        Read a GPX file from disk and parse it, or load its tracks from the
+        cache if the file has been imported before
+        """
+        tracks, msg = self.decode_gpx(filename, tz)
+        if tracks is False:
+            return (False, msg)
+        return self.parse_tracks(tracks)
+
+    def decode_gpx(self, filename, tz):
+        """
+        Return a list of Track objects decoded from a GPX file, without
+        adding them to the loaded tracks, or False and an error
         """
         self.tz = timezone(tz)
         self.delta = None
 
-        # lxml
-        try:
-           tree = etree.parse(filename, self.xmlparser)
-        except etree.XMLSyntaxError as e:
-            return (False, e)
-
-        # Use the first file as skeleton
-        if self.tree is None:
-            self.tree = tree
+        tracks = None
+        level = VALIDATION_LEVELS[self.validation]
+        if self.cache is not None:
+            tracks = self.cache.load(filename, lambda: Track(None, None, self.tz), level)
+
+        if tracks is None:
+            digest = None
+            validation = self.validation
+            # Decode the whole file before adding any tracks, so an invalid
+            # file does not leave half of its tracks behind. A file that
+            # cannot be read is an error like an invalid one, so it does not
+            # abort the import of other files.
+            try:
+                if validation == VALIDATION_STRICT:
+                    digest = file_hash(filename)
+                    if digest in self.validated:
+                        validation = VALIDATION_STRUCTURAL
+                tracks = list(self.iter_tracks(filename, validation))
+            except (etree.XMLSyntaxError, GPXError, IOError, OSError) as e:
+                return (False, e)
+            if self.cache is not None:
+                self.cache.store(filename, tracks, digest, level)
+            if validation == VALIDATION_STRICT:
+                self.remember_validated(digest)
+
+        return (tracks, '')
+
+    def iter_tracks(self, filename, validation=VALIDATION_STRICT):
+        """
+        Stream a GPX file with lxml.etree.iterparse and yield a Track object
+        for every <trk> element. Track points are decoded as soon as they
+        have been read, after which their elements are discarded, so the
+        document is never held in memory as a whole.
+        In strict mode, the file is validated against the GPX schema while
+        parsing. In structural mode, only the root element and the values
+        of track points are checked, and in both cases an invalid file
+        raises an exception. With validation off, unusable track points are
+        skipped.
+        """
+        schema = self.get_schema() if validation == VALIDATION_STRICT else None
+        tobj = None
+        for event, elem in etree.iterparse(filename, events=('start', 'end'), schema=schema):
+            if event == 'start':
+                if elem.tag == ns + 'trk':
+                    tobj = Track(None, None, self.tz)
+                elif elem.tag == ns + 'trkseg' and tobj is not None:
+                    tobj.segments.append(len(tobj))
+                elif elem.getparent() is None and elem.tag != ns + 'gpx' \
+                        and validation == VALIDATION_STRUCTURAL:
+                    raise GPXError("Root element is %s, expected %sgpx" % (elem.tag, ns))
+                continue
+            if elem.tag == ns + 'trkpt' and tobj is not None:
+                try:
+                    self.check_trkpt(elem)
+                    tobj.append_point(elem.get('lat'), elem.get('lon'),
+                        elem.findtext(ns + 'ele'), elem.findtext(ns + 'time'))
+                except GPXError:
+                    if validation != VALIDATION_OFF:
+                        raise
+            elif elem.tag == ns + 'name' and elem.getparent().tag == ns + 'trk':
+                tobj.name = elem.text
+            elif elem.tag == ns + 'trk':
+                tobj.finish()
+                yield tobj
+                tobj = None
+            elif elem.getparent() is None or elem.getparent().tag != ns + 'gpx':
+                continue
+            # Free a decoded <trkpt> or top level element and its predecessors
+            elem.clear()
+            parent = elem.getparent()
+            while elem.getprevious() is not None:
+                del parent[0]
 
-        root = tree.getroot()
-        return self.parse_tracks(root)
+    def check_trkpt(self, trkpt):
+        """
+        Check the values of a <trkpt> element that Taggert uses and raise a
+        GPXError if any of them is invalid
+        """
+        try:
+            lat = float(trkpt.get('lat'))
+            lon = float(trkpt.get('lon'))
+            ele = trkpt.findtext(ns + 'ele')
+            if ele is not None:
+                float(ele)
+        except (ValueError, TypeError):
+            raise GPXError("Invalid track point on line %d" % trkpt.sourceline)
+        if not (-90.0 <= lat <= 90.0 and -180.0 <= lon < 180.0):
+            raise GPXError("Track point out of range on line %d" % trkpt.sourceline)
 
-    def parse_tracks(self, root):
+    def parse_tracks(self, tracks):
         """
-        Parse <trk> elements from a given XML tree, create Track instances
-        for them and store references.
-        Make sure the list of parsed tracks does not grow larger than 40,
-        because it leads to a 'Bus Error', crashing the program.
+        Store references to newly decoded Track objects and assign ids to them.
         """
-        dest_root = self.tree.getroot()
         ids = []
-        tracks = root.findall(ns + 'trk')
         msg = ''
-        for trk in tracks:
-            if len(self.tracks) >= 40:
-                msg = 'Track list too long'
-                break
-            # Copy the <trk> element to the XML tree
-            trk2 = copy.deepcopy(trk)
-            dest_root.append(trk2)
-            # Compose a Track object
-            tid = id(trk2)
-            tobj = Track(tid, trk2, self.tz)
+        for tobj in tracks:
+            # Skip tracks without any timestamps
+            if not any(t == t for t in tobj.times):
+                continue
+            tid = tobj.tid = next(self.tids)
             self.tracks[tid] = tobj
             ids.append(tid)
+        self.index = self.spatial = None
         # Return a list of newly added track ids
         return (ids, msg)
 
@@ -212,13 +518,11 @@ class GPXfile(object):
 
     def remove_track(self, tid):
         """
-        Remove a track from the XML tree and from the reference-dictionary
+        Remove a track from the reference-dictionary
         """
         if tid in self.tracks:
-            trk = self.tracks[tid].trk
-            root = self.tree.getroot()
-            root.remove(trk)
             del self.tracks[tid]
+            self.index = self.spatial = None
 
     def save_gpx(self, fname=None):
         """
@@ -226,40 +530,90 @@ class GPXfile(object):
         """
         if fname is None:
             fname = 'zzzzzzzzzzz.gpx'
-        self.tree.write(fname, xml_declaration = True, encoding='utf-8')
+        tree = etree.ElementTree(etree.fromstring(minimal_xml))
+        root = tree.getroot()
+        for tobj in sorted(self.tracks.values(), key=lambda t: t.get_starttime()):
+            root.append(tobj.to_element())
+        tree.write(fname, xml_declaration = True, encoding='utf-8')
 
     def find_coordinates(self, dt):
         """
         Find a coordinate for a given DateTime, used for tagging images
         """
-        lat = lon = None
-        ele = 0.0
-        latx = lonx = elex = None
-        for tid, tobj in self.tracks.iteritems():
-            if dt >= tobj.starttime and dt <= tobj.endtime:
-                for p in tobj.get_points():
-                    try:
-                        if latx is None:
-                            latx = float(p.get('lat'))
-                            lonx = float(p.get('lon'))
-                            elex = float(p.findtext(ns + 'ele'))
-                        t0 = parse_xml_date(p.findtext(ns + 'time')).replace(tzinfo=None)
-                        delta = self.tz.utcoffset(t0, False)
-                        t0 += delta
-                        if t0 > dt:
-                            lat = (latx + float(p.get('lat'))) / 2
-                            lon = (lonx + float(p.get('lon'))) / 2
-                            ele = (elex + float(p.findtext(ns + 'ele'))) / 2
-                            break
-                        else:
-                            latx = float(p.get('lat'))
-                            lonx = float(p.get('lon'))
-                            elex = float(p.findtext(ns + 'ele'))
-                    except Exception:
-                        latx = lonx = elex = None
-                        pass
-
-        return (lat,lon,ele)
+        lats, lons, eles, nomatch = self.find_coordinates_batch([dt])
+        if nomatch[0]:
+            return (None, None, 0.0)
+        return (lats[0], lons[0], eles[0])
+
+    def find_coordinates_batch(self, datetimes):
+        """
+        Find coordinates for a list of DateTimes in one pass, used for tagging
+        images. Coordinates are interpolated linearly in time between the
+        track points recorded just before and just after each DateTime.
+        Return arrays of latitudes, longitudes and elevations and an array
+        of flags that are set for DateTimes without a match.
+        """
+        lats = array('d')
+        lons = array('d')
+        eles = array('d')
+        nomatch = array('b')
+        if self.index is None:
+            self.index = TimeIndex(self.tracks)
+        for found in self.index.lookup_batch(datetimes):
+            if found is None:
+                lats.append(NAN)
+                lons.append(NAN)
+                eles.append(0.0)
+                nomatch.append(1)
+                continue
+            tobj, i, j, w = found
+            lats.append(tobj.lats[i] + (tobj.lats[j] - tobj.lats[i]) * w)
+            lons.append(tobj.lons[i] + (tobj.lons[j] - tobj.lons[i]) * w)
+            if tobj.elemask[i] and tobj.elemask[j]:
+                eles.append(tobj.eles[i] + (tobj.eles[j] - tobj.eles[i]) * w)
+            elif tobj.elemask[i] or tobj.elemask[j]:
+                eles.append(tobj.eles[i] if tobj.elemask[i] else tobj.eles[j])
+            else:
+                eles.append(0.0)
+            nomatch.append(0)
+        return (lats, lons, eles, nomatch)
+
+    def find_nearest_point(self, lat, lon, radius):
+        """
+        Find the track point nearest to a location, used for snapping clicks
+        on the map to tracks. Return a tuple of the Track object and the index
+        of the point, or None if no point is within 'radius' meters.
+        """
+        if self.spatial is None:
+            self.spatial = SpatialIndex(self.tracks)
+        return self.spatial.nearest(lat, lon, radius)
+
+worker_gpx = None   # the GPXfile object of a worker process
+
+def decode_gpx_worker(args):
+    """
+    Decode a GPX file in a worker process, for use with multiprocessing.Pool.
+    The argument is a tuple of the data directory, the cache directory, the
+    validation mode, the file name and the name of the timezone. Return a
+    tuple of the file name and the result of GPXfile.decode_gpx, with
+    errors converted to strings so they can be passed back to the parent.
+    """
+    global worker_gpx
+    data_dir, cache_dir, validation, filename, tz = args
+    if worker_gpx is None:
+        worker_gpx = GPXfile(data_dir, cache_dir)
+    worker_gpx.validation = validation
+    tracks, msg = worker_gpx.decode_gpx(filename, tz)
+    # Simplify, index, measure and bin the tracks here as well, rather than
+    # in the parent. All but the chunks are stored in and loaded from the
+    # track cache, if there is one.
+    for tobj in tracks or []:
+        tobj.get_pyramid()
+        tobj.get_chunks()
+        tobj.get_grid()
+        tobj.get_stats()
+        tobj.get_density()
+    return (filename, tracks, str(msg))
 
 class Bookmarksfile(object):
     """
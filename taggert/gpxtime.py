@@ -0,0 +1,129 @@
+#   Copyright 2014 Martijn Grendelman <m@rtijn.net>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""gpxtime module, defines functions for converting GPX timestamps"""
+
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+import calendar
+
+from iso8601 import parse_date as parse_xml_date
+
+NAN = float('nan')
+INF = float('inf')
+
+# Epoch values of the transition times of pytz timezones, by zone name
+transitions = {}
+
+def to_epoch(dt):
+    """
+    Convert an aware datetime to a floating point number of seconds since the
+    epoch (UTC)
+    """
+    return calendar.timegm(dt.utctimetuple()) + dt.microsecond / 1e6
+
+def from_epoch(t):
+    """
+    Format a number of seconds since the epoch as a GPX <time> string
+    """
+    dt = datetime.utcfromtimestamp(t)
+    if dt.microsecond:
+        return dt.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+    return dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def decode_time(s):
+    """
+    Convert a single timestamp string of any ISO 8601 form to seconds since
+    the epoch, or NaN if it cannot be parsed
+    """
+    try:
+        return to_epoch(parse_xml_date(s))
+    except Exception:
+        return NAN
+
+def decode_times(strings):
+    """
+    Convert a list of GPX timestamp strings to an array of seconds since the
+    epoch. Strings of the form YYYY-MM-DDTHH:MM:SS(.fff)Z are decoded
+    directly, looking up the epoch value of the minute they fall in from a
+    cache, without creating datetime objects. Anything else is handed to
+    iso8601.parse_date. Missing or invalid timestamps become NaN.
+    """
+    times = array('d')
+    minutes = {}
+    for s in strings:
+        try:
+            if s[16] != ':' or s[-1] != 'Z':
+                raise ValueError
+            base = minutes.get(s[:16])
+            if base is None:
+                if s[4] != '-' or s[7] != '-' or s[10] != 'T' or s[13] != ':':
+                    raise ValueError
+                base = minutes[s[:16]] = calendar.timegm(datetime(
+                    int(s[0:4]), int(s[5:7]), int(s[8:10]),
+                    int(s[11:13]), int(s[14:16])).timetuple())
+            sec = s[17:19]
+            if not sec.isdigit():
+                raise ValueError
+            if len(s) == 20:
+                times.append(base + int(sec))
+            elif s[19] == '.' and s[20:-1].isdigit():
+                times.append(base + float(s[17:-1]))
+            else:
+                raise ValueError
+        except (ValueError, TypeError, IndexError):
+            times.append(decode_time(s))
+    return times
+
+def transition_table(tz, start, end):
+    """
+    Return the UTC offsets of a pytz timezone between two epoch timestamps,
+    as a tuple of two arrays: the instants (epoch seconds) from which each
+    offset applies and the offsets in seconds. The first instant is never
+    later than start, so every timestamp in the range is covered.
+    """
+    utc_transitions = getattr(tz, '_utc_transition_times', None)
+    if not utc_transitions:
+        # A timezone with a fixed offset
+        offset = tz.utcoffset(datetime.utcfromtimestamp(start))
+        return (array('d', [start]), array('d', [offset.total_seconds()]))
+    if tz.zone not in transitions:
+        transitions[tz.zone] = array('d',
+            (calendar.timegm(t.timetuple()) for t in utc_transitions))
+    instants = transitions[tz.zone]
+    i = max(bisect_right(instants, start) - 1, 0)
+    j = max(bisect_right(instants, end), i + 1)
+    offsets = array('d', (info[0].total_seconds() for info in tz._transition_info[i:j]))
+    return (instants[i:j], offsets)
+
+def localize_times(times, table):
+    """
+    Convert an array of epoch timestamps to local time by adding the UTC
+    offset that applies to each of them, taken from a transition table.
+    Timestamps are usually in ascending order, so the table is only searched
+    when a timestamp falls outside the interval of the previous one.
+    """
+    instants, offsets = table
+    local = array('d')
+    k = 0
+    lo = instants[0]
+    hi = instants[1] if len(instants) > 1 else INF
+    for t in times:
+        if not lo <= t < hi:
+            k = max(bisect_right(instants, t) - 1, 0)
+            lo = instants[k]
+            hi = instants[k+1] if k + 1 < len(instants) else INF
+        local.append(t + offsets[k])
+    return local
@@ -0,0 +1,279 @@
+#   Copyright 2014 Martijn Grendelman <m@rtijn.net>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""imagecatalog module, defines the ImageCatalog class"""
+
+from datetime import datetime
+import fnmatch
+import os
+import sqlite3
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir     # the scandir backport is optional
+    except ImportError:
+        scandir = None
+
+SCHEMA_VERSION = 1
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Number of names looked up per query, below SQLite's limit of 999 parameters
+LOOKUP_CHUNK = 500
+
+# The columns of a lookup, followed by a WHERE clause
+SELECT = '''SELECT name, size, mtime, readable, camera, datetime, orientation,
+    latitude, longitude, elevation FROM images '''
+
+# Extensions of the image files that are read, in lower case
+IMAGE_EXTENSIONS = frozenset([
+    '.jpg', '.jpeg', '.jpe', '.tif', '.tiff', '.png', '.webp', '.jp2', '.psd',
+    '.dng', '.nef', '.nrw', '.cr2', '.crw', '.orf', '.pef', '.arw', '.sr2',
+    '.srw', '.rw2', '.raf', '.mrw', '.3fr', '.kdc', '.erf', '.mos', '.exv'])
+# Extensions of raw files, which Lightroom keeps the XMP of in a sidecar
+# with their extension replaced by .xmp, instead of in the file itself
+RAW_EXTENSIONS = frozenset([
+    '.nef', '.nrw', '.cr2', '.crw', '.orf', '.pef', '.arw', '.sr2', '.srw',
+    '.rw2', '.raf', '.mrw', '.3fr', '.kdc', '.erf', '.mos'])
+# First bytes of image files, for files without an extension
+IMAGE_MAGIC = ('\xff\xd8\xff', 'II*\x00', 'MM\x00*', '\x89PNG')
+# Extension of XMP sidecar files
+SIDECAR_EXTENSION = '.xmp'
+
+def is_image_name(path):
+    """
+    Return True if a file name may be that of an image file: it has an
+    image extension, or no extension at all
+    """
+    ext = os.path.splitext(path)[1].lower()
+    return not ext or ext in IMAGE_EXTENSIONS
+
+def is_image(path):
+    """
+    Return True if a file is an image file, judging by its extension. Only
+    files without an extension are opened, to look at their first bytes.
+    """
+    if os.path.splitext(path)[1]:
+        return is_image_name(path)
+    try:
+        with open(path, 'rb') as f:
+            return f.read(4).startswith(IMAGE_MAGIC)
+    except IOError:
+        return False
+
+def is_raw_name(path):
+    """
+    Return True if a file name is that of a raw file
+    """
+    return os.path.splitext(path)[1].lower() in RAW_EXTENSIONS
+
+def sidecar_names(path):
+    """
+    Return the names an XMP sidecar of an image file can have: the image
+    name with .xmp appended (darktable), and for raw files, the image name
+    with its extension replaced by .xmp (Lightroom). A JPEG shot along with
+    a raw file has the same name without extension, but not its sidecar.
+    """
+    if is_raw_name(path):
+        return (path + SIDECAR_EXTENSION, os.path.splitext(path)[0] + SIDECAR_EXTENSION)
+    return (path + SIDECAR_EXTENSION,)
+
+def find_sidecar(path, names=None):
+    """
+    Return the path of the XMP sidecar of an image file, or None if it has
+    none. If a set of the names in the image's directory is given, it is
+    used instead of looking at the file system.
+    """
+    for sidecar in sidecar_names(path):
+        if names is None:
+            if os.path.isfile(sidecar):
+                return sidecar
+        elif os.path.basename(sidecar) in names:
+            return sidecar
+    return None
+
+def stat_image(path, names=None):
+    """
+    Return the size and modification time of an image file as used in the
+    catalog: the modification time is that of its XMP sidecar if that is
+    newer, so writing a sidecar invalidates the catalog entry of the image.
+    See find_sidecar for 'names'.
+    """
+    st = os.stat(path)
+    mtime = st.st_mtime
+    sidecar = find_sidecar(path, names)
+    if sidecar:
+        try:
+            mtime = max(mtime, os.stat(sidecar).st_mtime)
+        except OSError:
+            pass
+    return (st.st_size, mtime)
+
+def list_dir(path):
+    """
+    Return a list of (name, is_dir) tuples for the entries of a directory,
+    where symbolic links to directories don't count as directories. With
+    scandir, the type comes from the directory entry, without a stat.
+    """
+    if scandir is None:
+        result = []
+        for name in os.listdir(path):
+            full = os.path.join(path, name)
+            result.append((name, os.path.isdir(full) and not os.path.islink(full)))
+        return result
+    return [(entry.name, entry.is_dir(follow_symlinks=False)) for entry in scandir(path)]
+
+def list_files(directory, depth=0, exclude=(), dirs=None):
+    """
+    Return a sorted list of (name, size, mtime) tuples for the image files
+    in a directory, and in its subdirectories down to 'depth' levels, or
+    all levels if depth is negative. Names are relative to the directory.
+    Files and directories whose name matches one of the shell patterns in
+    'exclude' are skipped, as are files that is_image() rejects. The mtime
+    is that of stat_image, which takes XMP sidecars into account. The
+    relative names of the directories that were listed, '' for the
+    directory itself, are appended to 'dirs' if given.
+    """
+    files = []
+    pending = [('', 0)]
+    while pending:
+        prefix, level = pending.pop()
+        try:
+            entries = list_dir(os.path.join(directory, prefix))
+        except OSError:
+            continue
+        if dirs is not None:
+            dirs.append(prefix)
+        names = set(name for name, _is_dir in entries)
+        for name, is_dir in entries:
+            if any(fnmatch.fnmatch(name, pattern) for pattern in exclude):
+                continue
+            relname = os.path.join(prefix, name)
+            if is_dir:
+                if depth < 0 or level < depth:
+                    pending.append((relname, level + 1))
+                continue
+            path = os.path.join(directory, relname)
+            if not is_image(path):
+                continue
+            try:
+                size, mtime = stat_image(path, names)
+            except OSError:
+                continue
+            files.append((relname, size, mtime))
+    files.sort()
+    return files
+
+class ImageCatalog(object):
+    """
+    A SQLite database of the metadata of image files, as returned by
+    imagescan.read_metadata. An entry is valid for a file with the same
+    path, size and modification time, as returned by stat_image. Files
+    that could not be read are remembered as well, so they are not tried
+    again. All entries are dropped when SCHEMA_VERSION changes.
+    """
+
+    def __init__(self, filename):
+        """
+        Open or create the catalog database
+        """
+        self.db = sqlite3.connect(filename)
+        self.db.text_factory = str
+        version = self.db.execute('PRAGMA user_version').fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self.db.execute('DROP TABLE IF EXISTS images')
+            self.db.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS images (
+            directory TEXT, name TEXT, size INTEGER, mtime REAL,
+            readable INTEGER, camera TEXT, datetime TEXT, orientation INTEGER,
+            latitude REAL, longitude REAL, elevation REAL,
+            PRIMARY KEY (directory, name))''')
+        self.db.commit()
+
+    def lookup(self, directory, files):
+        """
+        Look up a list of (name, size, mtime) tuples from list_files in the
+        catalog. Return a list of the metadata of the readable files that
+        have a valid entry, and a list of the tuples of the files that have
+        to be read. All entries of the directory are read at once, which
+        suits a list of all its files.
+        """
+        return self.match(self.db.execute(SELECT + 'WHERE directory = ?', (directory,)), files)
+
+    def lookup_names(self, directory, files):
+        """
+        Like lookup(), but only read the entries of the files themselves,
+        which suits a few files, such as the ones the DirectoryWatcher
+        reports, in a large directory
+        """
+        names = [f[0] for f in files]
+        rows = []
+        for i in xrange(0, len(names), LOOKUP_CHUNK):
+            chunk = names[i:i + LOOKUP_CHUNK]
+            rows.extend(self.db.execute(SELECT + 'WHERE directory = ? AND name IN (%s)' %
+                ','.join('?' * len(chunk)), [directory] + chunk))
+        return self.match(rows, files)
+
+    def match(self, rows, files):
+        """
+        Return the result of a lookup of files, given the catalog rows
+        selected for them
+        """
+        rows = dict((row[0], row) for row in rows)
+        images = []
+        unknown = []
+        for f in files:
+            row = rows.get(f[0])
+            if row is None or (row[1], row[2]) != f[1:]:
+                unknown.append(f)
+            elif row[3]:
+                name, _size, _mtime, _readable, camera, dt, rot, lat, lon, ele = row
+                images.append((name, camera,
+                    datetime.strptime(dt, DATETIME_FORMAT) if dt else None, rot,
+                    '' if lat is None else lat, '' if lon is None else lon,
+                    '' if ele is None else ele))
+        return (images, unknown)
+
+    def store(self, directory, f, image):
+        """
+        Store the metadata of a file, given its (name, size, mtime) tuple
+        and the result of imagescan.read_metadata
+        """
+        name, size, mtime = f
+        if image is None:
+            values = (directory, name, size, mtime, 0, None, None, None, None, None, None)
+        else:
+            _name, camera, dtobj, rot, lat, lon, ele = image
+            values = (directory, name, size, mtime, 1, camera,
+                dtobj.strftime(DATETIME_FORMAT) if dtobj else None, rot,
+                None if lat == '' else lat, None if lon == '' else lon,
+                None if ele == '' else ele)
+        self.db.execute('INSERT OR REPLACE INTO images VALUES (?,?,?,?,?,?,?,?,?,?,?)', values)
+
+    def update_location(self, directory, name, lat, lon, ele):
+        """
+        Update the geotag of a file after it was written to the file or its
+        XMP sidecar, which changes its size or modification time. Pass None
+        to remove it.
+        """
+        size, mtime = stat_image(os.path.join(directory, name))
+        self.db.execute('''UPDATE images SET size = ?, mtime = ?, latitude = ?,
+            longitude = ?, elevation = ? WHERE directory = ? AND name = ?''',
+            (size, mtime, lat, lon, ele, directory, name))
+
+    def commit(self):
+        """
+        Write the changes since the last commit to disk
+        """
+        self.db.commit()
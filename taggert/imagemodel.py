@@ -0,0 +1,567 @@
+#   Copyright 2014 Martijn Grendelman <m@rtijn.net>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""imagemodel module, defines the ImageListModel class"""
+
+from array import array
+from datetime import datetime, timedelta
+
+from gi.repository import GObject
+from gi.repository import Gtk
+
+import constants
+
+cols = constants.images.columns
+
+NAN = float('nan')
+EPOCH = datetime(1970, 1, 1)
+
+# Column types, the same as those of the GtkListStore this model replaced
+COLUMN_TYPES = {
+    cols.filename:  GObject.TYPE_STRING,
+    cols.datetime:  GObject.TYPE_STRING,
+    cols.rotation:  GObject.TYPE_PYOBJECT,
+    cols.latitude:  GObject.TYPE_STRING,
+    cols.longitude: GObject.TYPE_STRING,
+    cols.modified:  GObject.TYPE_BOOLEAN,
+    cols.camera:    GObject.TYPE_STRING,
+    cols.dtobject:  GObject.TYPE_PYOBJECT,
+    cols.elevation: GObject.TYPE_STRING,
+}
+
+def to_float(value):
+    """
+    Return a coordinate or elevation as a float, NaN if it's missing ('')
+    """
+    return NAN if value == '' or value is None else float(value)
+
+def format_float(value, fmt):
+    """
+    Return a float formatted for the images list, '' if it's NaN
+    """
+    return '' if value != value else fmt % value
+
+def is_untagged(model, row):
+    """
+    Filter for images without a geotag, or with changes that aren't saved
+    """
+    lat = model.lats[row]
+    lon = model.lons[row]
+    return lat != lat or lon != lon or model.modified[row]
+
+def is_modified(model, row):
+    """
+    Filter for images with changes that aren't saved
+    """
+    return model.modified[row]
+
+def from_camera(camera):
+    """
+    Return a filter for images from a camera model
+    """
+    def match(model, row):
+        return model.camera_names[model.cameras[row]] == camera
+    return match
+
+def taken_between(start, end):
+    """
+    Return a filter for images with an EXIF DateTime from 'start' up to,
+    but not including, 'end'
+    """
+    t0 = (start - EPOCH).total_seconds()
+    t1 = (end - EPOCH).total_seconds()
+    def match(model, row):
+        return t0 <= model.times[row] < t1
+    return match
+
+class ImageListModel(GObject.Object, Gtk.TreeModel, Gtk.TreeSortable):
+    """
+    The flat list of images shown in the images Gtk.TreeView, with the
+    columns of constants.images.columns. Instead of a row of Python objects
+    per image, every column is a typed array: coordinates and elevations
+    are floats, NaN if missing, times are seconds since the epoch and
+    camera models are indexes into a list of unique names. The strings the
+    view shows are made when it asks for them, so only for visible rows.
+
+    Rows are identified by their index in the arrays, which their iterators
+    carry, so iterators stay valid while rows are sorted, added or removed.
+    The display order is an array of row indexes, which is sorted by the
+    values of the sort column rather than by moving rows around. Rows with
+    the same value are sorted by index, so the position of a row can always
+    be found by a binary search.
+
+    The model holds all images, but only shows the ones that pass all of
+    its filters, functions like is_untagged that take the model and a row.
+    Rows that are hidden keep their iterators and values.
+    """
+    __gtype_name__ = 'TaggertImageListModel'
+
+    def __init__(self, sort_column=cols.filename, sort_order=Gtk.SortType.ASCENDING,
+                 filters=None):
+        """
+        Initialize an empty model, sorted by the specified column and with
+        a dict of filters
+        """
+        GObject.Object.__init__(self)
+        self.stamp = 1
+        self.sort_column = sort_column
+        self.sort_order = sort_order
+        self.filters = dict(filters or {})  # name -> filter function
+        self.names = []             # None for removed rows
+        self.times = array('d')
+        self.rotations = array('b')
+        self.lats = array('d')
+        self.lons = array('d')
+        self.eles = array('d')
+        self.cameras = array('l')
+        self.modified = array('b')
+        self.shown = array('b')     # 1 for rows that pass the filters
+        self.camera_names = []
+        self.camera_ids = {}
+        self.order = array('l')     # indexes of the shown rows in display order
+        self.positions = array('l') # last known display position of every row
+
+    # Access to rows
+
+    def make_iter(self, row):
+        """
+        Return a Gtk.TreeIter for a row. user_data is offset by one, because
+        a NULL pointer makes an invalid iterator.
+        """
+        it = Gtk.TreeIter()
+        it.stamp = self.stamp
+        it.user_data = row + 1
+        return it
+
+    def iter_row(self, it):
+        """
+        Return the row of a Gtk.TreeIter
+        """
+        return it.user_data - 1
+
+    def position(self, row):
+        """
+        Return the display position of a shown row. Positions are remembered
+        and not updated when rows are inserted or deleted before them, a
+        position that turns out to be stale is looked up again.
+        """
+        pos = self.positions[row]
+        if not (0 <= pos < len(self.order) and self.order[pos] == row):
+            pos = self.positions[row] = self.insert_position(row)
+        return pos
+
+    def reset_positions(self):
+        """
+        Remember the display positions of all rows, after sorting
+        """
+        self.positions = array('l', [-1]) * len(self.names)
+        for pos, row in enumerate(self.order):
+            self.positions[row] = pos
+
+    def visible(self, row):
+        """
+        Return True if a row passes all filters
+        """
+        for func in self.filters.itervalues():
+            if not func(self, row):
+                return False
+        return True
+
+    def camera_id(self, camera):
+        """
+        Return the index of a camera model in camera_names, adding it if
+        it's new
+        """
+        cid = self.camera_ids.get(camera)
+        if cid is None:
+            cid = self.camera_ids[camera] = len(self.camera_names)
+            self.camera_names.append(camera)
+        return cid
+
+    def sort_key(self):
+        """
+        Return a function that gives the value of the sort column of a row,
+        for sorting. Missing values sort first.
+        """
+        col = self.sort_column
+        if col == cols.filename:
+            return self.names.__getitem__
+        elif col == cols.camera:
+            names = self.camera_names
+            cameras = self.cameras
+            return lambda row: names[cameras[row]]
+        elif col == cols.rotation:
+            return self.rotations.__getitem__
+        elif col == cols.modified:
+            return self.modified.__getitem__
+        elif col in (cols.datetime, cols.dtobject):
+            values = self.times
+        elif col == cols.latitude:
+            values = self.lats
+        elif col == cols.longitude:
+            values = self.lons
+        elif col == cols.elevation:
+            values = self.eles
+        else:
+            # Unsorted: in the order the rows were added
+            return int
+        def key(row):
+            value = values[row]
+            return float('-inf') if value != value else value
+        return key
+
+    def order_key(self):
+        """
+        Return a function that gives the place of a row in the sort order,
+        see sort_key, with rows with the same value ordered by index
+        """
+        key = self.sort_key()
+        return lambda row: (key(row), row)
+
+    def insert_position(self, row):
+        """
+        Return the display position of a row in the sort order: where it
+        is, for a shown row whose sort value did not change since it was
+        placed, or where it should be inserted otherwise
+        """
+        key = self.order_key()
+        order = self.order
+        value = key(row)
+        descending = self.sort_order == Gtk.SortType.DESCENDING
+        lo = 0
+        hi = len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            other = key(order[mid])
+            if (other > value) if descending else (other < value):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def get_cell(self, row, column):
+        """
+        Return the value of a column of a row, formatted like the images list
+        shows it
+        """
+        if column == cols.filename:
+            return self.names[row]
+        elif column == cols.datetime:
+            dt = self.get_datetime(row)
+            return dt.strftime("%Y-%m-%d %H:%M:%S") if dt else ''
+        elif column == cols.dtobject:
+            return self.get_datetime(row)
+        elif column == cols.rotation:
+            return self.rotations[row]
+        elif column == cols.latitude:
+            return format_float(self.lats[row], "%.5f")
+        elif column == cols.longitude:
+            return format_float(self.lons[row], "%.5f")
+        elif column == cols.elevation:
+            return format_float(self.eles[row], "%.2f")
+        elif column == cols.modified:
+            return bool(self.modified[row])
+        elif column == cols.camera:
+            return self.camera_names[self.cameras[row]]
+
+    def get_datetime(self, row):
+        """
+        Return the EXIF DateTime of a row as a DateTime, or None
+        """
+        t = self.times[row]
+        return None if t != t else EPOCH + timedelta(seconds=t)
+
+    def set_cell(self, row, column, value):
+        """
+        Set the value of a column of a row, taking the values add_image and
+        the tagging functions use for the images list
+        """
+        if column == cols.filename:
+            self.names[row] = value
+        elif column == cols.dtobject:
+            self.times[row] = NAN if value is None else (value - EPOCH).total_seconds()
+        elif column == cols.rotation:
+            self.rotations[row] = int(value)
+        elif column == cols.latitude:
+            self.lats[row] = to_float(value)
+        elif column == cols.longitude:
+            self.lons[row] = to_float(value)
+        elif column == cols.elevation:
+            self.eles[row] = to_float(value)
+        elif column == cols.modified:
+            self.modified[row] = bool(value)
+        elif column == cols.camera:
+            self.cameras[row] = self.camera_id(value or '')
+        # cols.datetime is derived from cols.dtobject
+
+    # Public API, like that of Gtk.ListStore
+
+    def append(self, name, dtobj, rot, lat, lon, ele, camera, modified=False):
+        """
+        Add an image at its place in the sort order and return its
+        iterator. Coordinates and the elevation may be floats or strings,
+        and '' if missing.
+        """
+        row = len(self.names)
+        self.names.append(name)
+        self.times.append(NAN if dtobj is None else (dtobj - EPOCH).total_seconds())
+        self.rotations.append(int(rot))
+        self.lats.append(to_float(lat))
+        self.lons.append(to_float(lon))
+        self.eles.append(to_float(ele))
+        self.cameras.append(self.camera_id(camera or ''))
+        self.modified.append(bool(modified))
+        self.shown.append(self.visible(row))
+        self.positions.append(-1)
+        it = self.make_iter(row)
+        if self.shown[row]:
+            pos = self.positions[row] = self.insert_position(row)
+            self.order.insert(pos, row)
+            self.row_inserted(Gtk.TreePath(pos), it)
+        return it
+
+    def update(self, it, dtobj, rot, lat, lon, ele, camera, modified=False):
+        """
+        Replace the values of an image, see append()
+        """
+        row = self.iter_row(it)
+        pos = self.position(row) if self.shown[row] else None
+        self.set_row(row, dtobj, rot, lat, lon, ele, camera, modified)
+        self.row_updated(row, pos)
+
+    def set_row(self, row, dtobj, rot, lat, lon, ele, camera, modified):
+        """
+        Set all values of a row except its name
+        """
+        self.set_cell(row, cols.dtobject, dtobj)
+        self.set_cell(row, cols.rotation, rot)
+        self.set_cell(row, cols.latitude, lat)
+        self.set_cell(row, cols.longitude, lon)
+        self.set_cell(row, cols.elevation, ele)
+        self.set_cell(row, cols.camera, camera)
+        self.set_cell(row, cols.modified, modified)
+
+    def set_value(self, it, column, value):
+        """
+        Set the value of a column, like Gtk.ListStore.set_value. This is
+        also what model[iter][column] = value calls.
+        """
+        row = self.iter_row(it)
+        pos = self.position(row) if self.shown[row] else None
+        self.set_cell(row, column, value)
+        self.row_updated(row, pos)
+
+    def set(self, it, values):
+        """
+        Set the values of several columns at once, given as a dict of
+        column numbers to values, like Gtk.ListStore.set. The view is told
+        about the change once, and the filters only see the row with all
+        new values, so a row doesn't disappear halfway, losing its
+        selection, when it's tagged while only untagged images are shown.
+        """
+        row = self.iter_row(it)
+        pos = self.position(row) if self.shown[row] else None
+        for column, value in values.iteritems():
+            self.set_cell(row, column, value)
+        self.row_updated(row, pos)
+
+    def row_updated(self, row, pos):
+        """
+        Move a row whose values changed to its place in the sort order, and
+        tell the view it changed. Show or hide it if that changed whether it
+        passes the filters. pos is the display position of the row before
+        its values changed, None if it wasn't shown.
+        """
+        if not self.visible(row):
+            if self.shown[row]:
+                del self.order[pos]
+                self.shown[row] = False
+                self.row_deleted(Gtk.TreePath(pos))
+            return
+        if not self.shown[row]:
+            self.shown[row] = True
+            pos = self.positions[row] = self.insert_position(row)
+            self.order.insert(pos, row)
+            self.row_inserted(Gtk.TreePath(pos), self.make_iter(row))
+            return
+        n = len(self.order)
+        key = self.order_key()
+        value = key(row)
+        descending = self.sort_order == Gtk.SortType.DESCENDING
+        def before(a, b):
+            return (a > b) if descending else (a < b)
+        if (pos > 0 and before(value, key(self.order[pos - 1]))) or \
+                (pos < n - 1 and before(key(self.order[pos + 1]), value)):
+            del self.order[pos]
+            new = self.insert_position(row)
+            self.order.insert(new, row)
+            # new_order[i] is the old position of the row now at position i
+            if new < pos:
+                new_order = range(new) + [pos] + range(new, pos) + range(pos + 1, n)
+            else:
+                new_order = range(pos) + range(pos + 1, new + 1) + [pos] + range(new + 1, n)
+            self.rows_reordered(Gtk.TreePath.new(), None, new_order)
+            pos = new
+        self.positions[row] = pos
+        self.row_changed(Gtk.TreePath(pos), self.make_iter(row))
+
+    def remove(self, it):
+        """
+        Remove an image
+        """
+        row = self.iter_row(it)
+        self.names[row] = None
+        if self.shown[row]:
+            pos = self.position(row)
+            del self.order[pos]
+            self.shown[row] = False
+            self.row_deleted(Gtk.TreePath(pos))
+
+    def __len__(self):
+        """
+        Return the number of images that are shown
+        """
+        return len(self.order)
+
+    def is_shown(self, it):
+        """
+        Return True if an image is shown, i.e. passes the filters
+        """
+        return bool(self.shown[self.iter_row(it)])
+
+    def get_location(self, it):
+        """
+        Return the (latitude, longitude) of an image as floats, or None if
+        it has no geotag
+        """
+        row = self.iter_row(it)
+        lat = self.lats[row]
+        lon = self.lons[row]
+        return None if lat != lat or lon != lon else (lat, lon)
+
+    def set_filter(self, name, func):
+        """
+        Set a named filter function, or remove it if func is None. Call
+        refilter() afterwards.
+        """
+        if func is None:
+            self.filters.pop(name, None)
+        else:
+            self.filters[name] = func
+
+    def refilter(self):
+        """
+        Rebuild the display order from all images that pass the filters.
+        No signals are emitted for the rows that appear or disappear, so
+        detach the model from its view while refiltering, as GTK advises
+        for big changes to a model anyway.
+        """
+        rows = [row for row, name in enumerate(self.names)
+                if name is not None and self.visible(row)]
+        rows.sort(key=self.order_key(), reverse=self.sort_order == Gtk.SortType.DESCENDING)
+        self.order = array('l', rows)
+        self.shown = array('b', [0]) * len(self.names)
+        for row in rows:
+            self.shown[row] = 1
+        self.reset_positions()
+
+    # Gtk.TreeModel implementation
+
+    def do_get_flags(self):
+        return Gtk.TreeModelFlags.LIST_ONLY | Gtk.TreeModelFlags.ITERS_PERSIST
+
+    def do_get_n_columns(self):
+        return len(COLUMN_TYPES)
+
+    def do_get_column_type(self, n):
+        return COLUMN_TYPES[n]
+
+    def do_get_iter(self, path):
+        indices = path.get_indices()
+        if len(indices) == 1 and 0 <= indices[0] < len(self.order):
+            return (True, self.make_iter(self.order[indices[0]]))
+        return (False, None)
+
+    def do_get_path(self, it):
+        return Gtk.TreePath(self.position(self.iter_row(it)))
+
+    def do_get_value(self, it, column):
+        return self.get_cell(self.iter_row(it), column)
+
+    def do_iter_next(self, it):
+        pos = self.position(self.iter_row(it)) + 1
+        if pos < len(self.order):
+            it.user_data = self.order[pos] + 1
+            return (True, it)
+        return (False, None)
+
+    def do_iter_previous(self, it):
+        pos = self.position(self.iter_row(it)) - 1
+        if pos >= 0:
+            it.user_data = self.order[pos] + 1
+            return (True, it)
+        return (False, None)
+
+    def do_iter_children(self, parent):
+        if parent is None and self.order:
+            return (True, self.make_iter(self.order[0]))
+        return (False, None)
+
+    def do_iter_has_child(self, it):
+        return False
+
+    def do_iter_n_children(self, it):
+        return len(self.order) if it is None else 0
+
+    def do_iter_nth_child(self, parent, n):
+        if parent is None and 0 <= n < len(self.order):
+            return (True, self.make_iter(self.order[n]))
+        return (False, None)
+
+    def do_iter_parent(self, child):
+        return (False, None)
+
+    # Gtk.TreeSortable implementation
+
+    def do_get_sort_column_id(self):
+        return (self.sort_column >= 0, self.sort_column, self.sort_order)
+
+    def do_set_sort_column_id(self, column, order):
+        """
+        Sort the display order by the values of a column, an argsort of
+        the column
+        """
+        if (column, order) == (self.sort_column, self.sort_order):
+            return
+        self.sort_column = column
+        self.sort_order = order
+        old = self.order
+        self.order = array('l', sorted(old, key=self.order_key(),
+                                       reverse=order == Gtk.SortType.DESCENDING))
+        self.reset_positions()
+        self.sort_column_changed()
+        if old:
+            positions = dict((row, pos) for pos, row in enumerate(old))
+            self.rows_reordered(Gtk.TreePath.new(), None, [positions[row] for row in self.order])
+
+    def do_set_sort_func(self, column, func, data=None):
+        pass
+
+    def do_set_default_sort_func(self, func, data=None):
+        pass
+
+    def do_has_default_sort_func(self):
+        return False
+
+GObject.type_register(ImageListModel)
@@ -0,0 +1,224 @@
+#   Copyright 2014 Martijn Grendelman <m@rtijn.net>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""imagescan module, reads and writes the metadata of image files in worker processes"""
+
+import os
+from gi.repository import GExiv2
+from gi.repository import GObject
+
+import exifreader
+import imagecatalog
+
+# Write modes: geotags are written to the image file itself, or to an XMP
+# sidecar named like darktable (IMG_0001.CR2.xmp) or Lightroom (IMG_0001.xmp)
+WRITE_IMAGE = 'image'
+WRITE_DARKTABLE = 'darktable'
+WRITE_LIGHTROOM = 'lightroom'
+
+# XMP properties of a geotag, see the XMP Specification Part 2, Exif schema
+XMP_GPS_TAGS = ('Xmp.exif.GPSVersionID', 'Xmp.exif.GPSLatitude',
+    'Xmp.exif.GPSLongitude', 'Xmp.exif.GPSAltitude', 'Xmp.exif.GPSAltitudeRef')
+
+# An empty XMP packet, for creating a sidecar
+XMP_PACKET = """<?xpacket begin="\xef\xbb\xbf" id="W5M0MpCehiHzreSzNTczkc9d"?>
+<x:xmpmeta xmlns:x="adobe:ns:meta/">
+ <rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">
+  <rdf:Description rdf:about=""/>
+ </rdf:RDF>
+</x:xmpmeta>
+<?xpacket end="w"?>
+"""
+
+def read_metadata(fname):
+    """
+    Read the metadata Taggert needs from an image file, for use with
+    multiprocessing.Pool. Return a tuple of the file name without its
+    directory, the camera model, the EXIF DateTime as a DateTime or None,
+    the orientation as an int and the latitude, longitude and elevation,
+    which are empty strings for images without a geotag. Return None for
+    files that can't be read. The EXIF data of JPEG and TIFF-based files is
+    read by exifreader, GExiv2 is only used for files it can't handle. A
+    geotag in an XMP sidecar takes precedence over one in the image.
+    """
+    image = read_image_metadata(fname)
+    if image is None:
+        return None
+    sidecar = imagecatalog.find_sidecar(fname)
+    if sidecar:
+        location = read_sidecar_location(sidecar)
+        if location:
+            image = image[:4] + location
+    return image
+
+def read_image_metadata(fname):
+    """
+    Read the metadata from the image file itself, see read_metadata
+    """
+    try:
+        camera, dtobj, rot, imglat, imglon, imgele = exifreader.read_exif(fname)
+        if dtobj is not None:
+            return (os.path.basename(fname), camera, dtobj, rot, imglat, imglon, imgele)
+        # GExiv2 also looks for a date in XMP and IPTC
+    except exifreader.ExifError:
+        pass
+    except IOError:
+        return None
+    try:
+        metadata = GExiv2.Metadata(fname)
+        # Get the camera make/model
+        try:
+            camera = metadata.get_camera_model() or ''
+        except AttributeError:
+            camera = ''
+        # Get EXIF DateTime
+        dtobj = metadata.get_date_time()
+        # Get image orientation
+        rot = int(metadata.get_orientation())
+        # Get GPS info
+        if 'Exif.GPSInfo.GPSLatitude' in metadata.get_tags():
+            imglon, imglat, imgele = [round(x,5) for x in metadata.get_gps_info()]
+        else:
+            imglon = imglat = imgele = ''
+    except GObject.GError:
+        # Unsupported file format
+        return None
+    except IOError:
+        # Unsupported file format
+        return None
+    return (os.path.basename(fname), camera, dtobj, rot, imglat, imglon, imgele)
+
+def write_location(job):
+    """
+    Write the geotag of an image file, for use with multiprocessing.Pool,
+    given a tuple of the file name, a (latitude, longitude, elevation) tuple
+    or None to delete the geotag, and the write mode. In the sidecar modes,
+    an existing sidecar is updated, whatever its name, and the image file is
+    only rewritten to delete a geotag that is embedded in it. Lightroom has
+    no sidecars for files other than raw files, so for those the geotag is
+    written to the image, in EXIF and XMP. In image mode, the geotag in an
+    existing sidecar is updated as well, as it takes precedence when the
+    image is read again. Return None on success, or an error message.
+    """
+    fname, location, mode = job
+    try:
+        sidecar = imagecatalog.find_sidecar(fname)
+        if mode == WRITE_LIGHTROOM and sidecar is None \
+                and not imagecatalog.is_raw_name(fname):
+            write_image_location(fname, location, True)
+        elif mode == WRITE_IMAGE:
+            write_image_location(fname, location)
+            if sidecar is not None:
+                write_sidecar_location(sidecar, location)
+        else:
+            if sidecar is None:
+                sidecar = imagecatalog.sidecar_names(fname)[mode == WRITE_LIGHTROOM]
+                with open(sidecar, 'wb') as f:
+                    f.write(XMP_PACKET)
+            write_sidecar_location(sidecar, location)
+            if location is None:
+                metadata = GExiv2.Metadata(fname)
+                if 'Exif.GPSInfo.GPSLatitude' in metadata.get_tags():
+                    write_image_location(fname, None)
+    except GObject.GError as e:
+        return str(e)
+    except IOError as e:
+        return str(e)
+    return None
+
+def write_image_location(fname, location, xmp=False):
+    """
+    Write or delete the geotag in an image file, see write_location. The
+    geotag is written to XMP as well if 'xmp' is True, or if the image
+    already has one in XMP, so the two don't disagree.
+    """
+    metadata = GExiv2.Metadata(fname)
+    if not xmp:
+        tags = metadata.get_tags()
+        xmp = any(tag in tags for tag in XMP_GPS_TAGS)
+    if location is None:
+        metadata.delete_gps_info()
+    else:
+        lat, lon, ele = location
+        metadata.set_gps_info(lon, lat, ele)
+    if xmp:
+        set_xmp_location(metadata, location)
+    metadata.save_file()
+
+def write_sidecar_location(fname, location):
+    """
+    Write or delete the geotag in an XMP sidecar, see write_location
+    """
+    metadata = GExiv2.Metadata(fname)
+    # Exiv2 converts the EXIF GPS tags it derived from the XMP back to XMP
+    # when it saves a sidecar, so they must go as well
+    metadata.delete_gps_info()
+    set_xmp_location(metadata, location)
+    metadata.save_file()
+
+def set_xmp_location(metadata, location):
+    """
+    Replace the geotag in the XMP of a GExiv2.Metadata object, or delete it
+    if location is None
+    """
+    for tag in XMP_GPS_TAGS:
+        metadata.clear_tag(tag)
+    if location is not None:
+        lat, lon, ele = location
+        metadata.set_tag_string('Xmp.exif.GPSVersionID', '2.2.0.0')
+        metadata.set_tag_string('Xmp.exif.GPSLatitude', format_xmp_coordinate(lat, 'NS'))
+        metadata.set_tag_string('Xmp.exif.GPSLongitude', format_xmp_coordinate(lon, 'EW'))
+        metadata.set_tag_string('Xmp.exif.GPSAltitude', '%d/100' % round(abs(ele) * 100))
+        metadata.set_tag_string('Xmp.exif.GPSAltitudeRef', '1' if ele < 0 else '0')
+
+def read_sidecar_location(fname):
+    """
+    Return the latitude, longitude and elevation in an XMP sidecar, or None
+    if it has no geotag or can't be read
+    """
+    try:
+        metadata = GExiv2.Metadata(fname)
+        tags = metadata.get_tags()
+        if 'Xmp.exif.GPSLatitude' not in tags:
+            return None
+        lat = parse_xmp_coordinate(metadata.get_tag_string('Xmp.exif.GPSLatitude'))
+        lon = parse_xmp_coordinate(metadata.get_tag_string('Xmp.exif.GPSLongitude'))
+        ele = 0.0
+        if 'Xmp.exif.GPSAltitude' in tags:
+            num, _sep, den = metadata.get_tag_string('Xmp.exif.GPSAltitude').partition('/')
+            ele = float(num) / float(den or 1)
+            if metadata.get_tag_string('Xmp.exif.GPSAltitudeRef') == '1':
+                ele = -ele
+    except (GObject.GError, IOError, IndexError, TypeError, ValueError,
+            ZeroDivisionError):
+        return None
+    return (round(lat, 5), round(lon, 5), round(ele, 5))
+
+def parse_xmp_coordinate(value):
+    """
+    Return a decimal coordinate from an XMP GPSCoordinate, which is either
+    "DDD,MM,SSk" or "DDD,MM.mmk", where k is N, S, E or W
+    """
+    ref = value[-1].upper()
+    parts = [float(x) for x in value[:-1].split(',')]
+    decimal = sum(v / 60 ** i for i, v in enumerate(parts[:3]))
+    return -decimal if ref in 'SW' else decimal
+
+def format_xmp_coordinate(value, refs):
+    """
+    Return an XMP GPSCoordinate "DDD,MM.mmmmmmk" for a decimal coordinate,
+    where k is refs[0] for positive values and refs[1] for negative ones
+    """
+    degrees, minutes = divmod(abs(value) * 60, 60)
+    return "%d,%.6f%s" % (degrees, minutes, refs[0] if value >= 0 else refs[1])
@@ -0,0 +1,167 @@
+#   Copyright 2014 Martijn Grendelman <m@rtijn.net>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""imagewatch module, defines the DirectoryWatcher class"""
+
+import fnmatch
+import os
+
+from gi.repository import Gio
+from gi.repository import GLib
+
+import imagecatalog
+
+class DirectoryWatcher(object):
+    """
+    Watches an image directory and its subdirectories with Gio.FileMonitors,
+    down to the same depth and with the same exclude patterns as
+    imagecatalog.list_files. Events are collected for 'delay' milliseconds
+    after the first one and then reported together, so copying a card full
+    of photos into the directory results in a few batches, not an update
+    per file.
+    """
+
+    def __init__(self, directory, dirs, depth, exclude, callback, delay=1000):
+        """
+        Start watching a directory and the subdirectories in 'dirs', as
+        returned by list_files. callback(changed, removed) is called with a
+        list of (name, size, mtime) tuples of image files that appeared or
+        changed, and a list of names of image files that disappeared. The
+        names of removed directories end with a separator. All names are
+        relative to the directory.
+        """
+        self.directory = directory
+        self.depth = depth
+        self.exclude = exclude
+        self.callback = callback
+        self.delay = delay
+        self.monitors = {}      # relative name -> Gio.FileMonitor of a directory
+        self.pending = set()    # relative names of changed entries
+        self.timeout = None
+        for name in dirs:
+            self.watch(name)
+
+    def watch(self, name):
+        """
+        Start monitoring a directory, given its relative name
+        """
+        gfile = Gio.File.new_for_path(os.path.join(self.directory, name))
+        try:
+            monitor = gfile.monitor_directory(Gio.FileMonitorFlags.NONE, None)
+        except GLib.GError:
+            return
+        monitor.connect('changed', self.on_changed, name)
+        self.monitors[name] = monitor
+
+    def stop(self):
+        """
+        Stop watching, dropping pending events
+        """
+        for monitor in self.monitors.itervalues():
+            monitor.cancel()
+        self.monitors.clear()
+        self.pending.clear()
+        if self.timeout:
+            GLib.source_remove(self.timeout)
+            self.timeout = None
+
+    def on_changed(self, _monitor, gfile, _other, event, dirname):
+        """
+        Handler for the 'changed' signal of a monitor, remembers the entry
+        and schedules a flush
+        """
+        if event in (Gio.FileMonitorEvent.PRE_UNMOUNT, Gio.FileMonitorEvent.UNMOUNTED):
+            return
+        basename = gfile.get_basename()
+        if any(fnmatch.fnmatch(basename, pattern) for pattern in self.exclude):
+            return
+        self.pending.add(os.path.join(dirname, basename))
+        if not self.timeout:
+            self.timeout = GLib.timeout_add(self.delay, self.flush)
+
+    def flush(self):
+        """
+        Timeout callback that looks at the entries that changed since the
+        last flush and reports them to the callback. New subdirectories are
+        listed and monitored. A change of an XMP sidecar is reported as a
+        change of its image.
+        """
+        self.timeout = None
+        pending = self.sidecar_images(self.pending)
+        self.pending.clear()
+        changed = []
+        removed = []
+        for name in pending:
+            path = os.path.join(self.directory, name)
+            if os.path.isdir(path) and not os.path.islink(path):
+                level = name.count(os.sep) + 1
+                if name not in self.monitors and (self.depth < 0 or level <= self.depth):
+                    dirs = []
+                    files = imagecatalog.list_files(path,
+                        self.depth - level if self.depth >= 0 else -1, self.exclude, dirs)
+                    changed.extend((os.path.join(name, f[0]),) + f[1:] for f in files)
+                    for d in dirs:
+                        self.watch(os.path.join(name, d) if d else name)
+                continue
+            try:
+                size, mtime = imagecatalog.stat_image(path)
+            except OSError:
+                if name in self.monitors:
+                    prefix = name + os.sep
+                    for d in self.monitors.keys():
+                        if d == name or d.startswith(prefix):
+                            self.monitors.pop(d).cancel()
+                    removed.append(prefix)
+                elif imagecatalog.is_image_name(name):
+                    removed.append(name)
+                continue
+            if imagecatalog.is_image(path):
+                changed.append((name, size, mtime))
+        if changed or removed:
+            self.callback(changed, removed)
+        return False
+
+    def sidecar_images(self, names):
+        """
+        Return a sorted list of the names, where the names of XMP sidecars
+        are replaced by the names of the existing image files they belong to.
+        The directory of a sidecar is listed once, into a dict of its raw
+        files by name without extension, so a sidecar is matched with two
+        lookups: its name without .xmp (darktable), and its name without
+        extension (Lightroom, see imagecatalog.sidecar_names).
+        """
+        result = set()
+        listings = {}           # relative directory name -> (entries, raw files by root)
+        for name in names:
+            if not name.lower().endswith(imagecatalog.SIDECAR_EXTENSION):
+                result.add(name)
+                continue
+            dirname, basename = os.path.split(name)
+            if dirname not in listings:
+                try:
+                    entries = set(os.listdir(os.path.join(self.directory, dirname)))
+                except OSError:
+                    entries = set()
+                roots = {}
+                for entry in entries:
+                    if imagecatalog.is_raw_name(entry):
+                        roots.setdefault(os.path.splitext(entry)[0], []).append(entry)
+                listings[dirname] = (entries, roots)
+            entries, roots = listings[dirname]
+            root = basename[:-len(imagecatalog.SIDECAR_EXTENSION)]
+            if root in entries and imagecatalog.is_image_name(root):
+                result.add(os.path.join(dirname, root))
+            for image in roots.get(root, ()):
+                result.add(os.path.join(dirname, image))
+        return sorted(result)
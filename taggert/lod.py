@@ -0,0 +1,120 @@
+#   Copyright 2014 Martijn Grendelman <m@rtijn.net>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""lod module, defines the TrackPyramid class"""
+
+from array import array
+from math import log, pi, tan, cos, radians
+
+INF = float('inf')
+TILE_SIZE = 256         # size of a map tile in pixels
+TOLERANCE = 0.5         # maximum deviation of a simplified track in pixels
+MAX_ZOOM = 20
+
+def project(lat, lon):
+    """
+    Return the spherical Mercator projection of a coordinate, as x and y in
+    world units, where the whole world is a square of size 1
+    """
+    lat = max(min(lat, 85.05112878), -85.05112878)
+    x = (lon + 180.0) / 360.0
+    y = (1.0 - log(tan(radians(lat)) + 1.0 / cos(radians(lat))) / pi) / 2.0
+    return x, y
+
+def pixel_size(zoom):
+    """
+    Return the size of a pixel in world units at a zoom level
+    """
+    return 1.0 / (TILE_SIZE << int(zoom))
+
+class TrackPyramid(object):
+    """
+    Simplified versions of a track for every zoom level. The Douglas-Peucker
+    algorithm is run once over the projected track points, recording for
+    each point the largest tolerance at which it is still kept. A point never
+    gets a larger weight than the point that split its part of the track, so
+    the levels are nested: the points of a zoom level are those with a weight
+    of at least the size of TOLERANCE pixels at that zoom level. The first
+    and last point of every segment are always kept, points that would not
+    be visible even at MAX_ZOOM are never drawn.
+    """
+
+    def __init__(self, tobj, weights=None):
+        """
+        Calculate the weights of all points of a Track object, unless they
+        are given, as loaded from the track cache
+        """
+        self.levels = {}
+        if weights is not None:
+            self.weights = weights
+            return
+        n = len(tobj)
+        self.weights = weights = array('d', [0.0]) * n
+        xs = array('d')
+        ys = array('d')
+        for lat, lon in zip(tobj.lats, tobj.lons):
+            x, y = project(lat, lon)
+            xs.append(x)
+            ys.append(y)
+        minimum = (TOLERANCE * pixel_size(MAX_ZOOM)) ** 2
+        for start, end in tobj.get_segments():
+            if end <= start:
+                continue
+            weights[start] = weights[end-1] = INF
+            stack = [(start, end - 1, INF)]
+            while stack:
+                a, b, parent = stack.pop()
+                if b - a < 2:
+                    continue
+                ax, ay = xs[a], ys[a]
+                dx, dy = xs[b] - ax, ys[b] - ay
+                norm = dx * dx + dy * dy
+                best = -1.0
+                k = a + 1
+                for i in xrange(a + 1, b):
+                    # Squared distance to the line segment from a to b
+                    px, py = xs[i] - ax, ys[i] - ay
+                    t = px * dx + py * dy
+                    if t <= 0 or norm == 0:
+                        d = px * px + py * py
+                    elif t >= norm:
+                        d = (px - dx) ** 2 + (py - dy) ** 2
+                    else:
+                        cross = px * dy - py * dx
+                        d = cross * cross / norm
+                    if d > best:
+                        best = d
+                        k = i
+                if best < minimum:
+                    # Invisible at any zoom level, leave all weights at 0
+                    continue
+                # Weights are squared distances in world units
+                w = min(best, parent)
+                weights[k] = w
+                stack.append((a, k, w))
+                stack.append((k, b, w))
+
+    def level(self, zoom):
+        """
+        Return an array with the indices of the track points to draw at a
+        zoom level, calculating it only once
+        """
+        zoom = max(min(int(zoom), MAX_ZOOM), 0)
+        indices = self.levels.get(zoom)
+        if indices is None:
+            tolerance = (TOLERANCE * pixel_size(zoom)) ** 2
+            weights = self.weights
+            indices = self.levels[zoom] = array('l',
+                (i for i in xrange(len(weights)) if weights[i] >= tolerance))
+        return indices
@@ -0,0 +1,261 @@
+#   Copyright 2014 Martijn Grendelman <m@rtijn.net>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""spatialindex module, defines the PointGrid and SpatialIndex classes"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from math import floor, cos, radians, degrees
+
+from geodesy import RADIUS, METERS_PER_DEGREE
+from viewport import intersects
+
+CELL_SIZE = 0.005                   # size of a grid cell in degrees at level 0
+LEVELS = 13                         # levels of cells of CELL_SIZE * 2 ** level
+FINE_LEVELS = 10                    # levels below 0, for dense clusters
+THINNING_BITS = 4
+THINNING = 1 << THINNING_BITS       # subcells per cell side that keep one point
+CAPACITY = THINNING ** 2            # maximum number of points in a cell
+# Factor of the row in the key of a cell, more than twice the largest
+# column, so keys sort by row and then by column, and fit in a double
+KEY_STRIDE = 1 << 27
+
+def cell_size(level):
+    """
+    Return the size in degrees of the grid cells at a level
+    """
+    return CELL_SIZE * 2.0 ** level
+
+def cell_range(level, box):
+    """
+    Return the first and last row and column of the cells at a level that
+    overlap a (minlat, minlon, maxlat, maxlon) box
+    """
+    size = cell_size(level)
+    return (int(floor(box[0] / size)), int(floor(box[2] / size)),
+            int(floor(box[1] / size)), int(floor(box[3] / size)))
+
+def cell_key(row, col):
+    """
+    Return the key of a cell, as stored in the arrays of a PointGrid
+    """
+    return float(row * KEY_STRIDE + col)
+
+def bin_points(indices, rows, cols, shift):
+    """
+    Return a dict of arrays of the indices of points, keyed by the (row,
+    column) of their cell, which is that of their finest cell shifted right
+    by 'shift' bits
+    """
+    cells = {}
+    key = bucket = None
+    for i in indices:
+        k = (rows[i] >> shift, cols[i] >> shift)
+        # Consecutive points are usually in the same cell
+        if k != key:
+            key = k
+            bucket = cells.get(key)
+            if bucket is None:
+                bucket = cells[key] = array('i')
+        bucket.append(i)
+    return cells
+
+def thin(indices, rows, cols, shift):
+    """
+    Return an array of the indices of the first point in every cell, of
+    the finest cells shifted right by 'shift' bits, that holds any of them
+    """
+    kept = array('i')
+    seen = set()
+    for i in indices:
+        k = (rows[i] >> shift, cols[i] >> shift)
+        if k not in seen:
+            seen.add(k)
+            kept.append(i)
+    return kept
+
+class PointGrid(object):
+    """
+    Grids of cells of increasing size over the points of a track, for
+    finding the point nearest to a location without looking at points far
+    away from it. Every cell that holds any points has their indices, and
+    no cell holds more than CAPACITY of them. Every level above 0 has cells
+    twice as large as the level below, and keeps one point out of each
+    1/THINNING of a cell, taken from the level below. Level 0 holds all
+    points of a cell, unless there are more than CAPACITY: then it keeps
+    one point out of each 1/THINNING of the cell, and the cell is split
+    into four at the level below, down to -FINE_LEVELS, where cells are
+    about half a meter in size. So a stationary logger that recorded
+    thousands of points in the same spot takes a few more levels, but no
+    more points to search.
+
+    A level is stored as four arrays: the sorted keys of its cells, the
+    offsets of the indices of every cell in an array of indices, and flags
+    for the cells that are split, so it is cheap to cache and to pass
+    between processes.
+    """
+
+    def __init__(self, tobj=None):
+        """
+        Sort the points of a Track object into cells, level by level. The
+        row and column of the finest cell of every point are calculated
+        once, those of the larger cells follow from them by shifting.
+        Without a Track object, the grid is empty, for load().
+        """
+        self.levels = {}    # level -> (keys, offsets, indices, split flags)
+        if tobj is None:
+            return
+        finest = cell_size(-FINE_LEVELS) / THINNING
+        rows = array('l', [int(floor(lat / finest)) for lat in tobj.lats])
+        cols = array('l', [int(floor(lon / finest)) for lon in tobj.lons])
+        shift0 = FINE_LEVELS + THINNING_BITS
+        indices = xrange(len(tobj))
+        for level in xrange(1, LEVELS):
+            shift = shift0 + level
+            indices = thin(indices, rows, cols, shift - THINNING_BITS)
+            self.store(level, bin_points(indices, rows, cols, shift), ())
+        indices = xrange(len(tobj))
+        for level in xrange(0, -FINE_LEVELS - 1, -1):
+            shift = shift0 + level
+            cells = bin_points(indices, rows, cols, shift)
+            split = set()
+            indices = array('i')
+            for key, bucket in cells.iteritems():
+                if len(bucket) > CAPACITY:
+                    cells[key] = thin(bucket, rows, cols, shift - THINNING_BITS)
+                    if level > -FINE_LEVELS:
+                        split.add(key)
+                        indices.extend(bucket)
+            self.store(level, cells, split)
+            if not indices:
+                break
+
+    def store(self, level, cells, split):
+        """
+        Store a level given as a dict of arrays of indices keyed by (row,
+        column) and a set of the keys of the cells that are split
+        """
+        keys = array('d')
+        offsets = array('i', [0])
+        indices = array('i')
+        flags = array('b')
+        for key in sorted(cells):
+            keys.append(cell_key(*key))
+            indices.extend(cells[key])
+            offsets.append(len(indices))
+            flags.append(key in split)
+        self.load(level, keys, offsets, indices, flags)
+
+    def load(self, level, keys, offsets, indices, flags):
+        """
+        Set the arrays of a level, see dump()
+        """
+        self.levels[level] = (keys, offsets, indices, flags)
+
+    def dump(self):
+        """
+        Return a list of tuples of the level and the arrays of the keys,
+        offsets, indices and split flags of every level
+        """
+        return [(level,) + self.levels[level] for level in sorted(self.levels)]
+
+    def buckets(self, level, box):
+        """
+        Return a list of the arrays of indices in the cells of a level that
+        overlap a (minlat, minlon, maxlat, maxlon) box. Below level 1, the
+        search starts at level 0 and only descends into cells that were
+        split, as all other cells hold all of their points. The cells of
+        a row of the grid are found with a binary search of the keys.
+        """
+        top = max(level, 0)
+        r0, r1, c0, c1 = cell_range(top, box)
+        rows = [(r, c0, c1) for r in xrange(r0, r1 + 1)]
+        result = []
+        while rows:
+            keys, offsets, indices, split = self.levels[top]
+            descend = top > level
+            if descend:
+                r0, r1, c0, c1 = cell_range(top - 1, box)
+            finer = []
+            for r, first, last in rows:
+                lo = bisect_left(keys, cell_key(r, first))
+                hi = bisect_right(keys, cell_key(r, last))
+                for k in xrange(lo, hi):
+                    if descend and split[k]:
+                        c = int(keys[k]) - r * KEY_STRIDE
+                        for rr in xrange(max(2 * r, r0), min(2 * r + 1, r1) + 1):
+                            finer.append((rr, max(2 * c, c0), min(2 * c + 1, c1)))
+                    else:
+                        result.append(indices[offsets[k]:offsets[k + 1]])
+            rows = finer
+            top -= 1
+        return result
+
+class SpatialIndex(object):
+    """
+    An index of the track points of a set of tracks, for snapping locations
+    on the map to the nearest track point. The grids of the tracks are
+    built with the tracks, in the worker processes that decode them, or
+    loaded from the track cache, so creating the index only collects them.
+    """
+
+    def __init__(self, tracks):
+        """
+        Collect the bounding boxes and grids of a dict of Track objects
+        keyed by tid
+        """
+        self.tracks = []
+        for tid in sorted(tracks):
+            tobj = tracks[tid]
+            bbox = tobj.get_chunks().bbox
+            if bbox is not None:
+                self.tracks.append((bbox, tobj, tobj.get_grid()))
+
+    def nearest(self, lat, lon, radius):
+        """
+        Return a tuple of the Track object and the index of the track point
+        nearest to a location, or None if there is no point within 'radius'
+        meters. The level of the grids is the lowest one whose cells are at
+        least as large as the radius, so the search covers a few cells of
+        at most CAPACITY points each, however dense the points are and
+        whatever the zoom level of the map. The nearest point may have been
+        thinned out at that level, but then another point within a fraction
+        of the radius of it is found. Distances are calculated on an
+        equirectangular projection, which is accurate enough at these
+        distances.
+        """
+        coslat = max(cos(radians(lat)), 0.01)
+        dlat = degrees(float(radius) / RADIUS)
+        dlon = dlat / coslat
+        level = -FINE_LEVELS
+        while level < LEVELS - 1 and cell_size(level) < dlat:
+            level += 1
+        box = (lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+
+        best = None
+        bestdist = (radius / METERS_PER_DEGREE) ** 2
+        for bbox, tobj, grid in self.tracks:
+            if not intersects(bbox, box):
+                continue
+            lats = tobj.lats
+            lons = tobj.lons
+            for bucket in grid.buckets(level, box):
+                for i in bucket:
+                    dy = lats[i] - lat
+                    dx = (lons[i] - lon) * coslat
+                    dist = dx * dx + dy * dy
+                    if dist <= bestdist:
+                        best = (tobj, i)
+                        bestdist = dist
+        return best
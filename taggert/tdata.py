@@ -31,6 +31,9 @@ class TData(GObject.GObject):
     trackwidth         = GObject.property(type=int)
     imagemarkersize    = GObject.property(type=int)
     mapsourceid        = GObject.property(type=str)
+    gpxvalidation      = GObject.property(type=str)
+    trackrendering     = GObject.property(type=str)
+    writemode          = GObject.property(type=str)
 
     def __init__(self):
         """Constructor, does nothing special"""
@@ -44,6 +44,14 @@ def decimal_to_dms(decimal):
     remainder, minutes = modf(remainder * 60)
     return [float_to_fraction(n) for n in (degrees, minutes, remainder * 60)]
 
+def format_duration(seconds):
+    """
+    Return a number of seconds as a string of hours, minutes and seconds
+    """
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%d:%02d:%02d" % (hours, minutes, seconds)
+
 def clutter_color (gdkcolor, opacity=256):
     """
     Convert a Gdk.Color into a Clutter.Color
@@ -67,6 +75,18 @@ def latlon_to_text(lat, lon):
             'E' if lon >= 0 else 'W', abs(lon)
         )
 
+def trackpoint_to_text(lat, lon, dt=None, ele=None):
+    """
+    Return a formatted string for a track point, with its time and
+    elevation if known
+    """
+    text = latlon_to_text(lat, lon)
+    if dt is not None:
+        text += dt.strftime(", %Y-%m-%d %H:%M:%S")
+    if ele is not None:
+        text += ", %.1f m" % ele
+    return text
+
 
 def timezone_split(tz):
     """
@@ -0,0 +1,215 @@
+#   Copyright 2014 Martijn Grendelman <m@rtijn.net>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""tilerender module, draws tracks and heatmaps into map tiles and serves them to Champlain"""
+
+import hashlib
+from io import BytesIO
+from math import atan, sinh, degrees, pi, log
+import os
+import shutil
+
+import cairo
+from gi.repository import Champlain
+
+from lod import project, TILE_SIZE, MAX_ZOOM
+
+SOURCE_ID = 'taggert-tracks'
+HEATMAP_ID = 'taggert-heatmap'
+# Colors of the heatmap from the lowest to the highest density
+HEATMAP_COLORS = [(0.0, 0.0, 1.0), (0.0, 1.0, 1.0), (0.0, 1.0, 0.0),
+                  (1.0, 1.0, 0.0), (1.0, 0.0, 0.0)]
+
+def tile_box(zoom, x, y, margin=0):
+    """
+    Return the (minlat, minlon, maxlat, maxlon) bounding box of a tile,
+    grown by 'margin' pixels on every side
+    """
+    n = float(TILE_SIZE << zoom)
+    def lat(py):
+        return degrees(atan(sinh(pi * (1 - 2 * py / n))))
+    def lon(px):
+        return px / n * 360.0 - 180.0
+    x0 = x * TILE_SIZE - margin
+    y0 = y * TILE_SIZE - margin
+    x1 = (x + 1) * TILE_SIZE + margin
+    y1 = (y + 1) * TILE_SIZE + margin
+    return (lat(y1), lon(x0), lat(y0), lon(x1))
+
+def tracks_version(tracks, color, width):
+    """
+    Return a string that identifies a set of tracks and the way they are
+    drawn, so tiles of different track sets are never mixed up
+    """
+    h = hashlib.sha1("%r %r" % (color, width))
+    for tid in sorted(tracks):
+        tobj = tracks[tid]
+        h.update(tobj.lats.tostring())
+        h.update(tobj.lons.tostring())
+    return h.hexdigest()[:16]
+
+def render_tile(tracks, zoom, x, y, color, width):
+    """
+    Draw the tracks in a dict of Track objects onto a transparent tile and
+    return it as PNG data. The tracks are simplified for the zoom level and
+    only the chunks near the tile are drawn. The color is a tuple of RGB
+    values from 0 to 65535.
+    """
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, TILE_SIZE, TILE_SIZE)
+    ctx = cairo.Context(surface)
+    ctx.set_source_rgb(*[c / 65535.0 for c in color])
+    ctx.set_line_width(width)
+    ctx.set_line_join(cairo.LINE_JOIN_ROUND)
+    ctx.set_line_cap(cairo.LINE_CAP_ROUND)
+    box = tile_box(zoom, x, y, width)
+    scale = float(TILE_SIZE << zoom)
+    ox = x * TILE_SIZE
+    oy = y * TILE_SIZE
+    for tid in sorted(tracks):
+        tobj = tracks[tid]
+        indices = tobj.get_chunks().cull(tobj.get_indices(zoom=min(zoom, MAX_ZOOM)), box)
+        if not len(indices):
+            continue
+        lats = tobj.lats
+        lons = tobj.lons
+        px, py = project(lats[indices[0]], lons[indices[0]])
+        ctx.move_to(px * scale - ox, py * scale - oy)
+        for i in indices:
+            px, py = project(lats[i], lons[i])
+            ctx.line_to(px * scale - ox, py * scale - oy)
+        ctx.stroke()
+    data = BytesIO()
+    surface.write_to_png(data)
+    return data.getvalue()
+
+def heat_color(value):
+    """
+    Return the RGBA color of the heatmap for a density between 0 and 1
+    """
+    pos = value * (len(HEATMAP_COLORS) - 1)
+    i = min(int(pos), len(HEATMAP_COLORS) - 2)
+    f = pos - i
+    c0 = HEATMAP_COLORS[i]
+    c1 = HEATMAP_COLORS[i + 1]
+    return tuple(a + (b - a) * f for a, b in zip(c0, c1)) + (0.3 + 0.4 * value,)
+
+def render_heatmap_tile(grid, zoom, x, y):
+    """
+    Draw the cells of a DensityGrid within a tile onto a transparent tile and
+    return it as PNG data. Densities are scaled logarithmically to the
+    highest density at the zoom level, so sparse areas stay visible.
+    """
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, TILE_SIZE, TILE_SIZE)
+    ctx = cairo.Context(surface)
+    scale = log(1 + grid.max_count(zoom)) or 1.0
+    for px, py, size, count in grid.cells(zoom, x, y):
+        ctx.set_source_rgba(*heat_color(log(1 + count) / scale))
+        ctx.rectangle(px, py, size, size)
+        ctx.fill()
+    data = BytesIO()
+    surface.write_to_png(data)
+    return data.getvalue()
+
+class CairoTileSource(Champlain.TileSource):
+    """
+    A Champlain tile source that draws transparent tiles, to be shown as an
+    overlay over the map. Tiles are drawn by a render function when
+    Champlain asks for them, and handed to the caches further down the
+    source chain on the way back, like a NetworkTileSource does with
+    downloaded tiles.
+    """
+
+    def __init__(self, source_id, name, render):
+        """
+        Initialize the tile source with a function that returns the PNG
+        data of a tile, given its zoom level, x and y
+        """
+        Champlain.TileSource.__init__(self,
+            id=source_id, name=name,
+            min_zoom_level=0, max_zoom_level=MAX_ZOOM, tile_size=TILE_SIZE,
+            projection=Champlain.MapProjection.MAP_PROJECTION_MERCATOR,
+            renderer=Champlain.ImageRenderer())
+        self.render = render
+
+    def do_fill_tile(self, tile):
+        """
+        Draw a tile and pass it to the renderer
+        """
+        data = self.render(tile.get_zoom_level(), tile.get_x(), tile.get_y())
+        tile.connect('render-complete', self.tile_rendered, data)
+        renderer = self.get_renderer()
+        renderer.set_data(data)
+        renderer.render(tile)
+
+    def tile_rendered(self, tile, _data, _size, error, data):
+        """
+        Handler for the 'render-complete' signal of a tile, stores the tile
+        in the caches and shows it
+        """
+        tile.disconnect_by_func(self.tile_rendered)
+        if error:
+            return
+        cache = self.get_cache()
+        if cache:
+            cache.store_buffer(tile, data)
+        tile.set_fade_in(True)
+        tile.set_state(Champlain.State.DONE)
+        tile.display_content()
+
+def track_tile_source(tracks, version, color, width):
+    """
+    Return a tile source that draws a set of tracks. The version, from
+    tracks_version(), becomes part of the source id, so the file cache
+    keeps the tiles of every track set apart.
+    """
+    tracks = dict(tracks)
+    return CairoTileSource('%s-%s' % (SOURCE_ID, version), 'Tracks',
+        lambda zoom, x, y: render_tile(tracks, zoom, x, y, color, width))
+
+def heatmap_tile_source(grid, version):
+    """
+    Return a tile source that draws a heatmap of a DensityGrid. The
+    version tells the tiles of different grids apart.
+    """
+    return CairoTileSource('%s-%s' % (HEATMAP_ID, version), 'Heatmap',
+        lambda zoom, x, y: render_heatmap_tile(grid, zoom, x, y))
+
+def prune_track_tiles(cache_dir, version):
+    """
+    Remove the tiles of all track sets but the one of 'version' from a
+    file cache directory. Champlain keeps the tiles of every source in a
+    directory named after its id, so without this, every set of tracks
+    that was ever drawn would keep its tiles forever.
+    """
+    keep = '%s-%s' % (SOURCE_ID, version)
+    try:
+        names = os.listdir(cache_dir)
+    except OSError:
+        return
+    for name in names:
+        if name.startswith(SOURCE_ID + '-') and name != keep:
+            shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+
+def tile_source_chain(source, cache_dir=None, cache_size=100):
+    """
+    Return a Champlain.MapSourceChain that serves the tiles of a tile source
+    from a memory cache of cache_size tiles, from a file cache in cache_dir
+    if given, or from the source itself
+    """
+    c = Champlain.MapSourceChain()
+    c.push(source)
+    if cache_dir:
+        c.push(Champlain.FileCache.new_full(1e8, cache_dir, Champlain.ImageRenderer()))
+    c.push(Champlain.MemoryCache.new_full(cache_size, Champlain.ImageRenderer()))
+    return c
@@ -0,0 +1,135 @@
+#   Copyright 2014 Martijn Grendelman <m@rtijn.net>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""timeindex module, defines the TimeIndex class"""
+
+from array import array
+from bisect import bisect_right
+import calendar
+
+class TrackTimes(object):
+    """
+    The timestamps of a single track in ascending order, with a mapping back
+    to the indices of the track points. Points without a timestamp are left
+    out.
+    """
+
+    def __init__(self, tobj):
+        """
+        Collect and sort the valid timestamps of a Track object
+        """
+        self.track = tobj
+        times = tobj.times
+        order = [i for i in xrange(len(times)) if times[i] == times[i]]
+        if any(times[order[k-1]] > times[order[k]] for k in xrange(1, len(order))):
+            # Stable sort, so points with equal timestamps keep their order
+            order.sort(key=lambda i: times[i])
+        self.points = array('l', order)
+        self.times = array('d', (times[i] for i in order))
+        self.start = self.times[0]
+        self.end = self.times[-1]
+
+    def bracket(self, t, lo=0):
+        """
+        Return the indices of the track points immediately before and after
+        the given epoch timestamp, and the relative position of t between
+        them. Searching starts at index lo, for merging sorted queries.
+        """
+        times = self.times
+        i = bisect_right(times, t, lo)
+        if i == len(times):
+            i -= 1
+        h = max(i - 1, 0)
+        span = times[i] - times[h]
+        weight = (t - times[h]) / span if span > 0 else 0.0
+        return (self.points[h], self.points[i], weight, i)
+
+class TimeIndex(object):
+    """
+    A table of time intervals covered by a set of tracks, for finding the
+    track points around a timestamp in logarithmic time. Intervals are
+    grouped by timezone, because the timestamps of images are in local time.
+    When tracks overlap, the track that started last wins, and of tracks
+    starting at the same time, the one that was loaded last.
+    """
+
+    def __init__(self, tracks):
+        """
+        Build the interval tables from a dict of Track objects keyed by tid
+        """
+        zones = {}
+        for tid in sorted(tracks):
+            tobj = tracks[tid]
+            if not any(t == t for t in tobj.times):
+                continue
+            zones.setdefault(tobj.tz.zone, (tobj.tz, []))[1].append(TrackTimes(tobj))
+        self.tables = []
+        for tz, entries in zones.values():
+            # sort() is stable, so the load order is kept for equal starts
+            entries.sort(key=lambda e: e.start)
+            starts = array('d', (e.start for e in entries))
+            maxends = array('d')
+            for e in entries:
+                maxends.append(max(e.end, maxends[-1]) if maxends else e.end)
+            self.tables.append((tz, entries, starts, maxends))
+
+    def find(self, t, table):
+        """
+        Return the TrackTimes entry covering the epoch timestamp t in one of
+        the interval tables, or None
+        """
+        tz, entries, starts, maxends = table
+        i = bisect_right(starts, t) - 1
+        # maxends is non-decreasing, so stop as soon as it drops below t
+        while i >= 0 and maxends[i] >= t:
+            if entries[i].end >= t:
+                return entries[i]
+            i -= 1
+        return None
+
+    def lookup(self, dt):
+        """
+        Find the track points around a naive local datetime. Return a tuple
+        of the Track object, the indices of both points and the relative
+        position of dt between them, or None.
+        """
+        return self.lookup_batch([dt])[0]
+
+    def lookup_batch(self, dts):
+        """
+        Like lookup(), for a list of naive local datetimes at once. Each
+        table is joined with the queries in ascending order of time, so the
+        search within a track continues where the previous query left off.
+        Entries in dts may be None, which never match.
+        """
+        found = [None] * len(dts)
+        for table in self.tables:
+            tz = table[0]
+            queries = []
+            for q, dt in enumerate(dts):
+                if dt is not None:
+                    utc = tz.localize(dt, is_dst=False).utctimetuple()
+                    queries.append((calendar.timegm(utc) + dt.microsecond / 1e6, q))
+            queries.sort()
+            cursors = {}
+            for t, q in queries:
+                entry = self.find(t, table)
+                if entry is None:
+                    continue
+                if found[q] is not None and \
+                        (entry.start, entry.track.tid) <= (found[q][0].start, found[q][0].track.tid):
+                    continue
+                h, i, weight, cursors[entry] = entry.bracket(t, cursors.get(entry, 0))
+                found[q] = (entry, h, i, weight)
+        return [m and (m[0].track, m[1], m[2], m[3]) for m in found]
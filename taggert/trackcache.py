@@ -0,0 +1,278 @@
+#   Copyright 2014 Martijn Grendelman <m@rtijn.net>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""trackcache module, defines the TrackCache class"""
+
+from array import array
+import hashlib
+import mmap
+import os
+import struct
+
+from geodesy import TrackStats
+from lod import TrackPyramid
+from spatialindex import PointGrid
+
+MAGIC = 'TGTC'
+FORMAT = 4
+# magic, format, version key, size, mtime, content hash, validation level,
+# number of tracks
+HEADER = struct.Struct('<4sI20sqd20sII')
+# length of the name, number of points, number of segments, number of
+# levels of the point grid, number of levels of the density grid
+TRACK = struct.Struct('<IIIII')
+# the attributes of a TrackStats object, then its bounding box, NaN if none
+STATS_FIELDS = ('distance', 'duration', 'moving_time', 'max_speed', 'ascent', 'descent')
+STATS = struct.Struct('<10d')
+# level, number of cells and number of indices of a level of a point grid
+GRID_LEVEL = struct.Struct('<iII')
+# level and number of cells of a level of a density grid
+DENSITY_LEVEL = struct.Struct('<iI')
+NAN = float('nan')
+
+def file_hash(filename, blocksize=1 << 20):
+    """
+    Return the SHA-1 digest of a file's contents
+    """
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        block = f.read(blocksize)
+        while block:
+            h.update(block)
+            block = f.read(blocksize)
+    return h.digest()
+
+class TrackCache(object):
+    """
+    An on-disk cache of decoded tracks, with one file for every GPX file,
+    holding the arrays of all its tracks in binary form, along with the
+    weights of their simplification pyramids, their statistics, their
+    point grids and their heatmap cells, so none of those is calculated
+    again. An entry is valid
+    for a GPX file with the same path, size and modification time, or with
+    the same path, size and contents, that was checked at least as
+    strictly as requested: every entry records the validation level of the
+    decoding it holds the result of. All entries are dropped when the
+    version key changes, which should happen whenever the GPX schema or the
+    way tracks are decoded changes. When the cache grows larger than
+    maxsize bytes, the least recently used entries are removed.
+    """
+
+    cache_dir = None
+    maxsize = 256 << 20
+    version_key = None
+
+    def __init__(self, cache_dir, version, maxsize=None):
+        """
+        Initialize the cache in a directory. The version is a string that
+        identifies the schema and parser, its hash is stored in each entry.
+        """
+        self.cache_dir = cache_dir
+        self.version_key = hashlib.sha1(version).digest()
+        if maxsize is not None:
+            self.maxsize = maxsize
+
+    def entry_name(self, filename):
+        """
+        Return the name of the cache file for a GPX file
+        """
+        path = os.path.abspath(filename)
+        if isinstance(path, unicode):
+            path = path.encode('utf-8')
+        key = hashlib.sha1(path).hexdigest()
+        return os.path.join(self.cache_dir, key + '.trk')
+
+    def load(self, filename, factory, level=0):
+        """
+        Return a list of tracks for a GPX file from the cache, or None if
+        there is no valid entry with a validation level of at least 'level'.
+        New track objects are created by calling factory(), and their arrays
+        are filled from the cache file.
+        """
+        entry = self.entry_name(filename)
+        try:
+            st = os.stat(filename)
+            with open(entry, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, IOError, ValueError):
+            return None
+        try:
+            magic, fmt, version_key, size, mtime, digest, entry_level, count = \
+                HEADER.unpack_from(data, 0)
+            if magic != MAGIC or fmt != FORMAT or version_key != self.version_key:
+                self.remove(entry)
+                return None
+            if size != st.st_size or entry_level < level:
+                return None
+            # A file that was touched or copied without changes is still valid
+            touched = mtime != st.st_mtime
+            if touched and digest != file_hash(filename):
+                return None
+            tracks = []
+            pos = HEADER.size
+            for n in xrange(count):
+                namelen, npoints, nsegments, nlevels, ndensity = TRACK.unpack_from(data, pos)
+                pos += TRACK.size
+                tobj = factory()
+                tobj.name = data[pos:pos+namelen].decode('utf-8') or None
+                pos += namelen
+                for column in (tobj.times, tobj.lats, tobj.lons, tobj.eles):
+                    column.fromstring(data[pos:pos + 8 * npoints])
+                    pos += 8 * npoints
+                tobj.elemask.fromstring(data[pos:pos + npoints])
+                pos += npoints
+                tobj.segments.extend(list(array('i', data[pos:pos + 4 * nsegments])))
+                pos += 4 * nsegments
+                tobj.pyramid = TrackPyramid(tobj, array('d', data[pos:pos + 8 * npoints]))
+                pos += 8 * npoints
+                tobj.stats = self.read_stats(data, pos)
+                pos += STATS.size
+                tobj.grid = PointGrid()
+                for l in xrange(nlevels):
+                    level, ncells, nindices = GRID_LEVEL.unpack_from(data, pos)
+                    pos += GRID_LEVEL.size
+                    arrays = []
+                    for typecode, length in (('d', ncells), ('i', ncells + 1),
+                                             ('i', nindices), ('b', ncells)):
+                        end = pos + array(typecode).itemsize * length
+                        arrays.append(array(typecode, data[pos:end]))
+                        pos = end
+                    keys, offsets, indices, flags = arrays
+                    tobj.grid.load(level, keys, offsets, indices, flags)
+                tobj.density = {}
+                for l in xrange(ndensity):
+                    level, ncells = DENSITY_LEVEL.unpack_from(data, pos)
+                    pos += DENSITY_LEVEL.size
+                    arrays = []
+                    for typecode in ('d', 'l'):
+                        end = pos + array(typecode).itemsize * ncells
+                        arrays.append(array(typecode, data[pos:end]))
+                        pos = end
+                    tobj.density[level] = tuple(arrays)
+                tracks.append(tobj)
+        except (struct.error, ValueError):
+            self.remove(entry)
+            return None
+        finally:
+            data.close()
+        if touched:
+            self.store(filename, tracks, digest, entry_level)
+        else:
+            # Mark the entry as recently used
+            os.utime(entry, None)
+        return tracks
+
+    def store(self, filename, tracks, digest=None, level=0):
+        """
+        Write the tracks decoded from a GPX file with a validation level to
+        the cache, and evict old entries if the cache has grown too large.
+        The SHA-1 digest of the file is calculated, unless it is passed in.
+        """
+        try:
+            os.makedirs(self.cache_dir)
+        except OSError as e:
+            if e.errno != 17:
+                return
+        entry = self.entry_name(filename)
+        tmp = entry + '.tmp'
+        try:
+            st = os.stat(filename)
+            with open(tmp, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, FORMAT, self.version_key, st.st_size,
+                    st.st_mtime, digest or file_hash(filename), level, len(tracks)))
+                for tobj in tracks:
+                    name = (tobj.name or u'').encode('utf-8')
+                    grid = tobj.get_grid().dump()
+                    density = tobj.get_density()
+                    f.write(TRACK.pack(len(name), len(tobj), len(tobj.segments), len(grid),
+                                       len(density)))
+                    f.write(name)
+                    for column in (tobj.times, tobj.lats, tobj.lons, tobj.eles, tobj.elemask):
+                        column.tofile(f)
+                    array('i', tobj.segments).tofile(f)
+                    tobj.get_pyramid().weights.tofile(f)
+                    f.write(self.pack_stats(tobj.get_stats()))
+                    for level, keys, offsets, indices, flags in grid:
+                        f.write(GRID_LEVEL.pack(level, len(keys), len(indices)))
+                        for column in (keys, offsets, indices, flags):
+                            column.tofile(f)
+                    for level, (keys, counts) in density.iteritems():
+                        f.write(DENSITY_LEVEL.pack(level, len(keys)))
+                        keys.tofile(f)
+                        counts.tofile(f)
+            os.rename(tmp, entry)
+        except (OSError, IOError):
+            self.remove(tmp)
+            return
+        self.evict()
+
+    def pack_stats(self, stats):
+        """
+        Return a TrackStats object in binary form
+        """
+        return STATS.pack(*[getattr(stats, field) for field in STATS_FIELDS] +
+                          list(stats.bbox or (NAN,) * 4))
+
+    def read_stats(self, data, pos):
+        """
+        Return a TrackStats object read from a buffer at a position
+        """
+        stats = TrackStats()
+        values = STATS.unpack_from(data, pos)
+        for field, value in zip(STATS_FIELDS, values):
+            setattr(stats, field, value)
+        bbox = values[len(STATS_FIELDS):]
+        if bbox[0] == bbox[0]:
+            stats.bbox = bbox
+        return stats
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the total size of the
+        cache is below the maximum
+        """
+        entries = []
+        total = 0
+        for fname in os.listdir(self.cache_dir):
+            if fname.endswith('.trk'):
+                path = os.path.join(self.cache_dir, fname)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    # Removed by another process in the meantime
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        entries.sort()
+        while total > self.maxsize and entries:
+            mtime, size, path = entries.pop(0)
+            self.remove(path)
+            total -= size
+
+    def remove(self, path):
+        """
+        Remove a file from the cache, ignoring errors
+        """
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def clear(self):
+        """
+        Remove all entries from the cache
+        """
+        if os.path.isdir(self.cache_dir):
+            for fname in os.listdir(self.cache_dir):
+                self.remove(os.path.join(self.cache_dir, fname))
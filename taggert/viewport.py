@@ -0,0 +1,131 @@
+#   Copyright 2014 Martijn Grendelman <m@rtijn.net>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""viewport module, defines the Viewport and TrackChunks classes"""
+
+from array import array
+from bisect import bisect_left
+
+from geodesy import bounding_box
+
+CHUNK_SIZE = 256        # number of track points per bounding box
+MARGIN = 0.5            # part of the visible area added on every side
+
+def intersects(box1, box2):
+    """
+    Return True if two bounding boxes, given as (minlat, minlon, maxlat,
+    maxlon) tuples, overlap
+    """
+    return box1[0] <= box2[2] and box2[0] <= box1[2] and \
+           box1[1] <= box2[3] and box2[1] <= box1[3]
+
+def contains(box1, box2):
+    """
+    Return True if bounding box box2 lies completely within box1
+    """
+    return box1[0] <= box2[0] and box1[1] <= box2[1] and \
+           box1[2] >= box2[2] and box1[3] >= box2[3]
+
+class Viewport(object):
+    """
+    The area of the map that tracks and image markers are drawn for: the
+    visible area plus MARGIN on every side. It only moves when the visible
+    area leaves it or the zoom level changes, so small pans don't cause
+    anything to be redrawn.
+    """
+
+    box = None      # (minlat, minlon, maxlat, maxlon), None for everywhere
+    zoom = None
+
+    def update(self, minlat, minlon, maxlat, maxlon, zoom):
+        """
+        Update the viewport for the visible area of the map. Return True if
+        the viewport has moved and things should be redrawn.
+        """
+        visible = (minlat, minlon, maxlat, maxlon)
+        if zoom == self.zoom and self.box is not None and \
+                contains(self.box, visible):
+            return False
+        dlat = (maxlat - minlat) * MARGIN
+        dlon = (maxlon - minlon) * MARGIN
+        self.box = (max(minlat - dlat, -90.0), minlon - dlon,
+                    min(maxlat + dlat, 90.0), maxlon + dlon)
+        self.zoom = zoom
+        return True
+
+    def contains_point(self, lat, lon):
+        """
+        Return True if a point lies within the viewport
+        """
+        box = self.box
+        return box is None or \
+            (box[0] <= lat <= box[2] and box[1] <= lon <= box[3])
+
+class TrackChunks(object):
+    """
+    Bounding boxes of a track as a whole and of every CHUNK_SIZE points of
+    it, used to leave out the parts of a track that lie outside a viewport.
+    """
+
+    bbox = None
+
+    def __init__(self, tobj):
+        """
+        Calculate the bounding boxes of a Track object
+        """
+        lats = tobj.lats
+        lons = tobj.lons
+        self.minlats = array('d')
+        self.minlons = array('d')
+        self.maxlats = array('d')
+        self.maxlons = array('d')
+        for start in xrange(0, len(tobj), CHUNK_SIZE):
+            minlat, minlon, maxlat, maxlon = bounding_box(
+                lats[start:start + CHUNK_SIZE], lons[start:start + CHUNK_SIZE])
+            self.minlats.append(minlat)
+            self.minlons.append(minlon)
+            self.maxlats.append(maxlat)
+            self.maxlons.append(maxlon)
+        if len(tobj):
+            self.bbox = (min(self.minlats), min(self.minlons),
+                         max(self.maxlats), max(self.maxlons))
+
+    def cull(self, indices, box):
+        """
+        Return the indices, out of a sorted sequence of indices of track
+        points, of the points to draw for a viewport. Of chunks outside the
+        viewport only the first and last point are kept: the line between
+        them stays within the chunk's bounding box, so it is not visible,
+        and the visible parts of the track are not connected by lines that
+        cut through the viewport.
+        """
+        if box is None:
+            return indices
+        if self.bbox is None or not intersects(self.bbox, box):
+            return []
+        minlat, minlon, maxlat, maxlon = box
+        result = array('l')
+        lo = 0
+        for c in xrange(len(self.minlats)):
+            hi = bisect_left(indices, (c + 1) * CHUNK_SIZE, lo)
+            if hi > lo:
+                if self.minlats[c] <= maxlat and minlat <= self.maxlats[c] and \
+                   self.minlons[c] <= maxlon and minlon <= self.maxlons[c]:
+                    result.extend(indices[lo:hi])
+                else:
+                    result.append(indices[lo])
+                    if hi - 1 > lo:
+                        result.append(indices[hi - 1])
+            lo = hi
+        return result
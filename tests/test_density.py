@@ -0,0 +1,54 @@
+#   Copyright 2014 Martijn Grendelman <m@rtijn.net>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Tests for the density module"""
+
+import os.path
+import sys
+import unittest
+from math import sin
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'taggert'))
+
+from density import MAX_LEVEL, DensityGrid, MergedLevels, aggregate, bin_points
+
+class DensityGridTest(unittest.TestCase):
+
+    def test_merged_tracks(self):
+        tracks = []
+        for t in xrange(3):
+            # The tracks overlap, so some cells are in more than one
+            lats = [52.0 + t * 0.001 + i * 1e-5 for i in xrange(2000)]
+            lons = [5.0 + sin(i / 100.0) * 1e-3 for i in xrange(2000)]
+            tracks.append((lats, lons))
+        counts = {}
+        for lats, lons in tracks:
+            bin_points(lats, lons, counts)
+        expected = DensityGrid(aggregate(counts))
+        merged = DensityGrid(MergedLevels(aggregate(bin_points(lats, lons))
+                                          for lats, lons in tracks))
+        for level in xrange(MAX_LEVEL + 1):
+            self.assertEqual(merged.levels[level], expected.levels[level])
+            self.assertEqual(merged.max_count(level), expected.max_count(level))
+        self.assertEqual(sum(merged.levels[0][1]), 6000)
+
+    def test_base_grid(self):
+        tracks = DensityGrid(aggregate(bin_points([52.0] * 3, [5.0] * 3)))
+        images = DensityGrid(aggregate(bin_points([52.0, 40.0], [5.0, 5.0])), tracks)
+        self.assertEqual(images.max_count(MAX_LEVEL), 4)
+        self.assertEqual(images.max_count(MAX_LEVEL + 2), 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+#   Copyright 2014 Martijn Grendelman <m@rtijn.net>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Tests for the geodesy module"""
+
+import os.path
+import sys
+import unittest
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'taggert'))
+
+import geodesy
+from geodesy import TrackStats, distance, segment_distances
+
+class Track(object):
+    """
+    The parts of a gpxfile.Track object that TrackStats uses
+    """
+
+    def __init__(self):
+        self.times = array('d')
+        self.lats = array('d')
+        self.lons = array('d')
+        self.eles = array('d')
+        self.elemask = array('b')
+        self.segments = array('l')
+
+    def __len__(self):
+        return len(self.lats)
+
+    def add_segment(self, lat, lon, time, points):
+        """
+        Add a segment going north, 0.001 degree every 10 seconds
+        """
+        self.segments.append(len(self))
+        for i in xrange(points):
+            self.times.append(time + 10.0 * i)
+            self.lats.append(lat + 0.001 * i)
+            self.lons.append(lon)
+            self.eles.append(100.0 + i % 2)
+            self.elemask.append(1)
+
+class GeodesyTest(unittest.TestCase):
+
+    def test_segment_distances(self):
+        lats = array('d', [52.0, 52.0001, 52.0003, 53.0, -30.0])
+        lons = array('d', [5.0, 5.0002, 5.0001, 6.0, 120.0])
+        dists = segment_distances(lats, lons)
+        self.assertEqual(len(dists), 4)
+        for i, d in enumerate(dists):
+            self.assertAlmostEqual(d / distance(lats[i], lons[i], lats[i+1], lons[i+1]),
+                                   1.0, places=4)
+
+    def test_two_segments(self):
+        tobj = Track()
+        tobj.add_segment(52.0, 5.0, 1396094400.0, 11)
+        # An hour later and a degree further east
+        tobj.add_segment(52.0, 6.0, 1396098000.0, 21)
+        stats = TrackStats(tobj)
+        step = geodesy.METERS_PER_DEGREE * 0.001
+        self.assertAlmostEqual(stats.distance, 30 * step, places=6)
+        self.assertAlmostEqual(stats.moving_time, 300.0)
+        self.assertAlmostEqual(stats.avg_speed(), step / 10.0, places=9)
+        self.assertAlmostEqual(stats.max_speed, step / 10.0, places=9)
+        self.assertEqual(stats.duration, 3600.0 + 200.0)
+        self.assertEqual(stats.ascent, 15.0)
+        self.assertEqual(stats.descent, 15.0)
+
+if __name__ == '__main__':
+    unittest.main()
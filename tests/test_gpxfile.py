@@ -0,0 +1,75 @@
+#   Copyright 2014 Martijn Grendelman <m@rtijn.net>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Tests for the gpxfile module"""
+
+import os.path
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'taggert'))
+
+try:
+    import gpxfile
+except ImportError:
+    gpxfile = None      # needs lxml and pytz
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        os.pardir, 'taggert', 'data')
+
+GPX = '''<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" creator="test" xmlns="http://www.topografix.com/GPX/1/1">
+  <trk><trkseg>
+    <trkpt lat="52.0" lon="5.0"><time>2014-03-29T12:00:00Z</time></trkpt>
+    <trkpt lat="52.001" lon="5.0"><time>2014-03-29T12:01:00Z</time></trkpt>
+  </trkseg></trk>
+</gpx>
+'''
+
+@unittest.skipIf(gpxfile is None, "needs lxml and pytz")
+class DecodeWorkerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.directory, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def decode(self, filename):
+        return gpxfile.decode_gpx_worker((DATA_DIR, self.cache_dir,
+            gpxfile.VALIDATION_STRICT, filename, 'UTC'))
+
+    def test_unreadable_files_are_errors(self):
+        valid = os.path.join(self.directory, 'valid.gpx')
+        with open(valid, 'w') as f:
+            f.write(GPX)
+        missing = os.path.join(self.directory, 'missing.gpx')
+        filename, tracks, msg = self.decode(missing)
+        self.assertEqual(filename, missing)
+        self.assertIs(tracks, False)
+        self.assertTrue(msg)
+        # A directory cannot be read as a file either
+        filename, tracks, msg = self.decode(self.directory)
+        self.assertIs(tracks, False)
+        # The worker carries on with other files
+        filename, tracks, msg = self.decode(valid)
+        self.assertEqual(len(tracks), 1)
+        self.assertEqual(len(tracks[0]), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+#   Copyright 2014 Martijn Grendelman <m@rtijn.net>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Tests for the imagecatalog module: lookups"""
+
+from datetime import datetime
+import os.path
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'taggert'))
+
+from imagecatalog import LOOKUP_CHUNK, ImageCatalog
+
+class LookupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.catalog = ImageCatalog(os.path.join(self.directory, 'catalog.db'))
+        self.files = [('IMG_%04d.JPG' % i, 1000 + i, 1396094400.0 + i)
+                      for i in xrange(2 * LOOKUP_CHUNK + 10)]
+        for f in self.files:
+            self.catalog.store('/photos', f, (f[0], 'Camera',
+                datetime(2014, 3, 29, 12, 0, 0), 1, 52.0, 5.0, ''))
+        # An unreadable file and an entry in another directory
+        self.catalog.store('/photos', ('notes.tif', 10, 0.0), None)
+        self.catalog.store('/other', ('IMG_0000.JPG', 5, 0.0), None)
+
+    def tearDown(self):
+        self.catalog.db.close()
+        shutil.rmtree(self.directory)
+
+    def test_lookup_names(self):
+        changed = self.files[::3] + [('notes.tif', 10, 0.0), ('new.jpg', 1, 0.0),
+                                     (self.files[1][0], 1, 0.0)]
+        images, unknown = self.catalog.lookup_names('/photos', changed)
+        self.assertEqual((images, unknown), self.catalog.lookup('/photos', changed))
+        self.assertEqual([image[0] for image in images], [f[0] for f in self.files[::3]])
+        self.assertEqual(images[0][1:], ('Camera', datetime(2014, 3, 29, 12, 0, 0),
+                                         1, 52.0, 5.0, ''))
+        self.assertEqual(unknown, changed[-2:])
+        self.assertEqual(self.catalog.lookup_names('/photos', []), ([], []))
+
+if __name__ == '__main__':
+    unittest.main()
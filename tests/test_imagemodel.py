@@ -0,0 +1,108 @@
+#   Copyright 2014 Martijn Grendelman <m@rtijn.net>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Tests for the imagemodel module and tagging selected images"""
+
+from datetime import datetime
+import os.path
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'taggert'))
+
+try:
+    from gi.repository import Gtk
+    import imagemodel
+    from app import App
+except ImportError:
+    Gtk = None          # needs GTK+ 3 and the other dependencies of Taggert
+
+import constants
+
+cols = constants.images.columns
+
+class Builder(object):
+    """
+    Stands in for the Gtk.Builder of the App, holding just the images list
+    """
+
+    def __init__(self, treeview):
+        self.treeview = treeview
+
+    def get_object(self, name):
+        assert name == 'treeview1'
+        return self.treeview
+
+class Tagger(object):
+    """
+    The parts of the App that the tagging functions use
+    """
+
+    def __init__(self, treeview):
+        self.builder = Builder(treeview)
+        self.modified = {}
+        self.markers = {}
+
+    def move_imagemarker(self, tree_iter, filename, lat, lon):
+        self.markers[filename] = (lat, lon)
+
+    def update_heatmap(self):
+        pass
+
+    def show_infobar(self, text):
+        pass
+
+@unittest.skipIf(Gtk is None, "needs GTK+ 3")
+class UntaggedFilterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.model = imagemodel.ImageListModel(
+            filters={'untagged': imagemodel.is_untagged})
+        dt = datetime(2014, 3, 29, 12, 0, 0)
+        for n in xrange(5):
+            self.model.append('IMG_%04d.JPG' % n, dt, 1, '', '', '', 'Camera')
+        self.signals = []
+        for name in ('row-changed', 'row-deleted', 'row-inserted'):
+            self.model.connect(name, lambda *args, **kw: self.signals.append(kw['name']),
+                               name=name)
+
+    def test_set_emits_one_change(self):
+        it = self.model.get_iter(Gtk.TreePath(2))
+        self.model.set(it, {cols.latitude: '52.50000', cols.longitude: '5.25000',
+                            cols.elevation: '1.00', cols.modified: True})
+        self.assertEqual(self.signals, ['row-changed'])
+        self.assertTrue(self.model.is_shown(it))
+        self.assertEqual(self.model.get_location(it), (52.5, 5.25))
+
+    def test_tag_selected_keeps_selection(self):
+        treeview = Gtk.TreeView(model=self.model)
+        selection = treeview.get_selection()
+        selection.set_mode(Gtk.SelectionMode.MULTIPLE)
+        selection.select_path(Gtk.TreePath(1))
+        selection.select_path(Gtk.TreePath(3))
+        tagger = Tagger(treeview)
+        App.tag_selected.__func__(tagger, 52.5, 5.25, 1.0)
+        self.assertNotIn('row-deleted', self.signals)
+        model, pathlist = selection.get_selected_rows()
+        self.assertEqual([p.get_indices()[0] for p in pathlist], [1, 3])
+        for p in pathlist:
+            row = model[model.get_iter(p)]
+            self.assertEqual((row[cols.latitude], row[cols.longitude]),
+                             ('52.50000', '5.25000'))
+            self.assertTrue(row[cols.modified])
+        self.assertEqual(sorted(tagger.modified), ['IMG_0001.JPG', 'IMG_0003.JPG'])
+
+if __name__ == '__main__':
+    unittest.main()
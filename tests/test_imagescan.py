@@ -0,0 +1,119 @@
+#   Copyright 2014 Martijn Grendelman <m@rtijn.net>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Tests for the imagescan and imagecatalog modules: XMP sidecars"""
+
+import os.path
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'taggert'))
+
+import imagecatalog
+try:
+    import imagescan
+    from gi.repository import GExiv2
+except ImportError:
+    imagescan = None    # needs GExiv2
+
+def segment(marker, data):
+    """
+    Return a JPEG marker segment
+    """
+    return '\xff' + marker + struct.pack('>H', len(data) + 2) + data
+
+# A 1x1 grayscale JPEG, just enough for Exiv2 to add metadata to
+JPEG = '\xff\xd8' + \
+    segment('\xe0', 'JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00') + \
+    segment('\xdb', '\x00' + '\x01' * 64) + \
+    segment('\xc0', '\x08\x00\x01\x00\x01\x01\x01\x11\x00') + \
+    segment('\xc4', '\x00' + '\x01' + '\x00' * 15 + '\x00') + \
+    segment('\xda', '\x01\x01\x00\x00\x3f\x00') + '\x00\xff\xd9'
+
+class SidecarNamesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def touch(self, name):
+        path = os.path.join(self.directory, name)
+        open(path, 'wb').close()
+        return path
+
+    def test_lightroom_sidecar_belongs_to_raw_file(self):
+        raw = self.touch('IMG_0001.CR2')
+        jpeg = self.touch('IMG_0001.JPG')
+        sidecar = self.touch('IMG_0001.xmp')
+        self.assertEqual(imagecatalog.find_sidecar(raw), sidecar)
+        self.assertIsNone(imagecatalog.find_sidecar(jpeg))
+
+    def test_darktable_sidecar(self):
+        jpeg = self.touch('IMG_0002.JPG')
+        sidecar = self.touch('IMG_0002.JPG.xmp')
+        self.assertEqual(imagecatalog.find_sidecar(jpeg), sidecar)
+        names = set(os.listdir(self.directory))
+        self.assertEqual(imagecatalog.find_sidecar(jpeg, names), sidecar)
+
+@unittest.skipIf(imagescan is None, "needs GExiv2")
+class WriteLocationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.jpeg = os.path.join(self.directory, 'IMG_0001.JPG')
+        with open(self.jpeg, 'wb') as f:
+            f.write(JPEG)
+        metadata = GExiv2.Metadata(self.jpeg)
+        metadata.set_tag_string('Exif.Image.DateTime', '2014:03:29 12:00:00')
+        metadata.save_file()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def location(self):
+        return tuple(imagescan.read_metadata(self.jpeg)[4:6])
+
+    def test_image_mode_updates_sidecar(self):
+        self.assertIsNone(imagescan.write_location(
+            (self.jpeg, (52.5, 5.25, 1.0), imagescan.WRITE_DARKTABLE)))
+        self.assertTrue(os.path.isfile(self.jpeg + '.xmp'))
+        self.assertEqual(self.location(), (52.5, 5.25))
+        # Deleting the tag in image mode must not leave it in the sidecar
+        self.assertIsNone(imagescan.write_location(
+            (self.jpeg, None, imagescan.WRITE_IMAGE)))
+        self.assertEqual(self.location(), ('', ''))
+        self.assertIsNone(imagescan.write_location(
+            (self.jpeg, (51.5, -0.125, 1.0), imagescan.WRITE_IMAGE)))
+        self.assertEqual(self.location(), (51.5, -0.125))
+        self.assertEqual(imagescan.read_sidecar_location(self.jpeg + '.xmp')[:2],
+                         (51.5, -0.125))
+
+    def test_lightroom_mode_embeds_xmp_in_jpeg(self):
+        raw = os.path.join(self.directory, 'IMG_0001.CR2')
+        open(raw, 'wb').close()
+        self.assertIsNone(imagescan.write_location(
+            (self.jpeg, (52.5, 5.25, 1.0), imagescan.WRITE_LIGHTROOM)))
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'IMG_0001.xmp')))
+        self.assertIsNone(imagecatalog.find_sidecar(raw))
+        self.assertEqual(self.location(), (52.5, 5.25))
+        self.assertIn('Xmp.exif.GPSLatitude', GExiv2.Metadata(self.jpeg).get_tags())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#   Copyright 2014 Martijn Grendelman <m@rtijn.net>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Tests for the spatialindex module"""
+
+import os.path
+import random
+import sys
+import unittest
+from array import array
+from math import cos, degrees, hypot, radians
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'taggert'))
+
+import spatialindex
+from spatialindex import PointGrid, SpatialIndex, CAPACITY
+from viewport import TrackChunks
+
+class Points(object):
+    """
+    The parts of a Track object that the spatial index uses
+    """
+
+    def __init__(self, lats, lons):
+        self.lats = array('d', lats)
+        self.lons = array('d', lons)
+        self.grid = PointGrid(self)
+        self.chunks = TrackChunks(self)
+
+    def __len__(self):
+        return len(self.lats)
+
+    def get_grid(self):
+        return self.grid
+
+    def get_chunks(self):
+        return self.chunks
+
+def meters(tobj, i, lat, lon):
+    """
+    Return the distance in meters from a track point to a location
+    """
+    return hypot(tobj.lats[i] - lat, (tobj.lons[i] - lon) * cos(radians(lat))) \
+        * spatialindex.METERS_PER_DEGREE
+
+class SpatialIndexTest(unittest.TestCase):
+
+    def test_nearest_on_track(self):
+        # A track going east, one point every 0.0001 degree
+        tobj = Points([52.0] * 1000, [5.0 + i * 0.0001 for i in xrange(1000)])
+        index = SpatialIndex({1: tobj})
+        self.assertEqual(index.nearest(52.00001, 5.03002, 50), (tobj, 300))
+        self.assertIsNone(index.nearest(52.01, 5.03, 50))
+
+    def test_dense_cluster(self):
+        # A stationary logger: 200000 points within a few meters
+        rnd = random.Random(1)
+        n = 200000
+        tobj = Points([52.0 + rnd.gauss(0, 3e-5) for i in xrange(n)],
+                      [5.0 + rnd.gauss(0, 5e-5) for i in xrange(n)])
+        index = SpatialIndex({1: tobj})
+        for radius in (1, 5, 20, 200, 2000):
+            for q in xrange(10):
+                lat = 52.0 + rnd.gauss(0, 6e-5)
+                lon = 5.0 + rnd.gauss(0, 1e-4)
+                dlat = degrees(float(radius) / spatialindex.RADIUS)
+                dlon = dlat / cos(radians(lat))
+                level = -spatialindex.FINE_LEVELS
+                while spatialindex.cell_size(level) < dlat:
+                    level += 1
+                box = (lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+                scanned = sum(len(b) for b in tobj.grid.buckets(level, box))
+                self.assertLessEqual(scanned, 16 * CAPACITY)
+                best = min(meters(tobj, i, lat, lon) for i in xrange(0, n, 50))
+                found = index.nearest(lat, lon, radius)
+                if best <= radius * 0.8:
+                    self.assertIsNotNone(found)
+                if found is not None:
+                    self.assertLessEqual(meters(tobj, found[1], lat, lon),
+                                         best + radius * 0.2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+#   Copyright 2014 Martijn Grendelman <m@rtijn.net>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Tests for the trackcache module"""
+
+import os.path
+import shutil
+import sys
+import tempfile
+import unittest
+from array import array
+from math import sin
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'taggert'))
+
+from density import aggregate, bin_points
+from geodesy import TrackStats
+from lod import TrackPyramid
+from spatialindex import PointGrid
+from trackcache import TrackCache
+
+class Track(object):
+    """
+    The parts of a gpxfile.Track object that the track cache uses
+    """
+    name = None
+    pyramid = stats = grid = density = None
+
+    def __init__(self):
+        self.times = array('d')
+        self.lats = array('d')
+        self.lons = array('d')
+        self.eles = array('d')
+        self.elemask = array('b')
+        self.segments = array('l')
+
+    def __len__(self):
+        return len(self.lats)
+
+    def get_segments(self):
+        bounds = list(self.segments) + [len(self)]
+        return zip(bounds[:-1], bounds[1:])
+
+    def get_pyramid(self):
+        if self.pyramid is None:
+            self.pyramid = TrackPyramid(self)
+        return self.pyramid
+
+    def get_stats(self):
+        if self.stats is None:
+            self.stats = TrackStats(self)
+        return self.stats
+
+    def get_grid(self):
+        if self.grid is None:
+            self.grid = PointGrid(self)
+        return self.grid
+
+    def get_density(self):
+        if self.density is None:
+            self.density = aggregate(bin_points(self.lats, self.lons))
+        return self.density
+
+class TrackCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.gpx = os.path.join(self.directory, 'track.gpx')
+        with open(self.gpx, 'w') as f:
+            f.write('<gpx/>')
+        self.cache = TrackCache(os.path.join(self.directory, 'cache'), 'test')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_derived_data_is_cached(self):
+        tobj = Track()
+        tobj.name = u'Test'
+        for i in xrange(5000):
+            tobj.times.append(1396094400.0 + i)
+            tobj.lats.append(52.0 + i * 1e-5)
+            tobj.lons.append(5.0 + sin(i / 100.0) * 1e-3)
+            tobj.eles.append(i % 7)
+            tobj.elemask.append(1)
+        tobj.segments.extend([0, 2500])
+        self.cache.store(self.gpx, [tobj], level=1)
+        self.assertIsNone(self.cache.load(self.gpx, Track, 2))
+        loaded, = self.cache.load(self.gpx, Track, 1)
+        self.assertEqual(loaded.name, u'Test')
+        self.assertEqual(loaded.lats, tobj.lats)
+        self.assertEqual(list(loaded.segments), [0, 2500])
+        # Nothing is calculated again
+        self.assertEqual(loaded.pyramid.weights, tobj.pyramid.weights)
+        self.assertEqual(loaded.grid.dump(), tobj.grid.dump())
+        self.assertEqual(loaded.density, tobj.density)
+        for field in ('distance', 'duration', 'moving_time', 'max_speed',
+                      'ascent', 'descent', 'bbox'):
+            self.assertEqual(getattr(loaded.stats, field), getattr(tobj.stats, field))
+
+if __name__ == '__main__':
+    unittest.main()